@@ -0,0 +1,138 @@
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows (entorno local)
+    fcntl = None
+
+
+# ---------------------------------------------------
+# CACHÉ DE ARCHIVOS GENERADOS (por versión de catálogo)
+# ---------------------------------------------------
+# Cada artefacto vive en <base>/<namespace>/<grupo>/<nombre>. El grupo suele
+# ser el id de la empresa y el nombre incluye la versión del catálogo, así que
+# una versión nueva nunca pisa a la anterior mientras alguien la descarga.
+# Las construcciones concurrentes de la misma clave esperan a una sola
+# (lock por clave dentro del worker + flock entre workers de gunicorn).
+
+class ArtifactCache:
+    def __init__(self, base_dir: Path):
+        self.base_dir = Path(base_dir)
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._stats_guard = threading.Lock()
+        self.stats: dict[str, dict[str, int]] = {}
+
+    def path_for(self, namespace: str, group: str | int, name: str) -> Path:
+        return self.base_dir / namespace / str(group) / name
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def _count(self, namespace: str, outcome: str):
+        with self._stats_guard:
+            ns_stats = self.stats.setdefault(namespace, {"hits": 0, "misses": 0})
+            ns_stats[outcome] += 1
+
+    def get(self, namespace: str, group: str | int, name: str) -> Path | None:
+        path = self.path_for(namespace, group, name)
+        if path.exists():
+            self._count(namespace, "hits")
+            return path
+        return None
+
+    def get_or_build(
+        self,
+        namespace: str,
+        group: str | int,
+        name: str,
+        builder: Callable[[Path], None],
+        prune_siblings: bool = False,
+    ) -> Path:
+        path = self.path_for(namespace, group, name)
+        if path.exists():
+            self._count(namespace, "hits")
+            return path
+
+        with self._key_lock(str(path)):
+            if path.exists():
+                self._count(namespace, "hits")
+                return path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path.parent / f".{name}.lock", "w") as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    if path.exists():
+                        self._count(namespace, "hits")
+                        return path
+                    self._count(namespace, "misses")
+                    tmp_path = path.parent / f".{name}.{uuid.uuid4().hex}.tmp"
+                    try:
+                        builder(tmp_path)
+                        os.replace(tmp_path, path)
+                    finally:
+                        if tmp_path.exists():
+                            tmp_path.unlink()
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        if prune_siblings:
+            self._prune_siblings(path)
+        return path
+
+    def store(self, namespace: str, group: str | int, name: str, data: bytes) -> Path:
+        def write(tmp_path: Path):
+            tmp_path.write_bytes(data)
+        return self.get_or_build(namespace, group, name, write)
+
+    def _prune_siblings(self, keep: Path):
+        # borra versiones viejas del mismo tipo de archivo en el grupo
+        keep_lock = f".{keep.name}.lock"
+        for sibling in keep.parent.iterdir():
+            if sibling == keep or sibling.name == keep_lock:
+                continue
+            stale_lock = sibling.name.startswith(".") and sibling.name.endswith(f"{''.join(keep.suffixes)}.lock")
+            if stale_lock or (sibling.is_file() and not sibling.name.startswith(".") and sibling.suffixes == keep.suffixes):
+                try:
+                    sibling.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def prune_versions(self, namespace: str, group: str | int, keep_version: int):
+        """
+        Para namespaces agrupados como <grupo>/v<versión>/: borra las carpetas de
+        versiones anteriores a keep_version (y archivos sueltos de formatos viejos).
+        """
+        group_dir = self.base_dir / namespace / str(group)
+        if not group_dir.is_dir():
+            return
+        for entry in group_dir.iterdir():
+            if entry.is_dir():
+                version = entry.name[1:]
+                if entry.name.startswith("v") and version.isdigit() and int(version) >= keep_version:
+                    continue
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                try:
+                    entry.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def purge_group(self, group: str | int):
+        if not self.base_dir.exists():
+            return
+        for namespace_dir in self.base_dir.iterdir():
+            group_dir = namespace_dir / str(group)
+            if group_dir.is_dir():
+                shutil.rmtree(group_dir, ignore_errors=True)
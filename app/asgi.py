@@ -0,0 +1,11 @@
+# ---------------------------------------------------
+# UTILIDADES ASGI COMPARTIDAS POR LOS MIDDLEWARES
+# ---------------------------------------------------
+def route_label(scope) -> str:
+    # plantilla de la ruta (no el path concreto) para no abrir una clave por slug
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    if scope.get("root_path"):
+        return f"{scope['root_path']}/{{path}}"
+    return "<sin ruta>"
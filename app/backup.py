@@ -0,0 +1,109 @@
+import io
+import json
+from typing import IO, Iterator
+
+
+# ---------------------------------------------------
+# LECTURA INCREMENTAL DE empresa.json
+# ---------------------------------------------------
+# Los backups pueden traer decenas de miles de productos: en lugar de
+# json.loads() sobre el archivo completo, se recorre el objeto raíz por
+# claves y los arrays indicados se entregan elemento por elemento.
+
+_JSON_WHITESPACE = " \t\r\n"
+
+
+class JsonStreamReader:
+    def __init__(self, stream: IO[str], chunk_size: int = 64 * 1024):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _JSON_WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON inválido: se esperaba '{char}' y se encontró '{found or 'EOF'}'")
+        self._pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+                # Un número al final del buffer podría estar cortado: solo se
+                # acepta si hay más texto detrás o si ya no queda nada por leer.
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def iter_array(self) -> Iterator:
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self._pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def iter_json_object_sections(stream: IO[str], stream_keys: set[str] | None = None):
+    """
+    Recorre el objeto JSON raíz devolviendo (clave, valor).
+    Para las claves de `stream_keys` cuyo valor es un array, el valor es un
+    iterador perezoso; si no se consume, se descarta al avanzar a la siguiente clave.
+    """
+    stream_keys = stream_keys or set()
+    reader = JsonStreamReader(stream)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key in stream_keys and reader.peek() == "[":
+            items = reader.iter_array()
+            yield key, items
+            for _ in items:
+                pass
+        else:
+            yield key, reader.value()
+        if reader.peek() == ",":
+            reader.expect(",")
+            continue
+        reader.expect("}")
+        return
+
+
+def open_zip_json_text(zip_ref, member_name: str) -> IO[str]:
+    return io.TextIOWrapper(zip_ref.open(member_name, "r"), encoding="utf-8")
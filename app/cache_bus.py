@@ -0,0 +1,265 @@
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, select as sa_select, text
+
+from app import models
+from app.metrics import metrics
+
+
+# ---------------------------------------------------
+# CACHÉ EN MEMORIA POR EMPRESA E INVALIDACIÓN ENTRE WORKERS
+# ---------------------------------------------------
+# gunicorn levanta varios workers y cada uno tiene su propio TenantCache.
+# bump_catalogo_version publica (empresa_id, versión) con pg_notify dentro de
+# la misma transacción: Postgres lo entrega recién en el commit, y nunca si
+# hay rollback. Cada worker escucha el canal con LISTEN en un hilo propio y
+# descarta las entradas de esa empresa. En el worker que hizo el cambio se
+# descartan en el after_commit de la sesión, sin esperar la notificación.
+#
+# Sin LISTEN (SQLite, o si la conexión falla) se consulta catalogo_version de
+# las empresas cacheadas cada CACHE_BUS_POLL_SECONDS. Con LISTEN activo igual
+# se hace ese chequeo cada CACHE_BUS_RESYNC_SECONDS y tras cada reconexión,
+# por las notificaciones que se pierden mientras no hay conexión.
+
+CACHE_BUS_ENABLED = os.getenv("CACHE_BUS_ENABLED", "1").strip().lower() not in {"0", "false", "no"}
+CACHE_BUS_CHANNEL = os.getenv("CACHE_BUS_CHANNEL", "catalogo_cache").strip() or "catalogo_cache"
+CACHE_BUS_POLL_SECONDS = max(float(os.getenv("CACHE_BUS_POLL_SECONDS", "5")), 0.5)
+CACHE_BUS_RESYNC_SECONDS = max(float(os.getenv("CACHE_BUS_RESYNC_SECONDS", "60")), CACHE_BUS_POLL_SECONDS)
+TENANT_CACHE_MAX_ENTRIES = max(int(os.getenv("TENANT_CACHE_MAX_ENTRIES", "2000")), 1)
+
+cache_bus_invalidations = metrics.counter(
+    "catalogo_cache_bus_invalidations", "Empresas descartadas del caché en memoria, por origen.", ("source",)
+)
+
+
+class TenantCache:
+    """
+    Valores derivados de los datos de una empresa (LRU acotado). Cada entrada
+    guarda la catalogo_version con la que se calculó; nunca se guarda una
+    versión más vieja que la última que anunció el bus para esa empresa.
+    """
+
+    def __init__(self, max_entries: int = TENANT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[int, object]] = OrderedDict()
+        self._latest: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, empresa_id: int, key: str):
+        with self._lock:
+            entry = self._entries.get((empresa_id, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((empresa_id, key))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, empresa_id: int, key: str, version: int, value):
+        with self._lock:
+            if version < self._latest.get(empresa_id, 0):
+                return
+            self._entries[(empresa_id, key)] = (version, value)
+            self._entries.move_to_end((empresa_id, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, empresa_id: int, version: int | None = None) -> bool:
+        """Descarta las entradas de la empresa anteriores a `version` (todas si es None)."""
+        with self._lock:
+            if version is not None:
+                self._latest[empresa_id] = max(version, self._latest.get(empresa_id, 0))
+            stale = [
+                cache_key for cache_key, (entry_version, _) in self._entries.items()
+                if cache_key[0] == empresa_id and (version is None or entry_version < version)
+            ]
+            for cache_key in stale:
+                del self._entries[cache_key]
+            return bool(stale)
+
+    def latest_version(self, empresa_id: int) -> int:
+        """Última versión anunciada por el bus para la empresa (0 si no hubo)."""
+        with self._lock:
+            return self._latest.get(empresa_id, 0)
+
+    def cached_versions(self) -> dict[int, int]:
+        """Versión más vieja en caché por empresa (la que decide si hay que descartar)."""
+        with self._lock:
+            versions: dict[int, int] = {}
+            for (empresa_id, _), (entry_version, _) in self._entries.items():
+                versions[empresa_id] = min(entry_version, versions.get(empresa_id, entry_version))
+            return versions
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+tenant_cache = TenantCache()
+
+
+# ---------------------------------------------------
+# BUS: PUBLICACIÓN, LISTEN Y POLLING
+# ---------------------------------------------------
+class CacheBus:
+    def __init__(self, cache: TenantCache, channel: str = CACHE_BUS_CHANNEL):
+        self.cache = cache
+        self.channel = channel
+        self.engine = None
+        self.mode = "apagado"
+        self._stop = threading.Event()
+        self._thread = None
+        self._listen_connection = None
+
+    def install(self, engine, session_factory):
+        """Conecta el bus al engine y descarta lo local en el after_commit de cada sesión."""
+        self.engine = engine
+
+        @event.listens_for(session_factory, "after_commit")
+        def _after_commit(session):
+            for empresa_id, version in session.info.pop("cache_bus_pending", {}).items():
+                if self.cache.invalidate(empresa_id, version):
+                    cache_bus_invalidations.inc(source="local")
+
+        @event.listens_for(session_factory, "after_rollback")
+        def _after_rollback(session):
+            session.info.pop("cache_bus_pending", None)
+
+    @property
+    def uses_listen(self) -> bool:
+        return self.engine is not None and self.engine.dialect.name == "postgresql"
+
+    def publish(self, db, empresa_id: int, version: int):
+        """Anuncia la versión nueva; se entrega a los demás workers con el commit de `db`."""
+        db.info.setdefault("cache_bus_pending", {})[empresa_id] = version
+        if CACHE_BUS_ENABLED and self.uses_listen:
+            db.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": self.channel, "payload": f"{empresa_id}:{version}"},
+            )
+
+    def start(self):
+        if not CACHE_BUS_ENABLED or self.engine is None or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        connection = self._listen_connection
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    # --- hilo de fondo ---
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            if self.uses_listen:
+                try:
+                    self._listen()
+                    backoff = 1.0
+                except Exception as exc:
+                    print("[cache_bus] LISTEN no disponible, polling hasta reconectar:", repr(exc))
+            # sin LISTEN (o mientras se reconecta): polling de versiones
+            self.mode = "polling"
+            deadline = time.monotonic() + (backoff if self.uses_listen else CACHE_BUS_RESYNC_SECONDS)
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                self._poll_versions()
+                self._stop.wait(CACHE_BUS_POLL_SECONDS)
+            backoff = min(backoff * 2, 60.0)
+
+    def _listen(self):
+        fairy = self.engine.raw_connection()
+        # conexión propia, fuera del pool: queda tomada mientras el worker viva
+        fairy.detach()
+        connection = fairy.dbapi_connection
+        self._listen_connection = connection
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            self.mode = "listen"
+            print("[cache_bus] escuchando canal", self.channel)
+            # lo que cambió antes del LISTEN (o durante una desconexión)
+            self._poll_versions()
+            last_resync = time.monotonic()
+            while not self._stop.is_set():
+                ready, _, _ = select.select([connection], [], [], CACHE_BUS_POLL_SECONDS)
+                if ready:
+                    connection.poll()
+                    while connection.notifies:
+                        self._handle_payload(connection.notifies.pop(0).payload)
+                if time.monotonic() - last_resync >= CACHE_BUS_RESYNC_SECONDS:
+                    self._poll_versions()
+                    last_resync = time.monotonic()
+        finally:
+            self._listen_connection = None
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _handle_payload(self, payload: str):
+        try:
+            empresa_id, version = (int(part) for part in payload.split(":", 1))
+        except ValueError:
+            return
+        if self.cache.invalidate(empresa_id, version):
+            cache_bus_invalidations.inc(source="notify")
+
+    def _poll_versions(self):
+        cached = self.cache.cached_versions()
+        if not cached:
+            return
+        try:
+            with self.engine.connect() as connection:
+                rows = connection.execute(
+                    sa_select(models.Empresa.id, models.Empresa.catalogo_version)
+                    .where(models.Empresa.id.in_(list(cached)))
+                ).all()
+        except Exception as exc:
+            print("[cache_bus] polling de versiones falló:", repr(exc))
+            return
+        current = {empresa_id: version or 1 for empresa_id, version in rows}
+        for empresa_id, cached_version in cached.items():
+            version = current.get(empresa_id)
+            if version is None:
+                # empresa borrada
+                if self.cache.invalidate(empresa_id):
+                    cache_bus_invalidations.inc(source="poll")
+            elif version > cached_version and self.cache.invalidate(empresa_id, version):
+                cache_bus_invalidations.inc(source="poll")
+
+    def snapshot(self) -> dict:
+        return {"mode": self.mode, "channel": self.channel, **self.cache.snapshot()}
+
+
+cache_bus = CacheBus(tenant_cache)
+
+
+def collect_cache_bus():
+    stats = cache_bus.snapshot()
+    return [
+        ("catalogo_tenant_cache_entries", "gauge", "Entradas en el caché en memoria por empresa.", [({}, stats["entries"])]),
+        ("catalogo_tenant_cache_hits", "counter", "Aciertos del caché en memoria por empresa.", [({}, stats["hits"])]),
+        ("catalogo_tenant_cache_misses", "counter", "Fallos del caché en memoria por empresa.", [({}, stats["misses"])]),
+        ("catalogo_cache_bus_listening", "gauge", "1 si el worker recibe invalidaciones por LISTEN.", [
+            ({}, 1 if stats["mode"] == "listen" else 0)
+        ]),
+    ]
+
+
+metrics.add_collector(collect_cache_bus)
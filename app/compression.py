@@ -0,0 +1,253 @@
+import gzip
+import os
+import shutil
+import threading
+import zlib
+from pathlib import Path
+
+from app.asgi import route_label
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# ---------------------------------------------------
+# NEGOCIACIÓN DE Accept-Encoding
+# ---------------------------------------------------
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+COMPRESSION_CHUNK_SIZE = 64 * 1024
+
+
+def supported_encodings() -> list[str]:
+    # orden de preferencia del servidor
+    return ["br", "gzip"] if brotli else ["gzip"]
+
+
+def parse_accept_encoding(header: str | None) -> dict[str, float]:
+    accepted = {}
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+    return accepted
+
+
+def choose_encoding(header: str | None, available: list[str] | None = None) -> str | None:
+    accepted = parse_accept_encoding(header)
+    best = None
+    best_quality = 0.0
+    for encoding in available if available is not None else supported_encodings():
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def gzip_file(source: Path, target: Path):
+    with open(source, "rb") as src, gzip.GzipFile(target, "wb", compresslevel=GZIP_LEVEL, mtime=0) as dst:
+        shutil.copyfileobj(src, dst, COMPRESSION_CHUNK_SIZE)
+
+
+def brotli_file(source: Path, target: Path):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        while True:
+            chunk = src.read(COMPRESSION_CHUNK_SIZE)
+            if not chunk:
+                break
+            dst.write(compressor.process(chunk))
+        dst.write(compressor.finish())
+
+
+# ---------------------------------------------------
+# MIDDLEWARE DE COMPRESIÓN DE RESPUESTAS
+# ---------------------------------------------------
+# Comprime al vuelo HTML/JSON/JS/CSS según Accept-Encoding. Las respuestas
+# chicas, las que ya traen Content-Encoding (p. ej. lista_precios.json
+# precomprimido) y los formatos que ya vienen comprimidos pasan sin tocar.
+# Las respuestas en streaming se comprimen por chunk con flush, así el
+# cliente sigue recibiendo datos a medida que se generan.
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# niveles para compresión en línea: priorizan CPU sobre el último byte
+DYNAMIC_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+DYNAMIC_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+SKIP_CONTENT_TYPE_PREFIXES = ("image/", "video/", "audio/", "font/woff")
+SKIP_CONTENT_TYPES = {
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/pdf",
+    "application/octet-stream",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "text/event-stream",
+}
+
+
+def is_compressible_content_type(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if not media_type:
+        return False
+    if media_type in SKIP_CONTENT_TYPES or media_type.startswith(SKIP_CONTENT_TYPE_PREFIXES):
+        # svg es texto aunque sea image/*
+        return media_type == "image/svg+xml"
+    return True
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=DYNAMIC_BROTLI_QUALITY)
+        else:
+            # wbits=31: formato gzip (encabezado + crc)
+            self._compressor = zlib.compressobj(DYNAMIC_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            return out + (self._compressor.finish() if final else self._compressor.flush())
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes: dict[str, dict[str, int]] = {}
+
+    def record(self, route: str, encoding: str | None, bytes_in: int, bytes_out: int):
+        with self._lock:
+            stats = self.routes.setdefault(
+                route,
+                {"responses": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0, "br": 0, "gzip": 0},
+            )
+            stats["responses"] += 1
+            stats["bytes_in"] += bytes_in
+            stats["bytes_out"] += bytes_out
+            if encoding:
+                stats["compressed"] += 1
+                stats[encoding] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routes = {route: dict(stats) for route, stats in self.routes.items()}
+        for stats in routes.values():
+            stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+            stats["ratio"] = round(stats["bytes_out"] / stats["bytes_in"], 3) if stats["bytes_in"] else None
+        return {
+            "min_size": COMPRESSION_MIN_SIZE,
+            "encodings": supported_encodings(),
+            "bytes_saved": sum(stats["bytes_saved"] for stats in routes.values()),
+            "routes": dict(sorted(routes.items(), key=lambda item: item[1]["bytes_saved"], reverse=True)),
+        }
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, stats: CompressionStats = compression_stats):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict((key.lower(), value) for key, value in scope.get("headers", []))
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if scope.get("method") == "HEAD":
+            encoding = None
+
+        start_message = None
+        compressor = None
+        passthrough = False
+        bytes_in = 0
+        bytes_out = 0
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough, bytes_in, bytes_out
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                response_headers = {key.lower(): value for key, value in message.get("headers", [])}
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = (
+                    encoding is None
+                    or message["status"] < 200
+                    or message["status"] in (204, 304)
+                    or b"content-encoding" in response_headers
+                    or not is_compressible_content_type(content_type)
+                )
+                if passthrough:
+                    await send(message)
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            bytes_in += len(body)
+
+            if passthrough:
+                bytes_out += len(body)
+                await send(message)
+                return
+
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    bytes_out += len(body)
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _StreamCompressor(encoding)
+                start_message["headers"] = _compressed_headers(start_message.get("headers", []), encoding)
+                await send(start_message)
+
+            chunk = compressor.compress(body, final=not more_body)
+            bytes_out += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+        if start_message is not None:
+            self.stats.record(route_label(scope), None if passthrough else encoding, bytes_in, bytes_out)
+
+
+def _compressed_headers(raw_headers, encoding: str) -> list:
+    headers = []
+    vary_values = []
+    for key, value in raw_headers:
+        name = key.lower()
+        if name == b"content-length":
+            continue
+        if name == b"vary":
+            vary_values.append(value.decode("latin-1"))
+            continue
+        if name == b"etag" and not value.startswith(b"W/"):
+            # el cuerpo comprimido ya no es byte a byte el original
+            value = b"W/" + value
+        headers.append((key, value))
+    if not any(v.strip().lower() in ("accept-encoding", "*") for vary in vary_values for v in vary.split(",")):
+        vary_values.append("Accept-Encoding")
+    headers.append((b"vary", ", ".join(vary_values).encode("latin-1")))
+    headers.append((b"content-encoding", encoding.encode("latin-1")))
+    return headers
@@ -1,17 +1,65 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, event, Delete, Insert, Update
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker, declarative_base, Session
+from sqlalchemy.sql.elements import TextClause
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "").strip() or None
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    connect_args={
-        "sslmode": "require"
+# ---------------------------------------------------
+# CONFIGURACIÓN DEL ENGINE (por variables de entorno)
+# ---------------------------------------------------
+# Los valores por defecto reproducen lo que había (pool de SQLAlchemy,
+# pre_ping, recycle 300s, sslmode=require). DATABASE_URL=sqlite:///... activa
+# el modo local para desarrollo y benchmarks, sin SSL ni statement_timeout.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# pool propio del engine async (ver ENGINE ASYNC más abajo)
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "3"))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+DB_SSLMODE = os.getenv("DB_SSLMODE", "require").strip()
+DB_STREAM_BATCH_SIZE = int(os.getenv("DB_STREAM_BATCH_SIZE", "1000"))
+
+IS_SQLITE = (DATABASE_URL or "").startswith("sqlite")
+
+
+def build_engine_kwargs() -> dict:
+    if IS_SQLITE:
+        # los endpoints sync corren en el threadpool: la conexión cambia de hilo
+        return {"connect_args": {"check_same_thread": False}}
+
+    connect_args = {}
+    if DB_SSLMODE:
+        connect_args["sslmode"] = DB_SSLMODE
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    return {
+        "pool_pre_ping": True,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "connect_args": connect_args,
     }
-)
+
+
+def _sqlite_pragmas(dbapi_connection, _record):
+    cursor = dbapi_connection.cursor()
+    # WAL: lectores y el escritor no se bloquean entre sí (load tests)
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **build_engine_kwargs())
+
+if IS_SQLITE:
+    event.listen(engine, "connect", _sqlite_pragmas)
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -19,5 +67,135 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+
+# ---------------------------------------------------
+# RÉPLICA DE LECTURA (opcional)
+# ---------------------------------------------------
+# Con DATABASE_REPLICA_URL, ReadSessionLocal manda los SELECT a la réplica y
+# todo lo que escribe (flush, INSERT/UPDATE/DELETE, SQL en texto) al primario.
+# Desde la primera escritura la sesión queda en el primario: lo que lee
+# después incluye lo que acaba de escribir. Sin réplica, ReadSessionLocal es
+# SessionLocal. El control de lag por empresa está en app/replica.py.
+replica_engine = create_engine(DATABASE_REPLICA_URL, **build_engine_kwargs()) if DATABASE_REPLICA_URL else None
+
+if IS_SQLITE and replica_engine is not None:
+    event.listen(replica_engine, "connect", _sqlite_pragmas)
+
+
+class RoutingSession(Session):
+    primary_engine = engine
+    replica_engine = replica_engine
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.replica_engine is None or self.info.get("use_primary"):
+            return self.primary_engine
+        if self._flushing or isinstance(clause, (Insert, Update, Delete, TextClause)):
+            self.info["use_primary"] = True
+            return self.primary_engine
+        return self.replica_engine
+
+    @property
+    def reads_from_replica(self) -> bool:
+        return self.replica_engine is not None and not self.info.get("use_primary")
+
+    def use_primary(self) -> bool:
+        """Pasa el resto de la sesión al primario; True si antes leía de la réplica."""
+        switched = self.reads_from_replica
+        self.info["use_primary"] = True
+        return switched
+
+
+if replica_engine is not None:
+    ReadSessionLocal = sessionmaker(
+        class_=RoutingSession,
+        autocommit=False,
+        autoflush=False,
+    )
+else:
+    ReadSessionLocal = SessionLocal
+
+
+# ---------------------------------------------------
+# ENGINE ASYNC (asyncpg / aiosqlite)
+# ---------------------------------------------------
+# Los endpoints públicos de mucho tráfico (catálogo, tracking, listas de
+# precios) son async y esperan a la base sin ocupar un hilo del threadpool.
+# Misma URL que el engine sync, con el driver async: asyncpg en Postgres y
+# aiosqlite en el modo local. El resto de la app sigue con SessionLocal.
+# expire_on_commit=False: en async no se puede recargar un atributo expirado
+# sin un await explícito.
+#
+# Cada engine tiene su pool, así que el tope de conexiones por worker es:
+#   primario: DB_POOL_SIZE + DB_MAX_OVERFLOW            (sync, 15 por defecto)
+#           + DB_ASYNC_POOL_SIZE + DB_ASYNC_MAX_OVERFLOW (async, 8 por defecto)
+#           + 1 conexión LISTEN del cache bus (solo Postgres, app/cache_bus.py)
+#   réplica: los mismos dos pools otra vez, si hay DATABASE_REPLICA_URL
+# Con los valores por defecto son 24 conexiones al primario por worker de
+# gunicorn: multiplicar por WEB_CONCURRENCY y dejarlo por debajo de
+# max_connections del plan de Postgres.
+def to_async_url(url: str):
+    async_url = make_url(url)
+    if async_url.get_backend_name() == "sqlite":
+        return async_url.set(drivername="sqlite+aiosqlite")
+    # asyncpg no acepta sslmode en la URL: el modo va en connect_args (DB_SSLMODE)
+    return async_url.set(drivername="postgresql+asyncpg").difference_update_query(["sslmode"])
+
+
+def build_async_engine_kwargs() -> dict:
+    if IS_SQLITE:
+        return {}
+
+    connect_args = {}
+    if DB_SSLMODE:
+        # asyncpg acepta los mismos modos que libpq (disable, require, verify-full...)
+        connect_args["ssl"] = DB_SSLMODE
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    return {
+        "pool_pre_ping": True,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_size": DB_ASYNC_POOL_SIZE,
+        "max_overflow": DB_ASYNC_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "connect_args": connect_args,
+    }
+
+
+async_engine = create_async_engine(to_async_url(DATABASE_URL), **build_async_engine_kwargs())
+async_replica_engine = (
+    create_async_engine(to_async_url(DATABASE_REPLICA_URL), **build_async_engine_kwargs())
+    if DATABASE_REPLICA_URL
+    else None
+)
+
+if IS_SQLITE:
+    event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+    if async_replica_engine is not None:
+        event.listen(async_replica_engine.sync_engine, "connect", _sqlite_pragmas)
+
+
+class AsyncRoutingSession(RoutingSession):
+    primary_engine = async_engine.sync_engine
+    replica_engine = async_replica_engine.sync_engine if async_replica_engine is not None else None
+
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if async_replica_engine is not None:
+    AsyncReadSessionLocal = async_sessionmaker(
+        sync_session_class=AsyncRoutingSession,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+else:
+    AsyncReadSessionLocal = AsyncSessionLocal
+
 Base = declarative_base()
 
+
+def stream_query(query, batch_size: int = DB_STREAM_BATCH_SIZE):
+    """
+    Recorre una Query en lotes sin traer todas las filas a memoria:
+    yield_per + stream_results (cursor del lado del servidor en Postgres).
+    """
+    return query.execution_options(stream_results=True, yield_per=batch_size)
@@ -0,0 +1,156 @@
+import functools
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+
+from app.metrics import metrics
+
+
+# ---------------------------------------------------
+# EXECUTORS CON NOMBRE PARA ENDPOINTS SYNC
+# ---------------------------------------------------
+# Por defecto todos los endpoints `def` comparten el threadpool de anyio
+# (40 hilos). Una importación grande ocupa su hilo por decenas de segundos:
+# varias juntas dejan sin hilos al catálogo y al tracking. Los endpoints
+# pesados se marcan con @run_in_pool("bulk") y corren con su propio tope de
+# concurrencia (CapacityLimiter), sin consumir cupo del pool por defecto.
+#
+#   EXECUTOR_BULK_WORKERS=2       requests pesados a la vez
+#   EXECUTOR_BULK_MAX_QUEUE=16    esperando turno antes de responder 503
+#   EXECUTOR_DEFAULT_WORKERS=40   hilos del pool por defecto de anyio
+
+QUEUE_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+executor_queue_wait = metrics.histogram(
+    "catalogo_executor_queue_wait_seconds", "Espera hasta conseguir un hilo del executor.", ("pool",), QUEUE_WAIT_BUCKETS
+)
+executor_rejected = metrics.counter(
+    "catalogo_executor_rejected", "Requests rechazados con 503 por cola llena.", ("pool",)
+)
+
+
+class ExecutorBusy(HTTPException):
+    def __init__(self, pool: str):
+        super().__init__(
+            status_code=503,
+            detail=f"Hay demasiadas tareas pesadas en curso ({pool}). Probá de nuevo en unos segundos.",
+            headers={"Retry-After": "10"},
+        )
+
+
+class NamedExecutor:
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.workers = max(workers, 1)
+        self.max_queue = max(max_queue, 0)
+        self._limiter = None
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+
+    @property
+    def limiter(self):
+        # el CapacityLimiter se crea dentro del event loop, en el primer uso
+        if self._limiter is None:
+            import anyio
+
+            self._limiter = anyio.CapacityLimiter(self.workers)
+        return self._limiter
+
+    async def run(self, func, *args, **kwargs):
+        import anyio.to_thread
+
+        with self._lock:
+            if self.waiting >= self.max_queue and self.running >= self.workers:
+                executor_rejected.inc(pool=self.name)
+                raise ExecutorBusy(self.name)
+            self.waiting += 1
+        submitted = time.perf_counter()
+        started = False
+
+        def call():
+            nonlocal started
+            with self._lock:
+                self.waiting -= 1
+                self.running += 1
+            started = True
+            executor_queue_wait.observe(time.perf_counter() - submitted, pool=self.name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        try:
+            return await anyio.to_thread.run_sync(call, limiter=self.limiter)
+        finally:
+            if not started:
+                # cancelado (cliente desconectado) antes de conseguir hilo
+                with self._lock:
+                    self.waiting -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "waiting": self.waiting,
+                "completed": self.completed,
+            }
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+EXECUTOR_DEFAULT_WORKERS = _env_int("EXECUTOR_DEFAULT_WORKERS", 40)
+
+executors = {
+    "bulk": NamedExecutor("bulk", _env_int("EXECUTOR_BULK_WORKERS", 2), _env_int("EXECUTOR_BULK_MAX_QUEUE", 16)),
+}
+
+
+def configure_default_pool():
+    """Fija el tope del threadpool por defecto (llamar desde el event loop, en el startup)."""
+    import anyio.to_thread
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = max(EXECUTOR_DEFAULT_WORKERS, 1)
+
+
+def run_in_pool(name: str):
+    """
+    Decorador para endpoints sync: FastAPI ve una corrutina (con la firma
+    original, vía functools.wraps) que despacha el cuerpo al executor `name`.
+    """
+    executor = executors[name]
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await executor.run(func, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def collect_executors():
+    return [
+        ("catalogo_executor_running", "gauge", "Tareas ejecutándose por executor.", [
+            ({"pool": name}, executor.snapshot()["running"]) for name, executor in executors.items()
+        ]),
+        ("catalogo_executor_waiting", "gauge", "Tareas esperando hilo por executor.", [
+            ({"pool": name}, executor.snapshot()["waiting"]) for name, executor in executors.items()
+        ]),
+        ("catalogo_executor_workers", "gauge", "Tope de concurrencia por executor.", [
+            ({"pool": name}, executor.workers) for name, executor in executors.items()
+        ]),
+    ]
+
+
+metrics.add_collector(collect_executors)
@@ -1,14 +1,21 @@
 from fastapi import FastAPI, UploadFile, File, Depends, Request, Form, Query, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse, JSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.staticfiles import NotModifiedResponse
+from starlette.datastructures import Headers
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
 from starlette.middleware.sessions import SessionMiddleware
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import inspect, text, func, case, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, case, or_, insert, select, update
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
-from typing import List
-import pandas as pd
+from typing import Iterator
 import zipfile
+import tempfile
+import io
 import shutil
 import os
 import re
@@ -18,17 +25,65 @@ import uuid
 import hashlib
 import hmac
 import secrets
-from urllib.parse import quote
+from urllib.parse import quote, parse_qs
 from pathlib import Path
-from io import BytesIO
 from datetime import datetime, timezone
-
-# PDF
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-
-from app.database import SessionLocal, engine, Base
+from concurrent.futures import ThreadPoolExecutor, Future
+import threading
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from app.database import (
+    SessionLocal,
+    ReadSessionLocal,
+    AsyncReadSessionLocal,
+    engine,
+    replica_engine,
+    async_engine,
+    async_replica_engine,
+    stream_query,
+)
 from app import models
+from app.migrations import run_migrations
+from app.backup import iter_json_object_sections, open_zip_json_text
+from app.artifacts import ArtifactCache
+from app.compression import choose_encoding, gzip_file, brotli_file, CompressionMiddleware, compression_stats
+from app.metrics import metrics, MetricsMiddleware, instrument_engine, catalog_events
+from app.timing import span, ServerTimingMiddleware, install_db_timing
+from app.cache_bus import cache_bus, tenant_cache
+from app.replica import ensure_fresh_empresa, fallback_to_primary, note_empresa_write, install_replica_tracking
+from app.uploads import save_image_upload, is_temp_upload, UploadRejected
+from app.executors import run_in_pool, executors, configure_default_pool
+from app.profiler import sample_stacks, format_collapsed, top_functions, ProfilerBusy
+from app.memory import (
+    tracemalloc_control,
+    request_memory_log,
+    MemoryTrackingMiddleware,
+    MEMORY_TRACK_REQUESTS,
+    MEMORY_TRACK_ROUTES,
+)
+from app.slow_requests import (
+    slow_request_log,
+    SlowRequestMiddleware,
+    install_sql_capture,
+    SLOW_REQUEST_MS,
+    SLOW_REQUEST_REPEAT_THRESHOLD,
+)
+from app.pdf import (
+    pdf_pool,
+    catalog_pdf_pool,
+    render_pedido_pdf,
+    render_catalogo_pages,
+    paginate_catalogo_lines,
+    merge_pdf_parts,
+    iter_bytes_chunks,
+    PdfPoolBusy,
+    PdfRenderTimeout,
+)
 
 app = FastAPI()
 APP_BUILD = "2026-04-15-cachefix-v3"
@@ -39,25 +94,76 @@ PRODUCTOS_MEDIA_TYPE = "productos"
 ALLOWED_IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif"}
 PRICE_POLICY_VALUES = {"mostrar", "consultar", "automatico"}
 STOCK_POLICY_VALUES = {"mostrar", "ocultar", "automatico"}
+BACKUP_IMPORT_BATCH_SIZE = int(os.getenv("BACKUP_IMPORT_BATCH_SIZE", "1000"))
+PEDIDO_MAX_ITEMS = int(os.getenv("PEDIDO_MAX_ITEMS", "500"))
+PEDIDO_MAX_BODY_BYTES = int(os.getenv("PEDIDO_MAX_BODY_BYTES", str(256 * 1024)))
+CATALOGO_PDF_PAGES_PER_CHUNK = max(int(os.getenv("CATALOGO_PDF_PAGES_PER_CHUNK", "25")), 1)
+# exports, PDFs de pedidos (con datos del comprador) y miniaturas: fuera de
+# STORAGE_DIR, que se sirve entero en /media
+ARTIFACT_CACHE_DIR = Path(
+    os.getenv("ARTIFACT_CACHE_DIR", str(STORAGE_DIR.parent / f"{STORAGE_DIR.name}_cache"))
+).resolve()
+if ARTIFACT_CACHE_DIR == STORAGE_DIR or STORAGE_DIR in ARTIFACT_CACHE_DIR.parents:
+    raise RuntimeError("ARTIFACT_CACHE_DIR no puede estar dentro de STORAGE_DIR (se publica en /media).")
 STORAGE_DIR.mkdir(parents=True, exist_ok=True)
 MEDIA_BASE_DIR.mkdir(parents=True, exist_ok=True)
+ARTIFACT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+artifact_cache = ArtifactCache(ARTIFACT_CACHE_DIR)
 app.add_middleware(
     SessionMiddleware,
     secret_key=os.getenv("SESSION_SECRET", "cambia-esto-en-render"),
     same_site="lax",
     https_only=False,
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(SlowRequestMiddleware)
+install_sql_capture(engine)
+app.add_middleware(ServerTimingMiddleware)
+install_db_timing(engine)
+app.add_middleware(MemoryTrackingMiddleware)
+# el último agregado es el más externo: la latencia incluye sesión y compresión
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+cache_bus.install(engine, SessionLocal)
+install_replica_tracking(SessionLocal)
+for extra_engine, engine_name in (
+    (replica_engine, "replica"),
+    (async_engine.sync_engine, "primary_async"),
+    (async_replica_engine.sync_engine if async_replica_engine is not None else None, "replica_async"),
+):
+    if extra_engine is not None:
+        install_sql_capture(extra_engine)
+        install_db_timing(extra_engine)
+        instrument_engine(extra_engine, engine_name)
 
 # ---------------------------------------------------
 # STARTUP (Render-safe)
 # ---------------------------------------------------
+def remove_legacy_artifact_cache():
+    """
+    Paso único: versiones anteriores guardaban el caché en STORAGE_DIR/cache
+    (publicado en /media). Se borra una vez y queda una marca en ARTIFACT_CACHE_DIR.
+    """
+    marker = ARTIFACT_CACHE_DIR / ".legacy_cache_removed"
+    if marker.exists():
+        return
+    legacy_dir = STORAGE_DIR / "cache"
+    if legacy_dir.exists():
+        shutil.rmtree(legacy_dir, ignore_errors=True)
+        print("[catalogo] caché viejo borrado:", legacy_dir)
+    marker.touch()
+
+
 @app.on_event("startup")
 def on_startup():
-    Base.metadata.create_all(bind=engine)
-    ensure_empresa_media_columns()
-    ensure_usuario_columns()
-    ensure_catalog_lead_columns()
+    configure_default_pool()
+    schema_version = run_migrations(engine)
+    print("[catalogo] schema_version=", schema_version)
+    remove_legacy_artifact_cache()
     ensure_default_admin_user()
+    precompile_templates()
     print("CODEX_SIGNATURE_2026_04_15")
     route_paths = sorted(
         {
@@ -75,87 +181,63 @@ def on_startup():
         os.getenv("RENDER_SERVICE_ID", ""),
     )
     print("[catalogo] routes=", ", ".join(route_paths))
+    cache_bus.start()
+
+
+@app.on_event("shutdown")
+async def dispose_async_engines():
+    await async_engine.dispose()
+    if async_replica_engine is not None:
+        await async_replica_engine.dispose()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    cache_bus.stop()
+    pdf_pool.shutdown()
+    catalog_pdf_pool.shutdown()
+    catalogo_pdf_builder.shutdown(wait=False, cancel_futures=True)
 
 # ---------------------------------------------------
 # Static & Templates
 # ---------------------------------------------------
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
-app.mount(MEDIA_URL_PREFIX, StaticFiles(directory=str(STORAGE_DIR)), name="media")
-templates = Jinja2Templates(directory="app/templates")
 
 
-def ensure_empresa_media_columns():
-    inspector = inspect(engine)
-    columns = {col["name"] for col in inspector.get_columns("empresas")}
-    with engine.begin() as conn:
-        if "logo_url" not in columns:
-            conn.execute(text("ALTER TABLE empresas ADD COLUMN logo_url VARCHAR"))
-        if "banner_url" not in columns:
-            conn.execute(text("ALTER TABLE empresas ADD COLUMN banner_url VARCHAR"))
-        if "politica_precio_catalogo" not in columns:
-            conn.execute(text("ALTER TABLE empresas ADD COLUMN politica_precio_catalogo VARCHAR DEFAULT 'automatico'"))
-        if "politica_stock_catalogo" not in columns:
-            conn.execute(text("ALTER TABLE empresas ADD COLUMN politica_stock_catalogo VARCHAR DEFAULT 'mostrar'"))
-        conn.execute(
-            text(
-                "UPDATE empresas "
-                "SET politica_precio_catalogo = 'automatico' "
-                "WHERE politica_precio_catalogo IS NULL "
-                "OR politica_precio_catalogo NOT IN ('mostrar','consultar','automatico')"
-            )
-        )
-        conn.execute(
-            text(
-                "UPDATE empresas "
-                "SET politica_stock_catalogo = 'mostrar' "
-                "WHERE politica_stock_catalogo IS NULL "
-                "OR politica_stock_catalogo NOT IN ('mostrar','ocultar','automatico')"
-            )
-        )
+class MediaStaticFiles(StaticFiles):
+    """
+    /media con caché larga: las URLs que arma versioned_media_url llevan
+    ?v=<huella del archivo>; si la huella coincide con el archivo actual la
+    respuesta es inmutable. Sin ?v= (o con una vieja) se revalida por ETag.
+    """
 
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        requested_version = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("v", [""])[0]
+        if requested_version and requested_version == media_fingerprint_from_stat(stat_result):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
 
-def ensure_usuario_columns():
-    inspector = inspect(engine)
-    tables = set(inspector.get_table_names())
-    if "usuarios" not in tables:
-        return
 
-    columns = {col["name"] for col in inspector.get_columns("usuarios")}
-    with engine.begin() as conn:
-        if "rol" not in columns:
-            conn.execute(text("ALTER TABLE usuarios ADD COLUMN rol VARCHAR DEFAULT 'cliente'"))
-        if "activo" not in columns:
-            conn.execute(text("ALTER TABLE usuarios ADD COLUMN activo BOOLEAN DEFAULT TRUE"))
-        if "empresa_id" not in columns:
-            conn.execute(text("ALTER TABLE usuarios ADD COLUMN empresa_id INTEGER"))
+app.mount(MEDIA_URL_PREFIX, MediaStaticFiles(directory=str(STORAGE_DIR)), name="media")
+templates = Jinja2Templates(directory="app/templates")
+# bytecode de Jinja compartido entre workers y reinicios: cada worker
+# carga las plantillas ya compiladas en lugar de parsearlas en el primer request
+JINJA_CACHE_DIR = Path(os.getenv("JINJA_CACHE_DIR", str(ARTIFACT_CACHE_DIR / "jinja")))
+JINJA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+templates.env.bytecode_cache = FileSystemBytecodeCache(str(JINJA_CACHE_DIR))
 
 
-def ensure_catalog_lead_columns():
-    inspector = inspect(engine)
-    tables = set(inspector.get_table_names())
-    if "catalog_leads" not in tables:
-        return
+def precompile_templates() -> int:
+    names = templates.env.list_templates(extensions=["html"])
+    for name in names:
+        templates.env.get_template(name)
+    return len(names)
 
-    columns = {col["name"] for col in inspector.get_columns("catalog_leads")}
-    with engine.begin() as conn:
-        if "estado" not in columns:
-            conn.execute(text("ALTER TABLE catalog_leads ADD COLUMN estado VARCHAR DEFAULT 'nuevo'"))
-        if "notas_internas" not in columns:
-            conn.execute(text("ALTER TABLE catalog_leads ADD COLUMN notas_internas TEXT"))
-        if "archived_at" not in columns:
-            conn.execute(text("ALTER TABLE catalog_leads ADD COLUMN archived_at TIMESTAMP"))
-        if "deleted_at" not in columns:
-            conn.execute(text("ALTER TABLE catalog_leads ADD COLUMN deleted_at TIMESTAMP"))
-        conn.execute(
-            text(
-                "UPDATE catalog_leads "
-                "SET estado = 'nuevo' "
-                "WHERE estado IS NULL OR estado NOT IN ('nuevo','contactado','oportunidad','archivado')"
-            )
-        )
-        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_catalog_leads_estado ON catalog_leads(estado)"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_catalog_leads_archived_at ON catalog_leads(archived_at)"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_catalog_leads_deleted_at ON catalog_leads(deleted_at)"))
 
 # ---------------------------------------------------
 # DB Dependency
@@ -168,6 +250,26 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    """Sesión para el catálogo público: lee de la réplica si hay DATABASE_REPLICA_URL."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db():
+    """Igual que get_read_db, para los endpoints async (asyncpg / aiosqlite)."""
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+def get_catalog_empresa(db: Session, slug: str) -> models.Empresa | None:
+    empresa = db.query(models.Empresa).filter(models.Empresa.slug == slug).first()
+    return ensure_fresh_empresa(db, empresa)
+
+
 # ---------------------------------------------------
 # RESOLUCIÓN DE EMPRESA (sin estado global)
 # ---------------------------------------------------
@@ -182,7 +284,7 @@ def get_default_empresa(db: Session):
     return db.query(models.Empresa).order_by(models.Empresa.nombre.asc()).first()
 
 
-def panel_redirect(empresa_slug: str | None = None, msg: str = "", error: str = "", path: str = "/admin"):
+def panel_redirect(empresa_slug: str | None = None, msg: str = "", error: str = "", path: str = "/admin", reporte: str = ""):
     params = []
     if empresa_slug:
         params.append(f"empresa={quote(empresa_slug)}")
@@ -190,6 +292,8 @@ def panel_redirect(empresa_slug: str | None = None, msg: str = "", error: str =
         params.append(f"msg={quote(msg)}")
     if error:
         params.append(f"error={quote(error)}")
+    if reporte:
+        params.append(f"reporte={quote(reporte)}")
     query = "&".join(params)
     return RedirectResponse(url=f"{path}?{query}" if query else path, status_code=303)
 
@@ -269,12 +373,13 @@ def get_dashboard_path(user: models.Usuario) -> str:
     return "/admin" if user.rol == "admin" else "/cliente"
 
 
-def redirect_for_user(user: models.Usuario, empresa_slug: str | None = None, msg: str = "", error: str = ""):
+def redirect_for_user(user: models.Usuario, empresa_slug: str | None = None, msg: str = "", error: str = "", reporte: str = ""):
     return panel_redirect(
         empresa_slug=empresa_slug,
         msg=msg,
         error=error,
         path=get_dashboard_path(user),
+        reporte=reporte,
     )
 
 
@@ -325,6 +430,13 @@ def utc_now():
     return datetime.now(timezone.utc)
 
 
+def as_utc(dt: datetime | None) -> datetime | None:
+    # SQLite (modo local) devuelve fechas sin zona aunque se guardaron en UTC
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
 def get_lead_session_for_slug(request: Request, slug: str) -> dict | None:
     sessions = request.session.get(LEAD_SESSION_KEY) or {}
     lead_session = sessions.get(slug)
@@ -366,6 +478,9 @@ def get_active_catalog_lead(request: Request, slug: str, empresa_id: int, db: Se
         )
         .first()
     )
+    if not lead and fallback_to_primary(db, "lead_no_replicado"):
+        # lead recién creado en el primario que la réplica todavía no tiene
+        return get_active_catalog_lead(request, slug, empresa_id, db)
     if not lead:
         clear_lead_session_for_slug(request, slug)
         return None
@@ -397,6 +512,7 @@ def register_catalog_event(
     db.add(event)
     db.add(lead)
     db.commit()
+    catalog_events.inc(event_type=event_type)
 
 
 def parse_bool_query_flag(value: str | None) -> bool | None:
@@ -469,7 +585,8 @@ def get_lead_priority(
     score += 4 if has_pdf_download else 0
     score += 2 if has_notes else 0
 
-    reference_activity = last_activity_at or created_at
+    created_at = as_utc(created_at)
+    reference_activity = as_utc(last_activity_at) or created_at
     if reference_activity:
         delta_hours = max((now - reference_activity).total_seconds() / 3600, 0)
         if delta_hours <= 6:
@@ -508,7 +625,7 @@ def format_human_time_ago(dt: datetime | None) -> str:
     if not dt:
         return "-"
     now = utc_now()
-    delta_seconds = int(max((now - dt).total_seconds(), 0))
+    delta_seconds = int(max((now - as_utc(dt)).total_seconds(), 0))
 
     if delta_seconds < 60:
         return "Hace instantes"
@@ -649,7 +766,7 @@ def list_catalog_leads_for_admin(
                 "estado_label": LEAD_STATUS_LABELS.get(lead.estado or "nuevo", "Nuevo"),
                 "priority": priority,
                 "has_notes": has_notes,
-                "is_recent": bool(lead.fecha_ingreso and (utc_now() - lead.fecha_ingreso).total_seconds() <= 172800),
+                "is_recent": bool(lead.fecha_ingreso and (utc_now() - as_utc(lead.fecha_ingreso)).total_seconds() <= 172800),
             }
         )
     return sorted(
@@ -766,6 +883,27 @@ def build_lead_timeline_rows(events: list[models.CatalogLeadEvent]) -> list[dict
     return rows
 
 
+def build_lead_order_rows(orders: list[models.CatalogOrder], empresa_slug: str) -> list[dict]:
+    rows = []
+    for order in orders:
+        try:
+            items = json.loads(order.items_json or "[]")
+        except Exception:
+            items = []
+        rows.append(
+            {
+                "id": order.id,
+                "created_at": order.created_at,
+                "items_count": len(items),
+                "units_count": int(sum(item.get("cantidad", 0) for item in items)),
+                "total_text": "Consultar" if order.has_consult_price else f"${float(order.total or 0):,.2f}",
+                "download_count": order.download_count or 0,
+                "pdf_url": build_pedido_pdf_url(empresa_slug, order.access_token),
+            }
+        )
+    return rows
+
+
 def summarize_event_metadata(event_type: str, metadata: dict) -> str:
     if not metadata:
         return ""
@@ -788,8 +926,18 @@ def summarize_event_metadata(event_type: str, metadata: dict) -> str:
     return ""
 
 
+def is_missing_value(value) -> bool:
+    # equivalente a pd.isna para escalares, sin importar pandas en el arranque
+    if value is None:
+        return True
+    try:
+        return bool(value != value)  # NaN / NaT
+    except Exception:  # pd.NA no se puede evaluar como bool
+        return True
+
+
 def clean_text(value, default=""):
-    if value is None or pd.isna(value):
+    if is_missing_value(value):
         return default
     text = str(value).strip()
     if text.lower() == "nan":
@@ -798,7 +946,7 @@ def clean_text(value, default=""):
 
 
 def clean_price(value, default=0.0):
-    if value is None or pd.isna(value):
+    if is_missing_value(value):
         return default
     try:
         parsed = float(value)
@@ -808,7 +956,7 @@ def clean_price(value, default=0.0):
 
 
 def clean_stock(value, default=0):
-    if value is None or pd.isna(value):
+    if is_missing_value(value):
         return default
     try:
         return int(float(value))
@@ -816,6 +964,125 @@ def clean_stock(value, default=0):
         return default
 
 
+# ---------------------------------------------------
+# NORMALIZACIÓN VECTORIZADA DEL EXCEL DE PRODUCTOS
+# ---------------------------------------------------
+# Mismas reglas que clean_text / clean_price / clean_stock, pero aplicadas
+# por columna completa. Lo que no se puede interpretar se carga con el valor
+# por defecto (como antes) y además queda anotado en el reporte de errores.
+EXCEL_REPORT_COLUMNS = ["fila", "codigo", "columna", "valor", "detalle"]
+EXCEL_REPORT_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+# productos.stock es INTEGER (32 bits en Postgres); un precio más grande que
+# esto es un error de carga (p. ej. un código pegado en la columna precio)
+EXCEL_STOCK_MIN = -(2 ** 31)
+EXCEL_STOCK_MAX = 2 ** 31 - 1
+EXCEL_PRECIO_MAX = 1e12
+
+
+def _excel_text_column(df, name: str):
+    import pandas as pd
+
+    if name not in df.columns:
+        return pd.Series(pd.NA, index=df.index, dtype="string")
+    text = df[name].astype("string").str.strip()
+    return text.mask(text.isna() | text.str.lower().isin(["", "nan"]))
+
+
+def _excel_number_column(text):
+    import numpy as np
+    import pandas as pd
+
+    numbers = pd.to_numeric(text, errors="coerce").astype("Float64").to_numpy(dtype="float64", na_value=np.nan)
+    return numbers, np.isfinite(numbers)
+
+
+def normalize_excel_productos(df) -> tuple[list[dict], list[dict]]:
+    import numpy as np
+    import pandas as pd
+
+    codigo = _excel_text_column(df, "codigo")
+    descripcion = _excel_text_column(df, "descripcion")
+    categoria = _excel_text_column(df, "categoria")
+    marca = _excel_text_column(df, "marca")
+    precio_text = _excel_text_column(df, "precio")
+    stock_text = _excel_text_column(df, "stock")
+
+    precio, precio_numeric = _excel_number_column(precio_text)
+    stock, stock_numeric = _excel_number_column(stock_text)
+    stock = np.trunc(np.where(stock_numeric, stock, 0.0))
+    # fuera de rango no se castea: 1e20 daría basura en int64 y falla el INSERT
+    precio_in_range = np.abs(np.where(precio_numeric, precio, 0.0)) <= EXCEL_PRECIO_MAX
+    stock_in_range = (stock >= EXCEL_STOCK_MIN) & (stock <= EXCEL_STOCK_MAX)
+    precio_ok = precio_numeric & precio_in_range
+    stock_ok = stock_numeric & stock_in_range
+    precio = np.where(precio_ok, precio, 0.0)
+    stock = np.where(stock_ok, stock, 0.0).astype("int64")
+
+    has_codigo = codigo.notna().to_numpy()
+    has_data = pd.concat([descripcion, categoria, marca, precio_text, stock_text], axis=1).notna().any(axis=1).to_numpy()
+    duplicated = (codigo.duplicated(keep="last") & codigo.notna()).to_numpy()
+
+    checks = [
+        ("codigo", codigo, ~has_codigo & has_data, "Falta el código: la fila no se cargó."),
+        ("codigo", codigo, duplicated, "Código repetido en el archivo: se usa su última fila."),
+        ("precio", precio_text, has_codigo & precio_text.notna().to_numpy() & ~precio_numeric, "Precio inválido: se cargó 0."),
+        ("precio", precio_text, has_codigo & precio_numeric & ~precio_in_range, "Precio fuera de rango: se cargó 0."),
+        ("stock", stock_text, has_codigo & stock_text.notna().to_numpy() & ~stock_numeric, "Stock inválido: se cargó 0."),
+        ("stock", stock_text, has_codigo & stock_numeric & ~stock_in_range, "Stock fuera de rango: se cargó 0."),
+    ]
+    errores = []
+    for columna, values, mask, detalle in checks:
+        for position in np.flatnonzero(mask):
+            value = values.iloc[position]
+            errores.append({
+                "fila": int(position) + 2,  # encabezado en la fila 1 de Excel
+                "codigo": "" if pd.isna(codigo.iloc[position]) else codigo.iloc[position],
+                "columna": columna,
+                "valor": "" if pd.isna(value) else value,
+                "detalle": detalle,
+            })
+    errores.sort(key=lambda error: error["fila"])
+
+    clean = pd.DataFrame({
+        "codigo": codigo,
+        "descripcion": descripcion.fillna(""),
+        "categoria": categoria,
+        "marca": marca,
+        "precio": precio,
+        "stock": stock,
+    })
+    clean = clean[has_codigo & ~duplicated]
+    for column in ("codigo", "descripcion", "categoria", "marca"):
+        clean[column] = clean[column].astype(object).where(clean[column].notna(), None)
+    return clean.to_dict("records"), errores
+
+
+def guardar_reporte_excel(empresa_id: int, errores: list[dict]) -> str:
+    if not errores:
+        return ""
+    import csv
+
+    reporte_id = uuid.uuid4().hex
+
+    def write(path: Path):
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.DictWriter(f, fieldnames=EXCEL_REPORT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(errores)
+
+    # solo se conserva el último reporte de cada empresa
+    artifact_cache.get_or_build("excel_reportes", empresa_id, f"{reporte_id}.csv", write, prune_siblings=True)
+    return reporte_id
+
+
+def build_excel_reporte_url(empresa: models.Empresa | None, reporte: str) -> str:
+    if not empresa or not EXCEL_REPORT_PATTERN.match(reporte or ""):
+        return ""
+    if not artifact_cache.get("excel_reportes", empresa.id, f"{reporte}.csv"):
+        return ""
+    return f"/upload_excel/reporte/{quote(empresa.slug)}/{reporte}.csv"
+
+
 def normalize_price_policy(value: str | None) -> str:
     policy = clean_text(value, default="automatico").lower()
     return policy if policy in PRICE_POLICY_VALUES else "automatico"
@@ -874,6 +1141,37 @@ def build_media_url(slug: str, media_type: str, filename: str) -> str:
     return f"{MEDIA_URL_PREFIX}/empresas/{slug}/{media_type}/{filename}"
 
 
+def media_fingerprint_from_stat(stat_result) -> str:
+    return hashlib.sha1(f"{stat_result.st_size}-{stat_result.st_mtime_ns}".encode("utf-8")).hexdigest()[:12]
+
+
+def media_fingerprint(path: Path) -> str | None:
+    try:
+        return media_fingerprint_from_stat(path.stat())
+    except OSError:
+        return None
+
+
+def media_url_to_path(url: str | None) -> Path | None:
+    url = (url or "").split("?", 1)[0]
+    if url.startswith(f"{MEDIA_URL_PREFIX}/"):
+        path = STORAGE_DIR / url[len(MEDIA_URL_PREFIX) + 1:]
+    elif url.startswith("/static/"):
+        path = Path("app/static") / url[len("/static/"):]
+    else:
+        return None
+    return path if path.is_file() else None
+
+
+def versioned_media_url(url: str | None) -> str:
+    # la URL guardada en la base queda estable; la huella se agrega al renderizar
+    if not url or not url.startswith(f"{MEDIA_URL_PREFIX}/"):
+        return url or ""
+    base_url = url.split("?", 1)[0]
+    fingerprint = media_fingerprint(STORAGE_DIR / base_url[len(MEDIA_URL_PREFIX) + 1:])
+    return f"{base_url}?v={fingerprint}" if fingerprint else base_url
+
+
 def get_productos_media_dir(slug: str) -> Path:
     return get_empresa_media_dir(slug, PRODUCTOS_MEDIA_TYPE)
 
@@ -901,7 +1199,7 @@ def resolve_producto_imagen_url(producto: models.Producto, empresa_slug: str, mi
 
     existing_name = ""
     if producto.imagen_url:
-        existing_name = Path(producto.imagen_url).name
+        existing_name = Path(producto.imagen_url.split("?", 1)[0]).name
         if existing_name:
             current_path = productos_dir / existing_name
             if current_path.exists():
@@ -974,28 +1272,49 @@ def _copy_zip_prefix(zip_ref: zipfile.ZipFile, prefix: str, target_dir: Path):
             shutil.copyfileobj(src, dst)
 
 
-def safe_unique_filename(upload: UploadFile, prefix: str) -> str:
-    ext = Path(upload.filename or "").suffix.lower()
-    ext = re.sub(r"[^a-z0-9.]", "", ext)
-    if ext not in {".png", ".jpg", ".jpeg", ".webp", ".gif"}:
-        ext = ".jpg"
-    return f"{prefix}-{uuid.uuid4().hex}{ext}"
+def _extract_backup_media(zip_ref: zipfile.ZipFile, static_target_dir: Path, storage_target_dir: Path):
+    _copy_zip_prefix(zip_ref, "static_empresas", static_target_dir)
+    _copy_zip_prefix(zip_ref, "storage_empresas", storage_target_dir)
 
 
-async def replace_empresa_media(empresa: models.Empresa, media_type: str, upload: UploadFile) -> str:
-    target_dir = get_empresa_media_dir(empresa.slug, media_type)
-    target_dir.mkdir(parents=True, exist_ok=True)
+def _media_staging_dir(target_dir: Path) -> Path:
+    # al lado del destino (mismo filesystem) para que el rename sea atómico
+    return target_dir.parent / f".{target_dir.name}.{uuid.uuid4().hex}.importing"
+
+
+def _swap_media_dir(staging_dir: Path, target_dir: Path, drop_existing: bool) -> None:
+    """
+    Pone staging_dir en lugar de target_dir y borra el árbol anterior. Sin
+    staging (el ZIP no traía media) solo se borra el anterior si drop_existing.
+    """
+    if not staging_dir.exists():
+        if drop_existing and target_dir.exists():
+            shutil.rmtree(target_dir)
+        return
+    old_dir = None
+    if target_dir.exists():
+        old_dir = target_dir.parent / f".{target_dir.name}.{uuid.uuid4().hex}.old"
+        os.replace(target_dir, old_dir)
+    os.replace(staging_dir, target_dir)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
 
+def remove_old_media_variants(target_dir: Path, keep: Path):
     for old_file in target_dir.iterdir():
-        if old_file.is_file():
-            old_file.unlink()
+        if old_file.is_file() and old_file != keep and not is_temp_upload(old_file):
+            old_file.unlink(missing_ok=True)
+
+
+async def replace_empresa_media(empresa: models.Empresa, media_type: str, upload: UploadFile) -> str:
+    target_dir = get_empresa_media_dir(empresa.slug, media_type)
+    file_path = await save_image_upload(upload, target_dir, f"{media_type}-{uuid.uuid4().hex}")
 
-    filename = safe_unique_filename(upload, prefix=media_type)
-    file_path = target_dir / filename
-    with open(file_path, "wb") as f:
-        f.write(await upload.read())
+    # las versiones anteriores se borran recién con la nueva ya en su lugar
+    # (en el threadpool, como el resto del I/O de la subida)
+    await run_in_threadpool(remove_old_media_variants, target_dir, file_path)
 
-    return build_media_url(empresa.slug, media_type, filename)
+    return build_media_url(empresa.slug, media_type, file_path.name)
 
 
 def get_empresa_logo_url(empresa: models.Empresa | None) -> str:
@@ -1020,6 +1339,172 @@ def get_empresa_banner_url(empresa: models.Empresa | None) -> str:
     return "/static/images/banner.jpg"
 
 
+# ---------------------------------------------------
+# VERSIÓN DE CATÁLOGO Y EXPORTS CACHEADOS
+# ---------------------------------------------------
+def bump_catalogo_version(db: Session, empresa_id: int) -> int:
+    """
+    Invalida los exports cacheados de la empresa. Se llama antes del commit
+    en todo endpoint que modifica productos o datos visibles del catálogo;
+    con el commit se avisa a los demás workers (app/cache_bus.py).
+    """
+    version = db.execute(
+        update(models.Empresa)
+        .where(models.Empresa.id == empresa_id)
+        .values(catalogo_version=func.coalesce(models.Empresa.catalogo_version, 1) + 1)
+        .returning(models.Empresa.catalogo_version)
+    ).scalar_one()
+    cache_bus.publish(db, empresa_id, version)
+    note_empresa_write(db, empresa_id)
+    return version
+
+
+def load_catalogo_filtros(db: Session, empresa_id: int) -> tuple[list[str], list[str]]:
+    """TODAS las categorías y marcas de la empresa (sin filtros)."""
+    categorias = (
+        db.query(models.Producto.categoria)
+        .filter(
+            models.Producto.empresa_id == empresa_id,
+            models.Producto.categoria.isnot(None)
+        )
+        .distinct()
+        .order_by(models.Producto.categoria)
+        .all()
+    )
+    marcas = (
+        db.query(models.Producto.marca)
+        .filter(
+            models.Producto.empresa_id == empresa_id,
+            models.Producto.marca.isnot(None)
+        )
+        .distinct()
+        .order_by(models.Producto.marca)
+        .all()
+    )
+    return [c[0] for c in categorias], [m[0] for m in marcas]
+
+
+def iter_lista_precios_rows(db: Session, empresa_id: int):
+    return stream_query(
+        db.query(
+            models.Producto.codigo,
+            models.Producto.descripcion,
+            models.Producto.precio,
+            models.Producto.categoria,
+            models.Producto.marca,
+            models.Producto.stock,
+        )
+        .filter(
+            models.Producto.empresa_id == empresa_id,
+            models.Producto.activo == True
+        )
+        .order_by(models.Producto.codigo.asc())
+    )
+
+
+def write_lista_precios_xlsx(db: Session, empresa_id: int, path: Path):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append(["codigo", "descripcion", "precio", "categoria", "marca", "stock"])
+    for codigo, descripcion, precio, categoria, marca, stock in iter_lista_precios_rows(db, empresa_id):
+        sheet.append([
+            codigo,
+            clean_text(descripcion),
+            clean_price(precio, default=0.0),
+            clean_text(categoria),
+            clean_text(marca),
+            clean_stock(stock, default=0),
+        ])
+    workbook.save(path)
+
+
+def get_lista_precios_xlsx(db: Session, empresa: models.Empresa) -> Path:
+    return artifact_cache.get_or_build(
+        "lista_precios",
+        empresa.id,
+        f"v{empresa.catalogo_version or 1}.xlsx",
+        lambda path: write_lista_precios_xlsx(db, empresa.id, path),
+        prune_siblings=True,
+    )
+
+
+def dumps_json_bytes(payload) -> bytes:
+    if orjson:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def build_lista_precios_payload(db: Session, empresa: models.Empresa) -> dict:
+    productos = [
+        {
+            "codigo": codigo,
+            "descripcion": descripcion,
+            "categoria": categoria,
+            "marca": marca,
+            "precio": round(float(precio), 2),
+            "stock": stock,
+            "activo": True,
+        }
+        for codigo, descripcion, precio, categoria, marca, stock in iter_lista_precios_rows(db, empresa.id)
+    ]
+    return {
+        "empresa": {
+            "id": empresa.id,
+            "slug": empresa.slug,
+            "nombre": empresa.nombre,
+            "whatsapp": empresa.whatsapp,
+        },
+        "total_productos": len(productos),
+        "productos": productos,
+    }
+
+
+LISTA_PRECIOS_JSON_COMPRESSORS = {"gzip": (".gz", gzip_file), "br": (".br", brotli_file)}
+
+
+def get_lista_precios_json(db: Session, empresa: models.Empresa, encoding: str | None = None) -> Path:
+    name = f"v{empresa.catalogo_version or 1}.json"
+    json_path = artifact_cache.get_or_build(
+        "lista_precios",
+        empresa.id,
+        name,
+        lambda path: path.write_bytes(dumps_json_bytes(build_lista_precios_payload(db, empresa))),
+        prune_siblings=True,
+    )
+    if not encoding:
+        return json_path
+    suffix, compress = LISTA_PRECIOS_JSON_COMPRESSORS[encoding]
+    return artifact_cache.get_or_build(
+        "lista_precios",
+        empresa.id,
+        name + suffix,
+        lambda path: compress(json_path, path),
+        prune_siblings=True,
+    )
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def publish_static_export(source: Path, target: Path):
+    # copia al directorio estático solo si cambió la versión cacheada
+    source_stat = source.stat()
+    if target.exists():
+        target_stat = target.stat()
+        if (target_stat.st_size, target_stat.st_mtime_ns) == (source_stat.st_size, source_stat.st_mtime_ns):
+            return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_target = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+    shutil.copy2(source, tmp_target)
+    os.replace(tmp_target, target)
+
+
 @app.get("/login", response_class=HTMLResponse)
 def login_form(request: Request, next: str = "/", error: str = ""):
     return templates.TemplateResponse(
@@ -1155,15 +1640,23 @@ async def actualizar_imagenes_empresa(
     if not empresa:
         return panel_redirect(error="Empresa inválida")
 
-    if logo:
-        empresa.logo_url = await replace_empresa_media(empresa, media_type="logo", upload=logo)
+    # si una imagen se rechaza, la que ya se reemplazó igual se guarda
+    error = ""
+    try:
+        if logo and logo.filename:
+            empresa.logo_url = await replace_empresa_media(empresa, media_type="logo", upload=logo)
 
-    if banner:
-        empresa.banner_url = await replace_empresa_media(empresa, media_type="banner", upload=banner)
+        if banner and banner.filename:
+            empresa.banner_url = await replace_empresa_media(empresa, media_type="banner", upload=banner)
+    except UploadRejected as exc:
+        error = str(exc)
 
+    bump_catalogo_version(db, empresa.id)
     db.add(empresa)
     db.commit()
 
+    if error:
+        return panel_redirect(empresa_slug=empresa.slug, error=error)
     return panel_redirect(empresa_slug=empresa.slug, msg="Imágenes actualizadas")
 
 
@@ -1258,6 +1751,7 @@ def editar_empresa_panel(
 
         empresa.slug = slug_final
 
+    bump_catalogo_version(db, empresa.id)
     db.add(empresa)
     db.commit()
 
@@ -1282,6 +1776,7 @@ def actualizar_politicas_catalogo(
 
     empresa.politica_precio_catalogo = normalize_price_policy(politica_precio_catalogo)
     empresa.politica_stock_catalogo = normalize_stock_policy(politica_stock_catalogo)
+    bump_catalogo_version(db, empresa.id)
     db.add(empresa)
     db.commit()
     return panel_redirect(empresa_slug=empresa.slug, msg="Configuración de visualización actualizada.")
@@ -1397,29 +1892,25 @@ async def actualizar_producto(
     producto.activo = activo
 
     # actualizar imagen individual
-    if imagen:
+    if imagen and imagen.filename:
         empresa = producto.empresa
         img_path = get_productos_media_dir(empresa.slug)
-        img_path.mkdir(parents=True, exist_ok=True)
         codigo_safe = sanitize_codigo_for_filename(producto.codigo)
 
-        # borrar imágenes viejas
+        try:
+            saved = await save_image_upload(imagen, img_path, codigo_safe)
+        except UploadRejected as exc:
+            return HTMLResponse(f"<h1>Imagen no guardada</h1><p>{exc}</p>", status_code=400)
+
+        # borrar imágenes viejas con otra extensión, ya con la nueva en su lugar
         for ext in ALLOWED_IMAGE_EXTENSIONS:
             old = img_path / f"{codigo_safe}{ext}"
-            if old.exists():
-                old.unlink()
-
-        # guardar nueva imagen
-        ext = Path(imagen.filename).suffix.lower()
-        if ext not in ALLOWED_IMAGE_EXTENSIONS:
-            ext = ".jpg"
-        filename = f"{codigo_safe}{ext}"
+            if old != saved:
+                old.unlink(missing_ok=True)
 
-        with open(img_path / filename, "wb") as f:
-            f.write(await imagen.read())
-
-        producto.imagen_url = build_producto_media_url(empresa.slug, filename)
+        producto.imagen_url = build_producto_media_url(empresa.slug, saved.name)
 
+    bump_catalogo_version(db, producto.empresa_id)
     db.commit()
     target_empresa = empresa_slug or (producto.empresa.slug if producto.empresa else "")
     products_path = "/admin/productos" if user.rol == "admin" else "/cliente/productos"
@@ -1449,6 +1940,7 @@ def borrar_empresa_get(request: Request, empresa_id: int, db: Session = Depends(
     media_path = MEDIA_BASE_DIR / slug
     if media_path.exists():
         shutil.rmtree(media_path)
+    artifact_cache.purge_group(empresa_id)
 
     return HTMLResponse(
         f"<h1>Empresa {slug} eliminada correctamente</h1>"
@@ -1476,6 +1968,7 @@ def admin_panel(
     tab: str = "empresa",
     msg: str = "",
     error: str = "",
+    reporte: str = "",
     lead_q: str = "",
     lead_whatsapp: str = "",
     lead_pdf: str = "",
@@ -1516,86 +2009,114 @@ def admin_panel(
     lead_selected = None
     lead_selected_summary = None
     lead_timeline = []
+    lead_orders = []
 
-    if empresa_activa:
-        leads_rows = list_catalog_leads_for_admin(
-            db=db,
-            empresa_id=empresa_activa.id,
-            search_query=lead_q,
-            whatsapp_filter=lead_whatsapp_filter,
-            pdf_filter=lead_pdf_filter,
-            cart_filter=lead_cart_filter,
-            status_filter=lead_status_filter,
-            interest_filter=lead_interest_filter,
-            include_archived=lead_archived_filter,
-        )
-        leads_kpis = build_leads_kpis(
-            list_catalog_leads_for_admin(
+    with span("leads", "listado, KPIs y detalle de leads"):
+        if empresa_activa:
+            leads_rows = list_catalog_leads_for_admin(
                 db=db,
                 empresa_id=empresa_activa.id,
-                include_archived=False,
+                search_query=lead_q,
+                whatsapp_filter=lead_whatsapp_filter,
+                pdf_filter=lead_pdf_filter,
+                cart_filter=lead_cart_filter,
+                status_filter=lead_status_filter,
+                interest_filter=lead_interest_filter,
+                include_archived=lead_archived_filter,
             )
-        )
-
-        if lead_id:
-            lead_selected = (
-                db.query(models.CatalogLead)
-                .filter(
-                    models.CatalogLead.id == lead_id,
-                    models.CatalogLead.empresa_catalogo_id == empresa_activa.id,
-                    models.CatalogLead.deleted_at.is_(None),
+            lead_filters_active = bool(
+                clean_text(lead_q, default="")
+                or lead_whatsapp_filter
+                or lead_pdf_filter
+                or lead_cart_filter
+                or lead_status_filter
+                or lead_interest_filter
+                or lead_archived_filter
+            )
+            # sin filtros el listado ya es el universo de los KPIs: no se repite la query
+            leads_kpis = build_leads_kpis(
+                list_catalog_leads_for_admin(
+                    db=db,
+                    empresa_id=empresa_activa.id,
+                    include_archived=False,
                 )
-                .first()
+                if lead_filters_active
+                else leads_rows
             )
 
-        if lead_selected:
-            lead_events = (
-                db.query(models.CatalogLeadEvent)
-                .filter(
-                    models.CatalogLeadEvent.lead_id == lead_selected.id,
-                    models.CatalogLeadEvent.empresa_catalogo_id == empresa_activa.id,
+            if lead_id:
+                lead_selected = (
+                    db.query(models.CatalogLead)
+                    .filter(
+                        models.CatalogLead.id == lead_id,
+                        models.CatalogLead.empresa_catalogo_id == empresa_activa.id,
+                        models.CatalogLead.deleted_at.is_(None),
+                    )
+                    .first()
                 )
-                .order_by(models.CatalogLeadEvent.created_at.desc(), models.CatalogLeadEvent.id.desc())
-                .limit(200)
-                .all()
-            )
-            lead_selected_summary = get_lead_summary_from_events(lead_events)
-            lead_timeline = build_lead_timeline_rows(lead_events)
 
+            if lead_selected:
+                lead_events = (
+                    db.query(models.CatalogLeadEvent)
+                    .filter(
+                        models.CatalogLeadEvent.lead_id == lead_selected.id,
+                        models.CatalogLeadEvent.empresa_catalogo_id == empresa_activa.id,
+                    )
+                    .order_by(models.CatalogLeadEvent.created_at.desc(), models.CatalogLeadEvent.id.desc())
+                    .limit(200)
+                    .all()
+                )
+                lead_selected_summary = get_lead_summary_from_events(lead_events)
+                lead_timeline = build_lead_timeline_rows(lead_events)
+                lead_orders = build_lead_order_rows(
+                    db.query(models.CatalogOrder)
+                    .filter(
+                        models.CatalogOrder.lead_id == lead_selected.id,
+                        models.CatalogOrder.empresa_catalogo_id == empresa_activa.id,
+                    )
+                    .order_by(models.CatalogOrder.created_at.desc(), models.CatalogOrder.id.desc())
+                    .limit(50)
+                    .all(),
+                    empresa_activa.slug,
+                )
 
-    response = templates.TemplateResponse(
-        "upload.html",
-        {
-            "request": request,
-            "msg": msg,
-            "error": error,
-            "empresas": empresas,
-            "empresa_activa": empresa_activa,
-            "empresa_query": empresa_activa.slug if empresa_activa else "",
-            "empresa_logo_url": get_empresa_logo_url(empresa_activa),
-            "empresa_banner_url": get_empresa_banner_url(empresa_activa),
-            "time": int(time.time()),
-            "using_default_admin_password": using_default_admin_password,
-            "admin_username": os.getenv("ADMIN_USER", "admin"),
-            "app_build": APP_BUILD,
-            "active_tab": active_tab,
-            "leads_rows": leads_rows,
-            "lead_q": lead_q,
-            "lead_q_url": quote(lead_q or ""),
-            "lead_whatsapp": lead_whatsapp_filter,
-            "lead_pdf": lead_pdf_filter,
-            "lead_cart": lead_cart_filter,
-            "lead_status": lead_status_filter,
-            "lead_interest": lead_interest_filter,
-            "lead_archived": lead_archived_filter,
-            "lead_unmanaged": lead_unmanaged_filter,
-            "lead_selected": lead_selected,
-            "lead_selected_summary": lead_selected_summary,
-            "lead_timeline": lead_timeline,
-            "lead_status_labels": LEAD_STATUS_LABELS,
-            "leads_kpis": leads_kpis if empresa_activa else [],
-        },
-    )
+
+    with span("render", "upload.html"):
+        response = templates.TemplateResponse(
+            "upload.html",
+            {
+                "request": request,
+                "msg": msg,
+                "error": error,
+                "excel_reporte_url": build_excel_reporte_url(empresa_activa, reporte),
+                "empresas": empresas,
+                "empresa_activa": empresa_activa,
+                "empresa_query": empresa_activa.slug if empresa_activa else "",
+                "empresa_logo_url": get_empresa_logo_url(empresa_activa),
+                "empresa_banner_url": get_empresa_banner_url(empresa_activa),
+                "time": int(time.time()),
+                "using_default_admin_password": using_default_admin_password,
+                "admin_username": os.getenv("ADMIN_USER", "admin"),
+                "app_build": APP_BUILD,
+                "active_tab": active_tab,
+                "leads_rows": leads_rows,
+                "lead_q": lead_q,
+                "lead_q_url": quote(lead_q or ""),
+                "lead_whatsapp": lead_whatsapp_filter,
+                "lead_pdf": lead_pdf_filter,
+                "lead_cart": lead_cart_filter,
+                "lead_status": lead_status_filter,
+                "lead_interest": lead_interest_filter,
+                "lead_archived": lead_archived_filter,
+                "lead_unmanaged": lead_unmanaged_filter,
+                "lead_selected": lead_selected,
+                "lead_selected_summary": lead_selected_summary,
+                "lead_timeline": lead_timeline,
+                "lead_orders": lead_orders,
+                "lead_status_labels": LEAD_STATUS_LABELS,
+                "leads_kpis": leads_kpis if empresa_activa else [],
+            },
+        )
     response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
     response.headers["Pragma"] = "no-cache"
     response.headers["Expires"] = "0"
@@ -1607,6 +2128,7 @@ def cliente_panel(
     request: Request,
     msg: str = "",
     error: str = "",
+    reporte: str = "",
     db: Session = Depends(get_db),
 ):
     user = require_login(request, db)
@@ -1627,6 +2149,7 @@ def cliente_panel(
             "request": request,
             "msg": msg,
             "error": error,
+            "excel_reporte_url": build_excel_reporte_url(empresa_activa, reporte),
             "empresa_activa": empresa_activa,
             "empresa_query": empresa_activa.slug,
             "empresa_logo_url": get_empresa_logo_url(empresa_activa),
@@ -1857,11 +2380,15 @@ async def crear_empresa_panel(
 
     get_productos_media_dir(empresa.slug).mkdir(parents=True, exist_ok=True)
 
-    if logo:
-        empresa.logo_url = await replace_empresa_media(empresa, media_type="logo", upload=logo)
+    try:
+        if logo and logo.filename:
+            empresa.logo_url = await replace_empresa_media(empresa, media_type="logo", upload=logo)
 
-    if banner:
-        empresa.banner_url = await replace_empresa_media(empresa, media_type="banner", upload=banner)
+        if banner and banner.filename:
+            empresa.banner_url = await replace_empresa_media(empresa, media_type="banner", upload=banner)
+    except UploadRejected as exc:
+        db.commit()
+        return panel_redirect(empresa_slug=empresa.slug, error=f"Empresa creada, pero la imagen no se guardó: {exc}")
 
     db.add(empresa)
     db.commit()
@@ -1927,6 +2454,7 @@ def delete_all_products(
         return panel_redirect(error="Empresa inválida.")
 
     db.query(models.Producto).filter(models.Producto.empresa_id == empresa.id).delete()
+    bump_catalogo_version(db, empresa.id)
     db.commit()
 
     return panel_redirect(empresa_slug=empresa.slug, msg=f"Se borraron todos los productos de {empresa.nombre}.")
@@ -1935,6 +2463,7 @@ def delete_all_products(
 # SUBIR EXCEL
 # ---------------------------------------------------
 @app.post("/upload_excel")
+@run_in_pool("bulk")
 def upload_excel(
     request: Request,
     empresa_slug: str = Form(...),
@@ -1954,59 +2483,59 @@ def upload_excel(
         if not filename.endswith((".xlsx", ".xls")):
             return panel_redirect(empresa_slug=empresa.slug, error="Formato inválido. Subí un archivo Excel (.xlsx o .xls).")
 
-        df = pd.read_excel(file.file)
-        df.columns = [c.strip().lower() for c in df.columns]
-
-        required = ["codigo", "descripcion", "precio"]
-        for col in required:
-            if col not in df.columns:
-                return redirect_for_user(user, empresa_slug=empresa.slug, error=f"Falta columna obligatoria: {col}")
+        import pandas as pd
 
-        nuevos = 0
-        actualizados = 0
+        with span("excel", "lectura y normalizacion del Excel"):
+            df = pd.read_excel(file.file)
+            df.columns = [c.strip().lower() for c in df.columns]
 
-        for _, row in df.iterrows():
-            codigo = clean_text(row.get("codigo", ""))
-            if not codigo:
-                continue
+            required = ["codigo", "descripcion", "precio"]
+            for col in required:
+                if col not in df.columns:
+                    return redirect_for_user(user, empresa_slug=empresa.slug, error=f"Falta columna obligatoria: {col}")
 
-            categoria = clean_text(row.get("categoria", ""), default="") or None
-            marca = clean_text(row.get("marca", ""), default="") or None
-            stock = clean_stock(row.get("stock", 0), default=0)
-            precio = clean_price(row.get("precio", 0), default=0.0)
-            descripcion = clean_text(row.get("descripcion", ""), default="")
+            productos, errores = normalize_excel_productos(df)
 
-            existe = db.query(models.Producto).filter(
-                models.Producto.codigo == codigo,
-                models.Producto.empresa_id == empresa.id
-            ).first()
-
-            if existe:
-                existe.descripcion = descripcion or existe.descripcion
-                existe.precio = precio
-                existe.categoria = categoria
-                existe.marca = marca
-                existe.stock = stock
-                actualizados += 1
+        existentes = dict(
+            db.query(models.Producto.codigo, models.Producto.id)
+            .filter(models.Producto.empresa_id == empresa.id)
+            .all()
+        )
+        nuevos_rows = []
+        actualizar_rows = []
+        actualizar_sin_descripcion_rows = []
+        for producto in productos:
+            producto_id = existentes.get(producto["codigo"])
+            if producto_id is None:
+                nuevos_rows.append({
+                    **producto,
+                    "descripcion": producto["descripcion"] or producto["codigo"],
+                    "empresa_id": empresa.id,
+                })
+            elif producto["descripcion"]:
+                actualizar_rows.append({**producto, "id": producto_id})
             else:
-                producto = models.Producto(
-                    codigo=codigo,
-                    descripcion=descripcion or codigo,
-                    categoria=categoria,
-                    marca=marca,
-                    precio=precio,
-                    stock=stock,
-                    empresa_id=empresa.id
-                )
-                db.add(producto)
-                nuevos += 1
-
+                # sin descripción en el Excel se conserva la que ya tenía
+                producto = {key: value for key, value in producto.items() if key != "descripcion"}
+                actualizar_sin_descripcion_rows.append({**producto, "id": producto_id})
+
+        for rows in (actualizar_rows, actualizar_sin_descripcion_rows):
+            if rows:
+                db.execute(update(models.Producto), rows)
+        for start in range(0, len(nuevos_rows), BACKUP_IMPORT_BATCH_SIZE):
+            db.execute(insert(models.Producto), nuevos_rows[start:start + BACKUP_IMPORT_BATCH_SIZE])
+        nuevos = len(nuevos_rows)
+        actualizados = len(actualizar_rows) + len(actualizar_sin_descripcion_rows)
+
+        bump_catalogo_version(db, empresa.id)
         db.commit()
 
         return redirect_for_user(
             user,
             empresa_slug=empresa.slug,
             msg=f"Productos cargados. Nuevos: {nuevos}, Actualizados: {actualizados}."
+            + (f" Filas con observaciones: {len(errores)} (descargá el reporte)." if errores else ""),
+            reporte=guardar_reporte_excel(empresa.id, errores),
         )
 
     except Exception as e:
@@ -2014,10 +2543,26 @@ def upload_excel(
         return redirect_for_user(user, empresa_slug=empresa_slug, error="Error al procesar el Excel.")
 
 
+@app.get("/upload_excel/reporte/{empresa_slug}/{reporte}.csv")
+def descargar_reporte_excel(request: Request, empresa_slug: str, reporte: str, db: Session = Depends(get_db)):
+    user = require_login(request, db)
+    if isinstance(user, RedirectResponse):
+        return user
+
+    empresa = can_access_empresa(user, empresa_slug, db)
+    if not empresa or not EXCEL_REPORT_PATTERN.match(reporte or ""):
+        return HTMLResponse("<h1>Reporte no encontrado</h1>", status_code=404)
+    path = artifact_cache.get("excel_reportes", empresa.id, f"{reporte}.csv")
+    if not path:
+        return HTMLResponse("<h1>Reporte no encontrado</h1>", status_code=404)
+    return FileResponse(path, media_type="text/csv", filename=f"reporte_excel_{empresa.slug}.csv")
+
+
 # ---------------------------------------------------
 # SUBIR ZIP
 # ---------------------------------------------------
 @app.post("/upload_zip")
+@run_in_pool("bulk")
 def upload_zip(
     request: Request,
     empresa_slug: str = Form(...),
@@ -2036,6 +2581,8 @@ def upload_zip(
         images_dir = get_productos_media_dir(empresa.slug)
         images_dir.mkdir(parents=True, exist_ok=True)
         copied = 0
+        # codigo -> archivo; la última imagen del ZIP para un código gana, como antes
+        imagenes_por_codigo = {}
 
         with zipfile.ZipFile(file.file, "r") as zip_ref:
             for member, safe_path in _zip_safe_members(zip_ref):
@@ -2049,18 +2596,28 @@ def upload_zip(
                 destination = images_dir / filename
                 with zip_ref.open(member, "r") as src, open(destination, "wb") as dst:
                     shutil.copyfileobj(src, dst)
-                producto = (
-                    db.query(models.Producto)
-                    .filter(
-                        models.Producto.empresa_id == empresa.id,
-                        models.Producto.codigo == code_raw
-                    )
-                    .first()
-                )
-                if producto:
-                    producto.imagen_url = build_producto_media_url(empresa.slug, filename)
+                imagenes_por_codigo[code_raw] = filename
                 copied += 1
 
+        # un SELECT por lote de códigos y un UPDATE masivo, no una query por imagen
+        codigos = list(imagenes_por_codigo)
+        actualizar_rows = []
+        for start in range(0, len(codigos), BACKUP_IMPORT_BATCH_SIZE):
+            for producto_id, codigo in (
+                db.query(models.Producto.id, models.Producto.codigo)
+                .filter(
+                    models.Producto.empresa_id == empresa.id,
+                    models.Producto.codigo.in_(codigos[start:start + BACKUP_IMPORT_BATCH_SIZE]),
+                )
+            ):
+                actualizar_rows.append({
+                    "id": producto_id,
+                    "imagen_url": build_producto_media_url(empresa.slug, imagenes_por_codigo[codigo]),
+                })
+        if actualizar_rows:
+            db.execute(update(models.Producto), actualizar_rows)
+
+        bump_catalogo_version(db, empresa.id)
         db.commit()
         return redirect_for_user(user, empresa_slug=empresa.slug, msg=f"Imágenes cargadas correctamente ({copied} archivos).")
 
@@ -2069,7 +2626,55 @@ def upload_zip(
         return redirect_for_user(user, empresa_slug=empresa_slug, error="Error al procesar el ZIP.")
 
 
+def iter_file_and_close(file, chunk_size: int = 64 * 1024):
+    # el finally corre al terminar la descarga y también si el cliente corta
+    # (el generador se cierra al descartarse la respuesta)
+    try:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
+
+
+def write_empresa_backup_zip(memory_file, header: dict, productos, static_empresa_dir: Path, storage_empresa_dir: Path):
+    with zipfile.ZipFile(memory_file, mode="w", compression=zipfile.ZIP_DEFLATED) as zipf:
+        # empresa.json se escribe a medida que llegan los productos del cursor
+        with zipf.open("empresa.json", "w") as raw_json, io.TextIOWrapper(raw_json, encoding="utf-8") as json_file:
+            json_file.write(json.dumps(header, ensure_ascii=False, indent=2)[:-2])
+            json_file.write(',\n  "productos": [')
+            for index, (codigo, descripcion, categoria, marca, precio, stock, activo, imagen_url) in enumerate(productos):
+                item = {
+                    "codigo": codigo,
+                    "descripcion": descripcion,
+                    "categoria": categoria,
+                    "marca": marca,
+                    "precio": float(precio or 0),
+                    "stock": int(stock or 0),
+                    "activo": bool(activo),
+                    "imagen_url": imagen_url,
+                }
+                json_file.write(("," if index else "") + "\n    " + json.dumps(item, ensure_ascii=False))
+            json_file.write("\n  ]\n}")
+
+        if static_empresa_dir.exists():
+            for file_path in static_empresa_dir.rglob("*"):
+                if file_path.is_file():
+                    arcname = Path("static_empresas") / file_path.relative_to(static_empresa_dir)
+                    zipf.write(file_path, arcname.as_posix())
+
+        if storage_empresa_dir.exists():
+            for file_path in storage_empresa_dir.rglob("*"):
+                # una subida en curso no forma parte del backup
+                if file_path.is_file() and not is_temp_upload(file_path):
+                    arcname = Path("storage_empresas") / file_path.relative_to(storage_empresa_dir)
+                    zipf.write(file_path, arcname.as_posix())
+
+
 @app.get("/admin/empresa/exportar")
+@run_in_pool("bulk")
 def exportar_empresa_completa(
     request: Request,
     empresa: str | None = Query(default=None),
@@ -2083,8 +2688,7 @@ def exportar_empresa_completa(
     if not empresa_obj:
         return JSONResponse({"error": "No hay empresa activa para exportar"}, status_code=400)
 
-    productos = db.query(models.Producto).filter(models.Producto.empresa_id == empresa_obj.id).all()
-    payload = {
+    header = {
         "version": 1,
         "exported_at": datetime.now(timezone.utc).isoformat(),
         "empresa": {
@@ -2096,47 +2700,41 @@ def exportar_empresa_completa(
             "politica_precio_catalogo": normalize_price_policy(empresa_obj.politica_precio_catalogo),
             "politica_stock_catalogo": normalize_stock_policy(empresa_obj.politica_stock_catalogo),
         },
-        "productos": [
-            {
-                "codigo": p.codigo,
-                "descripcion": p.descripcion,
-                "categoria": p.categoria,
-                "marca": p.marca,
-                "precio": float(p.precio or 0),
-                "stock": int(p.stock or 0),
-                "activo": bool(p.activo),
-                "imagen_url": p.imagen_url,
-            }
-            for p in productos
-        ],
     }
+    productos = stream_query(
+        db.query(
+            models.Producto.codigo,
+            models.Producto.descripcion,
+            models.Producto.categoria,
+            models.Producto.marca,
+            models.Producto.precio,
+            models.Producto.stock,
+            models.Producto.activo,
+            models.Producto.imagen_url,
+        )
+        .filter(models.Producto.empresa_id == empresa_obj.id)
+        .order_by(models.Producto.id.asc())
+    )
 
-    memory_file = BytesIO()
+    # el zip se arma en disco si pasa de 16MB, no en un BytesIO
+    memory_file = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
     static_empresa_dir = Path("app/static/empresas") / empresa_obj.slug
     storage_empresa_dir = MEDIA_BASE_DIR / empresa_obj.slug
 
-    with zipfile.ZipFile(memory_file, mode="w", compression=zipfile.ZIP_DEFLATED) as zipf:
-        zipf.writestr("empresa.json", json.dumps(payload, ensure_ascii=False, indent=2))
-
-        if static_empresa_dir.exists():
-            for file_path in static_empresa_dir.rglob("*"):
-                if file_path.is_file():
-                    arcname = Path("static_empresas") / file_path.relative_to(static_empresa_dir)
-                    zipf.write(file_path, arcname.as_posix())
-
-        if storage_empresa_dir.exists():
-            for file_path in storage_empresa_dir.rglob("*"):
-                if file_path.is_file():
-                    arcname = Path("storage_empresas") / file_path.relative_to(storage_empresa_dir)
-                    zipf.write(file_path, arcname.as_posix())
+    try:
+        write_empresa_backup_zip(memory_file, header, productos, static_empresa_dir, storage_empresa_dir)
+    except BaseException:
+        memory_file.close()
+        raise
 
     memory_file.seek(0)
     filename = f"empresa_{empresa_obj.slug}_backup.zip"
     headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-    return StreamingResponse(memory_file, media_type="application/zip", headers=headers)
+    return StreamingResponse(iter_file_and_close(memory_file), media_type="application/zip", headers=headers)
 
 
 @app.post("/admin/empresa/importar")
+@run_in_pool("bulk")
 def importar_empresa_completa(
     request: Request,
     empresa_slug: str = Form(""),
@@ -2152,20 +2750,35 @@ def importar_empresa_completa(
     if mode not in {"duplicate", "replace"}:
         mode = "duplicate"
 
+    # la media se extrae a carpetas temporales y reemplaza a la actual recién
+    # después del commit: si el JSON viene roto no se pierde nada
+    staging_dirs: list[Path] = []
     try:
-        zip_bytes = file.file.read()
-        with zipfile.ZipFile(BytesIO(zip_bytes), "r") as zip_ref:
+        with zipfile.ZipFile(file.file, "r") as zip_ref:
             if "empresa.json" not in zip_ref.namelist():
                 return panel_redirect(empresa_slug=empresa_slug, error="ZIP inválido: falta empresa.json.")
 
-            payload = json.loads(zip_ref.read("empresa.json").decode("utf-8"))
-            empresa_data = payload.get("empresa", {}) or {}
-            productos_data = payload.get("productos", []) or []
+            json_stream = open_zip_json_text(zip_ref, "empresa.json")
+            sections = iter_json_object_sections(json_stream, stream_keys={"productos"})
+            empresa_data = {}
+            productos_data = iter(())
+            for key, value in sections:
+                if key == "empresa":
+                    empresa_data = value if isinstance(value, dict) else {}
+                elif key == "productos":
+                    if not isinstance(value, Iterator):
+                        value = iter(value if isinstance(value, list) else [])
+                    if empresa_data:
+                        # empresa ya leída: los productos se consumen en streaming
+                        productos_data = value
+                        break
+                    productos_data = iter(list(value))
 
             source_slug = clean_text(empresa_data.get("slug", ""), default="")
             source_slug = re.sub(r"[^a-z0-9\-]", "-", source_slug.lower())
             source_slug = re.sub(r"-+", "-", source_slug).strip("-")
             if not source_slug:
+                json_stream.close()
                 return panel_redirect(empresa_slug=empresa_slug, error="ZIP inválido: slug de empresa vacío.")
 
             existing = get_empresa_by_slug(db, source_slug)
@@ -2175,12 +2788,6 @@ def importar_empresa_completa(
                 if existing:
                     target_empresa = existing
                     db.query(models.Producto).filter(models.Producto.empresa_id == target_empresa.id).delete()
-                    static_target = Path("app/static/empresas") / target_slug
-                    if static_target.exists():
-                        shutil.rmtree(static_target)
-                    storage_target = MEDIA_BASE_DIR / target_slug
-                    if storage_target.exists():
-                        shutil.rmtree(storage_target)
                 else:
                     target_empresa = models.Empresa(
                         nombre=clean_text(empresa_data.get("nombre", source_slug), default=source_slug),
@@ -2214,38 +2821,54 @@ def importar_empresa_completa(
             target_empresa.logo_url = build_media_url(target_slug, "logo", "logo.png")
             target_empresa.banner_url = build_media_url(target_slug, "banner", "banner.jpg")
 
-            for p in productos_data:
-                codigo = clean_text(p.get("codigo", ""), default="")
-                if not codigo:
-                    continue
-                codigo_safe = sanitize_codigo_for_filename(codigo)
-                imported_url = clean_text(p.get("imagen_url", ""), default="") or None
-                normalized_imagen_url = None
-                if imported_url:
-                    imported_name = Path(imported_url).name
-                    if imported_name:
-                        normalized_imagen_url = build_producto_media_url(target_slug, imported_name)
-                if not normalized_imagen_url:
-                    normalized_imagen_url = build_producto_media_url(target_slug, f"{codigo_safe}.jpg")
-                db.add(models.Producto(
-                    empresa_id=target_empresa.id,
-                    codigo=codigo,
-                    descripcion=clean_text(p.get("descripcion", codigo), default=codigo),
-                    categoria=clean_text(p.get("categoria", ""), default="") or None,
-                    marca=clean_text(p.get("marca", ""), default="") or None,
-                    precio=clean_price(p.get("precio", 0), default=0.0),
-                    stock=clean_stock(p.get("stock", 0), default=0),
-                    activo=bool(p.get("activo", True)),
-                    imagen_url=normalized_imagen_url,
-                ))
-
             static_target_dir = Path("app/static/empresas") / target_slug
             storage_target_dir = MEDIA_BASE_DIR / target_slug
-            _copy_zip_prefix(zip_ref, "static_empresas", static_target_dir)
-            _copy_zip_prefix(zip_ref, "storage_empresas", storage_target_dir)
+            static_staging_dir = _media_staging_dir(static_target_dir)
+            storage_staging_dir = _media_staging_dir(storage_target_dir)
+            staging_dirs = [static_staging_dir, storage_staging_dir]
 
-            legacy_productos_dir = static_target_dir / "productos"
-            persistent_productos_dir = get_productos_media_dir(target_slug)
+            # las imágenes se extraen en paralelo mientras se insertan los productos
+            with ThreadPoolExecutor(max_workers=1) as media_pool:
+                media_job = media_pool.submit(_extract_backup_media, zip_ref, static_staging_dir, storage_staging_dir)
+
+                batch = []
+                for p in productos_data:
+                    if not isinstance(p, dict):
+                        continue
+                    codigo = clean_text(p.get("codigo", ""), default="")
+                    if not codigo:
+                        continue
+                    codigo_safe = sanitize_codigo_for_filename(codigo)
+                    imported_url = clean_text(p.get("imagen_url", ""), default="") or None
+                    normalized_imagen_url = None
+                    if imported_url:
+                        imported_name = Path(imported_url).name
+                        if imported_name:
+                            normalized_imagen_url = build_producto_media_url(target_slug, imported_name)
+                    if not normalized_imagen_url:
+                        normalized_imagen_url = build_producto_media_url(target_slug, f"{codigo_safe}.jpg")
+                    batch.append({
+                        "empresa_id": target_empresa.id,
+                        "codigo": codigo,
+                        "descripcion": clean_text(p.get("descripcion", codigo), default=codigo),
+                        "categoria": clean_text(p.get("categoria", ""), default="") or None,
+                        "marca": clean_text(p.get("marca", ""), default="") or None,
+                        "precio": clean_price(p.get("precio", 0), default=0.0),
+                        "stock": clean_stock(p.get("stock", 0), default=0),
+                        "activo": bool(p.get("activo", True)),
+                        "imagen_url": normalized_imagen_url,
+                    })
+                    if len(batch) >= BACKUP_IMPORT_BATCH_SIZE:
+                        db.execute(insert(models.Producto), batch)
+                        batch = []
+                if batch:
+                    db.execute(insert(models.Producto), batch)
+                json_stream.close()
+
+                media_job.result()
+
+            legacy_productos_dir = static_staging_dir / "productos"
+            persistent_productos_dir = storage_staging_dir / PRODUCTOS_MEDIA_TYPE
             if legacy_productos_dir.exists():
                 persistent_productos_dir.mkdir(parents=True, exist_ok=True)
                 for legacy_file in legacy_productos_dir.rglob("*"):
@@ -2258,9 +2881,19 @@ def importar_empresa_completa(
                         _copy_file(legacy_file, destination)
 
             db.add(target_empresa)
+            bump_catalogo_version(db, target_empresa.id)
             db.commit()
 
             action = "reemplazada" if mode == "replace" else "importada"
+            try:
+                _swap_media_dir(static_staging_dir, static_target_dir, drop_existing=mode == "replace")
+                _swap_media_dir(storage_staging_dir, storage_target_dir, drop_existing=mode == "replace")
+            except OSError as e:
+                print("Error moviendo la media importada:", e)
+                return panel_redirect(
+                    empresa_slug=target_slug,
+                    error=f"Empresa {action} con slug '{target_slug}', pero no se pudieron copiar las imágenes.",
+                )
             return panel_redirect(
                 empresa_slug=target_slug,
                 msg=f"Empresa {action} correctamente con slug '{target_slug}'."
@@ -2272,6 +2905,10 @@ def importar_empresa_completa(
         db.rollback()
         print("Error importando empresa:", e)
         return panel_redirect(empresa_slug=empresa_slug, error="Error al importar la empresa.")
+    finally:
+        for staging_dir in staging_dirs:
+            if staging_dir.exists():
+                shutil.rmtree(staging_dir, ignore_errors=True)
 
 # ---------------------------------------------------
 # CATÁLOGO
@@ -2280,9 +2917,9 @@ def importar_empresa_completa(
 def catalogo_acceso(
     slug: str,
     request: Request,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    empresa = db.query(models.Empresa).filter(models.Empresa.slug == slug).first()
+    empresa = get_catalog_empresa(db, slug)
     if not empresa:
         return HTMLResponse("<h1>Empresa no encontrada</h1>", status_code=404)
 
@@ -2295,7 +2932,7 @@ def catalogo_acceso(
         {
             "request": request,
             "empresa": empresa,
-            "empresa_logo_url": get_empresa_logo_url(empresa),
+            "empresa_logo_url": versioned_media_url(get_empresa_logo_url(empresa)),
         },
     )
 
@@ -2335,7 +2972,7 @@ def catalogo_acceso_submit(
             {
                 "request": request,
                 "empresa": empresa_obj,
-                "empresa_logo_url": get_empresa_logo_url(empresa_obj),
+                "empresa_logo_url": versioned_media_url(get_empresa_logo_url(empresa_obj)),
                 "error": error,
                 "form_data": {
                     "nombre": nombre_limpio,
@@ -2393,105 +3030,85 @@ def catalogo_acceso_submit(
     return RedirectResponse(url=f"/catalogo/{slug}", status_code=303)
 
 
-@app.get("/catalogo/{slug}", response_class=HTMLResponse)
-def catalogo(
-    slug: str,
-    request: Request,
-    q: str = "",
-    categoria: str = "",
-    marca: str = "",
-    orden: str = "",
-    db: Session = Depends(get_db)
-):
-
-
-    empresa = db.query(models.Empresa).filter(models.Empresa.slug == slug).first()
-    if not empresa:
-        return HTMLResponse("<h1>Empresa no encontrada</h1>", status_code=404)
-    lead = get_active_catalog_lead(request, slug, empresa.id, db)
-    if not lead:
-        return RedirectResponse(url=f"/catalogo/{slug}/acceso", status_code=303)
-
-    query_db = db.query(models.Producto).filter(
-        models.Producto.empresa_id == empresa.id,
+def catalogo_productos_statement(empresa_id: int, q: str, categoria: str, marca: str, orden: str):
+    statement = select(models.Producto).where(
+        models.Producto.empresa_id == empresa_id,
         models.Producto.activo == True
     )
 
-
     if q:
-        query_db = query_db.filter(models.Producto.descripcion.ilike(f"%{q}%"))
-        
+        statement = statement.where(models.Producto.descripcion.ilike(f"%{q}%"))
+
     if categoria:
-        query_db = query_db.filter(models.Producto.categoria == categoria)
-        
+        statement = statement.where(models.Producto.categoria == categoria)
+
     if marca:
-        query_db = query_db.filter(models.Producto.marca == marca)
+        statement = statement.where(models.Producto.marca == marca)
 
-    
-    
     # ORDEN
     if orden == "precio-asc":
-        query_db = query_db.order_by(models.Producto.precio.asc())
+        statement = statement.order_by(models.Producto.precio.asc())
     elif orden == "precio-desc":
-        query_db = query_db.order_by(models.Producto.precio.desc())
+        statement = statement.order_by(models.Producto.precio.desc())
     elif orden == "codigo-asc":
-         query_db = query_db.order_by(models.Producto.codigo.asc())
+        statement = statement.order_by(models.Producto.codigo.asc())
     elif orden == "marca-asc":
-        query_db = query_db.order_by(models.Producto.marca.asc())
-
-    
+        statement = statement.order_by(models.Producto.marca.asc())
+    return statement
 
-    productos = query_db.all()
-    price_policy = normalize_price_policy(empresa.politica_precio_catalogo)
-    stock_policy = normalize_stock_policy(empresa.politica_stock_catalogo)
 
-    changed_image_urls = False
-    for p in productos:
-        resolved_url = resolve_producto_imagen_url(p, empresa.slug, migrate_legacy=True)
-        if p.imagen_url != resolved_url:
-            p.imagen_url = resolved_url
-            changed_image_urls = True
-        price_display = resolve_price_display(price_policy, p.precio)
-        stock_display = resolve_stock_display(stock_policy, p.stock)
-        p.catalog_price_numeric = price_display["mostrar_numerico"]
-        p.catalog_price_text = price_display["texto"]
-        p.catalog_stock_visible = stock_display["visible"]
-        p.catalog_stock_text = stock_display["texto"]
-        p.catalog_stock_class = stock_display["clase"]
-
-    if changed_image_urls:
-        db.commit()
+def cached_lista_precios_path(empresa: models.Empresa, suffix: str) -> Path | None:
+    return artifact_cache.get("lista_precios", empresa.id, f"v{empresa.catalogo_version or 1}{suffix}")
 
 
+# Los endpoints async ya validaron la versión de la empresa (réplica o primario);
+# si el export no está cacheado se construye en un hilo con una sesión propia
+# del primario, para no generar "vN" con datos de una réplica atrasada.
+def get_lista_precios_xlsx_primary(empresa: models.Empresa) -> Path:
+    cached = cached_lista_precios_path(empresa, ".xlsx")
+    if cached:
+        return cached
+    with SessionLocal() as db:
+        return get_lista_precios_xlsx(db, empresa)
 
-    # TODAS las categorías de la empresa (sin filtros)
-    categorias = (
-        db.query(models.Producto.categoria)
-        .filter(
-            models.Producto.empresa_id == empresa.id,
-            models.Producto.categoria.isnot(None)
-        )
-        .distinct()
-        .order_by(models.Producto.categoria)
-        .all()
-    )
-
-    categorias = [c[0] for c in categorias]
 
-    marcas = (
-        db.query(models.Producto.marca)
-        .filter(
-            models.Producto.empresa_id == empresa.id,
-            models.Producto.marca.isnot(None)
-        )
-        .distinct()
-        .order_by(models.Producto.marca)
-        .all()
-    )
+def get_lista_precios_json_primary(empresa: models.Empresa, encoding: str | None = None) -> Path:
+    with SessionLocal() as db:
+        return get_lista_precios_json(db, empresa, encoding)
 
-    marcas = [m[0] for m in marcas]
 
+def render_catalogo_page(
+    request: Request,
+    empresa: models.Empresa,
+    lead: models.CatalogLead,
+    productos: list,
+    categorias: list[str],
+    marcas: list[str],
+    q: str,
+    categoria: str,
+    marca: str,
+    orden: str,
+):
+    """Parte sin base de datos del catálogo (stat de imágenes, exports, template): corre en el threadpool."""
+    price_policy = normalize_price_policy(empresa.politica_precio_catalogo)
+    stock_policy = normalize_stock_policy(empresa.politica_stock_catalogo)
 
+    # las URLs corregidas se guardan con un UPDATE masivo al final: tocar cada
+    # objeto generaba un UPDATE por producto y el commit expiraba toda la lista
+    imagen_url_updates = []
+    with span("imagenes", "resolucion de imagenes (stat) y precios"):
+        for p in productos:
+            resolved_url = resolve_producto_imagen_url(p, empresa.slug, migrate_legacy=True)
+            if p.imagen_url != resolved_url:
+                imagen_url_updates.append({"id": p.id, "imagen_url": resolved_url})
+            price_display = resolve_price_display(price_policy, p.precio)
+            stock_display = resolve_stock_display(stock_policy, p.stock)
+            p.catalog_imagen_url = versioned_media_url(resolved_url)
+            p.catalog_price_numeric = price_display["mostrar_numerico"]
+            p.catalog_price_text = price_display["texto"]
+            p.catalog_stock_visible = stock_display["visible"]
+            p.catalog_stock_text = stock_display["texto"]
+            p.catalog_stock_class = stock_display["clase"]
 
     productos_json = [
         {
@@ -2507,78 +3124,111 @@ def catalogo(
             "stock_visible": bool(getattr(p, "catalog_stock_visible", False)),
             "stock_texto": getattr(p, "catalog_stock_text", ""),
             "stock_clase": getattr(p, "catalog_stock_class", ""),
-            "imagen_url": p.imagen_url,
+            "imagen_url": p.catalog_imagen_url,
         }
         for p in productos
     ]
 
-    # Export estático para descarga directa (más compatible con navegadores móviles)
-    export_path = Path(f"app/static/empresas/{empresa.slug}")
-    export_path.mkdir(parents=True, exist_ok=True)
-    lista_precios_path = export_path / "lista_precios.json"
-    lista_precios_xlsx_path = export_path / "lista_precios.xlsx"
-
-    lista_payload = {
-            "empresa": {
-                "id": empresa.id,
-                "slug": empresa.slug,
-                "nombre": empresa.nombre,
-                "whatsapp": empresa.whatsapp,
-                "politica_precio_catalogo": price_policy,
-                "politica_stock_catalogo": stock_policy,
-            },
-        "total_productos": len(productos_json),
-        "productos": productos_json,
-    }
+    with span("exports", "lista_precios json/xlsx"):
+        # Export estático para descarga directa (más compatible con navegadores móviles)
+        export_path = Path(f"app/static/empresas/{empresa.slug}")
+        export_path.mkdir(parents=True, exist_ok=True)
+        lista_precios_path = export_path / "lista_precios.json"
+        lista_precios_xlsx_path = export_path / "lista_precios.xlsx"
+
+        lista_payload = {
+                "empresa": {
+                    "id": empresa.id,
+                    "slug": empresa.slug,
+                    "nombre": empresa.nombre,
+                    "whatsapp": empresa.whatsapp,
+                    "politica_precio_catalogo": price_policy,
+                    "politica_stock_catalogo": stock_policy,
+                },
+            "total_productos": len(productos_json),
+            "productos": productos_json,
+        }
 
-    with open(lista_precios_path, "w", encoding="utf-8") as f:
-        json.dump(lista_payload, f, ensure_ascii=False, indent=2)
+        # solo el listado sin filtros representa el catálogo completo de esta versión
+        if not (q or categoria or marca):
+            catalogo_json_path = artifact_cache.get_or_build(
+                "catalogo_json",
+                empresa.id,
+                f"v{empresa.catalogo_version or 1}.json",
+                lambda path: path.write_bytes(dumps_json_bytes(lista_payload)),
+                prune_siblings=True,
+            )
+            publish_static_export(catalogo_json_path, lista_precios_path)
+
+        # Export en el mismo formato de subida (Excel), reutilizando el cacheado de esta versión
+        publish_static_export(get_lista_precios_xlsx_primary(empresa), lista_precios_xlsx_path)
 
-    # Export en el mismo formato de subida (Excel)
-    df_export = pd.DataFrame(
-        [
+    with span("render", "catalogo.html"):
+        response = templates.TemplateResponse(
+            "catalogo.html",
             {
-                "codigo": p.codigo,
-                "descripcion": p.descripcion,
-                "precio": round(float(p.precio), 2),
-                "categoria": p.categoria or "",
-                "marca": p.marca or "",
-                "stock": p.stock if p.stock is not None else 0,
-            }
-            for p in productos
-        ]
-    )
-    df_export.to_excel(lista_precios_xlsx_path, index=False)
+                "request": request,
+                "productos": productos,
+                "productos_json": productos_json,
+                "price_policy": price_policy,
+                "stock_policy": stock_policy,
+                "empresa": empresa,
+                "categorias": categorias,
+                "categoria_actual": categoria,
+                "marcas": marcas,
+                "marca_actual": marca,
+                "orden_actual": orden,
+                "query": q,
+                "ts_download": int(time.time()),
+                "app_build": APP_BUILD,
+                "empresa_logo_url": versioned_media_url(get_empresa_logo_url(empresa)),
+                "empresa_banner_url": versioned_media_url(get_empresa_banner_url(empresa)),
+                "lead_data": {
+                    "nombre": lead.nombre,
+                    "empresa": lead.empresa,
+                    "email": lead.email,
+                    "telefono": lead.telefono or "",
+                },
+            },
+        )
+    return response, imagen_url_updates
 
-    import time
 
-    response = templates.TemplateResponse(
-        "catalogo.html",
-        {
-            "request": request,
-            "productos": productos,
-            "productos_json": productos_json,
-            "price_policy": price_policy,
-            "stock_policy": stock_policy,
-            "empresa": empresa,
-            "categorias": categorias,
-            "categoria_actual": categoria,
-            "marcas": marcas,
-            "marca_actual": marca,
-            "orden_actual": orden,
-            "query": q,
-            "ts_download": int(time.time()),
-            "app_build": APP_BUILD,
-            "empresa_logo_url": get_empresa_logo_url(empresa),
-            "empresa_banner_url": get_empresa_banner_url(empresa),
-            "lead_data": {
-                "nombre": lead.nombre,
-                "empresa": lead.empresa,
-                "email": lead.email,
-                "telefono": lead.telefono or "",
-            },
-        },
+@app.get("/catalogo/{slug}", response_class=HTMLResponse)
+async def catalogo(
+    slug: str,
+    request: Request,
+    q: str = "",
+    categoria: str = "",
+    marca: str = "",
+    orden: str = "",
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    # las esperas a la base son awaits; solo el armado de la página usa un hilo
+    empresa = await db.run_sync(get_catalog_empresa, slug)
+    if not empresa:
+        return HTMLResponse("<h1>Empresa no encontrada</h1>", status_code=404)
+    lead = await db.run_sync(lambda session: get_active_catalog_lead(request, slug, empresa.id, session))
+    if not lead:
+        return RedirectResponse(url=f"/catalogo/{slug}/acceso", status_code=303)
+
+    with span("productos", "consulta de productos"):
+        productos = (await db.scalars(catalogo_productos_statement(empresa.id, q, categoria, marca, orden))).all()
+
+    with span("filtros", "categorias y marcas"):
+        # en memoria hasta el próximo cambio de la empresa (lo invalida el cache bus)
+        filtros = tenant_cache.get(empresa.id, "filtros")
+        if filtros is None:
+            filtros = await db.run_sync(load_catalogo_filtros, empresa.id)
+            tenant_cache.put(empresa.id, "filtros", empresa.catalogo_version or 1, filtros)
+        categorias, marcas = filtros
+
+    response, imagen_url_updates = await run_in_threadpool(
+        render_catalogo_page, request, empresa, lead, productos, categorias, marcas, q, categoria, marca, orden
     )
+    if imagen_url_updates:
+        await db.execute(update(models.Producto), imagen_url_updates)
+        await db.commit()
     response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
     response.headers["Pragma"] = "no-cache"
     response.headers["Expires"] = "0"
@@ -2586,17 +3236,17 @@ def catalogo(
 
 
 @app.post("/catalogo/{slug}/track")
-def track_catalog_event(
+async def track_catalog_event(
     slug: str,
     request: Request,
     payload: CatalogEventPayload,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
-    empresa = db.query(models.Empresa).filter(models.Empresa.slug == slug).first()
+    empresa = await db.run_sync(get_catalog_empresa, slug)
     if not empresa:
         raise HTTPException(status_code=404, detail="Empresa no encontrada")
 
-    lead = get_active_catalog_lead(request, slug, empresa.id, db)
+    lead = await db.run_sync(lambda session: get_active_catalog_lead(request, slug, empresa.id, session))
     if not lead:
         raise HTTPException(status_code=401, detail="Lead no identificado para esta sesión")
 
@@ -2604,189 +3254,589 @@ def track_catalog_event(
     if event_type not in EVENT_TYPES:
         raise HTTPException(status_code=400, detail="Tipo de evento inválido")
 
-    register_catalog_event(
-        db=db,
-        lead=lead,
-        empresa_id=empresa.id,
-        event_type=event_type,
-        product_code=payload.product_code,
-        search_term=payload.search_term,
-        metadata=payload.metadata or {},
+    await db.run_sync(
+        lambda session: register_catalog_event(
+            db=session,
+            lead=lead,
+            empresa_id=empresa.id,
+            event_type=event_type,
+            product_code=payload.product_code,
+            search_term=payload.search_term,
+            metadata=payload.metadata or {},
+        )
     )
     return {"ok": True}
 
 
 @app.get("/catalogo/{slug}/lista_precio.json")
 @app.get("/catalogo/{slug}/lista_precios.json")
-def descargar_lista_precios_json(slug: str, db: Session = Depends(get_db)):
-    empresa = db.query(models.Empresa).filter(models.Empresa.slug == slug).first()
+async def descargar_lista_precios_json(slug: str, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    empresa = await db.run_sync(get_catalog_empresa, slug)
     if not empresa:
         return JSONResponse({"error": "Empresa no encontrada", "slug": slug}, status_code=404)
+    # no hace falta más la conexión: el resto es el archivo cacheado
+    await db.close()
+
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    etag = f'"lp-{empresa.id}-v{empresa.catalogo_version or 1}{"-" + encoding if encoding else ""}"'
+    headers = {
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-cache",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
 
-    productos = (
-        db.query(models.Producto)
-        .filter(
-            models.Producto.empresa_id == empresa.id,
-            models.Producto.activo == True
-        )
-        .order_by(models.Producto.codigo.asc())
-        .all()
+    suffix = ".json" + (LISTA_PRECIOS_JSON_COMPRESSORS[encoding][0] if encoding else "")
+    json_path = cached_lista_precios_path(empresa, suffix) or await run_in_threadpool(
+        get_lista_precios_json_primary, empresa, encoding
     )
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    filename = f"lista_precio_{empresa.slug}.json"
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return FileResponse(json_path, media_type="application/json", headers=headers)
 
-    data = {
-        "empresa": {
-            "id": empresa.id,
-            "slug": empresa.slug,
-            "nombre": empresa.nombre,
-            "whatsapp": empresa.whatsapp,
-        },
-        "total_productos": len(productos),
-        "productos": [
+
+@app.get("/catalogo/{slug}/lista_precios.xlsx")
+async def descargar_lista_precios_xlsx(slug: str, db: AsyncSession = Depends(get_async_read_db)):
+    empresa = await db.run_sync(get_catalog_empresa, slug)
+    if not empresa:
+        return HTMLResponse("<h1>Empresa no encontrada</h1>", status_code=404)
+    # se libera la conexión antes de una posible espera en el executor bulk
+    await db.close()
+
+    # armar el Excel es lo pesado: va al executor bulk, igual que las importaciones
+    xlsx_path = cached_lista_precios_path(empresa, ".xlsx") or await executors["bulk"].run(
+        get_lista_precios_xlsx_primary, empresa
+    )
+    return FileResponse(
+        xlsx_path,
+        media_type=XLSX_MEDIA_TYPE,
+        filename=f"lista_precios_{empresa.slug}.xlsx",
+    )
+
+
+# ---------------------------------------------------
+# PDF
+# ---------------------------------------------------
+class PedidoInvalido(ValueError):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+async def read_json_body_limited(request: Request, max_bytes: int):
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise PedidoInvalido("El pedido es demasiado grande.", status_code=413)
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > max_bytes:
+            raise PedidoInvalido("El pedido es demasiado grande.", status_code=413)
+    try:
+        return json.loads(body or b"{}")
+    except ValueError:
+        raise PedidoInvalido("JSON inválido.")
+
+
+def _pedido_number(value, default=0.0) -> float:
+    if value in (None, ""):
+        return default
+    try:
+        parsed = float(value)
+    except (TypeError, ValueError):
+        raise PedidoInvalido("Cantidad o precio inválido en el pedido.")
+    if not math.isfinite(parsed):
+        raise PedidoInvalido("Cantidad o precio inválido en el pedido.")
+    return parsed
+
+
+def normalize_pedido_items(items) -> list[dict]:
+    if not isinstance(items, list):
+        raise PedidoInvalido("El pedido no tiene ítems válidos.")
+    if len(items) > PEDIDO_MAX_ITEMS:
+        raise PedidoInvalido(f"El pedido supera el máximo de {PEDIDO_MAX_ITEMS} ítems.", status_code=413)
+    normalized = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise PedidoInvalido("El pedido no tiene ítems válidos.")
+        cantidad = _pedido_number(item.get("cantidad", 0))
+        if not cantidad.is_integer():
+            # el carrito solo maneja unidades: 1.5 no se redondea en silencio
+            raise PedidoInvalido("La cantidad de cada ítem tiene que ser un número entero.")
+        normalized.append(
             {
-                "codigo": p.codigo,
-                "descripcion": p.descripcion,
-                "categoria": p.categoria,
-                "marca": p.marca,
-                "precio": round(float(p.precio), 2),
-                "stock": p.stock,
-                "activo": p.activo,
+                "codigo": clean_text(item.get("codigo", ""), default=""),
+                "descripcion": clean_text(item.get("descripcion", ""), default=""),
+                "cantidad": cantidad,
+                "precio": _pedido_number(item.get("precio", 0)),
+                "precio_texto": clean_text(item.get("precio_texto", ""), default=""),
+                "precio_mostrable": bool(item.get("precio_mostrable", True)),
             }
-            for p in productos
-        ],
-    }
+        )
+    return normalized
 
-    filename = f"lista_precio_{empresa.slug}.json"
-    return JSONResponse(
-        content=data,
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+
+def pedido_pdf_response(pdf_bytes: bytes, filename: str = "pedido.pdf", headers: dict | None = None) -> StreamingResponse:
+    return StreamingResponse(
+        iter_bytes_chunks(pdf_bytes),
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Length": str(len(pdf_bytes)),
+            **(headers or {}),
+        },
     )
 
 
-@app.get("/catalogo/{slug}/lista_precios.xlsx")
-def descargar_lista_precios_xlsx(slug: str, db: Session = Depends(get_db)):
-    empresa = db.query(models.Empresa).filter(models.Empresa.slug == slug).first()
+async def render_pedido_or_error(empresa: str, items: list[dict], buyer: dict):
+    try:
+        return await pdf_pool.render(render_pedido_pdf, empresa, items, buyer)
+    except PdfPoolBusy:
+        return JSONResponse(
+            {"error": "Hay demasiados PDFs en proceso. Probá de nuevo en unos segundos."},
+            status_code=503,
+            headers={"Retry-After": "5"},
+        )
+    except PdfRenderTimeout:
+        return JSONResponse({"error": "La generación del PDF tardó demasiado."}, status_code=504)
+
+
+PEDIDO_BUYER_FIELDS = ("nombre", "comercio", "telefono", "direccion", "cuit", "email", "observaciones")
+PEDIDO_TOKEN_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def normalize_pedido_buyer(buyer) -> dict:
+    buyer = buyer if isinstance(buyer, dict) else {}
+    return {field: clean_text(buyer.get(field, ""), default="") for field in PEDIDO_BUYER_FIELDS}
+
+
+def price_pedido_items(db: Session, empresa: models.Empresa, items: list[dict]) -> list[dict]:
+    """
+    Precia el carrito con los datos actuales del catálogo (una sola consulta).
+    Lo que manda el navegador solo aporta códigos y cantidades.
+    """
+    cantidades = {}
+    descripciones = {}
+    for item in items:
+        codigo = item["codigo"]
+        cantidad = int(item["cantidad"])
+        if not codigo or cantidad <= 0:
+            continue
+        cantidades[codigo] = cantidades.get(codigo, 0) + cantidad
+        descripciones.setdefault(codigo, item["descripcion"])
+    if not cantidades:
+        return []
+
+    productos = {
+        codigo: (descripcion, precio)
+        for codigo, descripcion, precio in (
+            db.query(models.Producto.codigo, models.Producto.descripcion, models.Producto.precio)
+            .filter(
+                models.Producto.empresa_id == empresa.id,
+                models.Producto.activo == True,
+                models.Producto.codigo.in_(list(cantidades)),
+            )
+            .all()
+        )
+    }
+    price_policy = normalize_price_policy(empresa.politica_precio_catalogo)
+
+    priced = []
+    for codigo, cantidad in cantidades.items():
+        if codigo in productos:
+            descripcion, precio = productos[codigo]
+            price_display = resolve_price_display(price_policy, precio)
+            priced.append(
+                {
+                    "codigo": codigo,
+                    "descripcion": descripcion,
+                    "cantidad": float(cantidad),
+                    "precio": round(clean_price(precio, default=0.0), 2),
+                    "precio_texto": price_display["texto"],
+                    "precio_mostrable": price_display["mostrar_numerico"],
+                }
+            )
+        else:
+            # producto dado de baja desde que se cargó la página
+            priced.append(
+                {
+                    "codigo": codigo,
+                    "descripcion": descripciones[codigo],
+                    "cantidad": float(cantidad),
+                    "precio": 0.0,
+                    "precio_texto": "Consultar",
+                    "precio_mostrable": False,
+                }
+            )
+    return priced
+
+
+def build_pedido_hash(empresa: models.Empresa, buyer: dict, items: list[dict]) -> str:
+    normalized = {
+        "empresa_id": empresa.id,
+        "catalogo_version": empresa.catalogo_version or 1,
+        "buyer": buyer,
+        "items": sorted([item["codigo"], item["cantidad"]] for item in items),
+    }
+    raw = json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def build_pedido_pdf_url(slug: str, access_token: str) -> str:
+    # el token es aleatorio (CatalogOrder.access_token), no el hash de deduplicación
+    return f"/catalogo/{slug}/pedido/{access_token}.pdf"
+
+
+def pedido_render_info(empresa: models.Empresa, order: models.CatalogOrder) -> dict:
+    return {
+        "empresa_id": empresa.id,
+        "empresa_nombre": empresa.nombre,
+        "slug": empresa.slug,
+        "order_hash": order.order_hash,
+        "access_token": order.access_token,
+        "catalogo_version": order.catalogo_version or 1,
+        "catalogo_version_actual": empresa.catalogo_version or 1,
+        "cache_group": f"{empresa.id}/v{order.catalogo_version or 1}",
+        "items": json.loads(order.items_json),
+        "buyer": json.loads(order.buyer_json),
+    }
+
+
+def registrar_pedido_catalogo(request: Request, db: Session, slug: str, items: list[dict], buyer: dict) -> dict | None:
+    empresa = get_empresa_by_slug(db, slug)
     if not empresa:
-        return HTMLResponse("<h1>Empresa no encontrada</h1>", status_code=404)
+        return None
 
-    productos = (
-        db.query(models.Producto)
+    priced_items = price_pedido_items(db, empresa, items)
+    order_hash = build_pedido_hash(empresa, buyer, priced_items)
+    order = find_pedido_catalogo(db, empresa.id, order_hash)
+    now = utc_now()
+    if order:
+        count_pedido_repetido(order, now)
+    else:
+        lead = get_active_catalog_lead(request, slug, empresa.id, db)
+        has_consult_price = any(not item["precio_mostrable"] for item in priced_items)
+        order = models.CatalogOrder(
+            empresa_catalogo_id=empresa.id,
+            lead_id=lead.id if lead else None,
+            order_hash=order_hash,
+            access_token=secrets.token_hex(32),
+            catalogo_version=empresa.catalogo_version or 1,
+            buyer_json=json.dumps(buyer, ensure_ascii=False),
+            items_json=json.dumps(priced_items, ensure_ascii=False),
+            total=None if has_consult_price else round(
+                sum(item["precio"] * item["cantidad"] for item in priced_items), 2
+            ),
+            has_consult_price=has_consult_price,
+            download_count=1,
+            created_at=now,
+            last_requested_at=now,
+        )
+        try:
+            with db.begin_nested():
+                db.add(order)
+        except IntegrityError:
+            # el mismo pedido se insertó en otro request entre el SELECT y el INSERT
+            order = find_pedido_catalogo(db, empresa.id, order_hash)
+            count_pedido_repetido(order, now)
+    db.commit()
+    return pedido_render_info(empresa, order)
+
+
+def find_pedido_catalogo(db: Session, empresa_id: int, order_hash: str) -> models.CatalogOrder | None:
+    return (
+        db.query(models.CatalogOrder)
         .filter(
-            models.Producto.empresa_id == empresa.id,
-            models.Producto.activo == True
+            models.CatalogOrder.empresa_catalogo_id == empresa_id,
+            models.CatalogOrder.order_hash == order_hash,
         )
-        .order_by(models.Producto.codigo.asc())
-        .all()
+        .first()
     )
 
-    df = pd.DataFrame([
-        {
-            "codigo": p.codigo,
-            "descripcion": clean_text(p.descripcion),
-            "precio": clean_price(p.precio, default=0.0),
-            "categoria": clean_text(p.categoria),
-            "marca": clean_text(p.marca),
-            "stock": clean_stock(p.stock, default=0),
-        }
-        for p in productos
-    ])
 
-    output = BytesIO()
-    df.to_excel(output, index=False)
-    output.seek(0)
+def count_pedido_repetido(order: models.CatalogOrder, now: datetime):
+    # incremento en SQL: dos repeticiones simultáneas no se pisan
+    order.download_count = models.CatalogOrder.download_count + 1
+    order.last_requested_at = now
 
-    filename = f"lista_precios_{empresa.slug}.xlsx"
-    return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+
+def find_pedido_por_token(db: Session, empresa_id: int, access_token: str) -> models.CatalogOrder | None:
+    return (
+        db.query(models.CatalogOrder)
+        .filter(
+            models.CatalogOrder.empresa_catalogo_id == empresa_id,
+            models.CatalogOrder.access_token == access_token,
+        )
+        .first()
     )
 
 
+def cargar_pedido_catalogo(db: Session, slug: str, access_token: str) -> dict | None:
+    # solo lectura: las descargas se cuentan en el POST que crea o repite el pedido
+    empresa = get_catalog_empresa(db, slug)
+    if not empresa:
+        return None
+    order = find_pedido_por_token(db, empresa.id, access_token)
+    if not order and fallback_to_primary(db, "pedido_no_replicado"):
+        # pedido recién creado en el primario que la réplica todavía no tiene
+        order = find_pedido_por_token(db, empresa.id, access_token)
+    if not order:
+        return None
+    return pedido_render_info(empresa, order)
+
+
+def store_pedido_pdf(info: dict, name: str, pdf_bytes: bytes):
+    artifact_cache.store("pedidos", info["cache_group"], name, pdf_bytes)
+    artifact_cache.prune_versions("pedidos", info["empresa_id"], info["catalogo_version"])
+
+
+async def pedido_catalogo_pdf_response(info: dict):
+    # pedidos/<empresa>/v<versión>/: al cambiar el catálogo se borran los PDFs de
+    # versiones anteriores; los pedidos viejos se vuelven a renderizar sin cachear
+    name = f"{info['order_hash']}.pdf"
+    headers = {"X-Pedido-Url": build_pedido_pdf_url(info["slug"], info["access_token"])}
+    cacheable = info["catalogo_version"] >= info["catalogo_version_actual"]
+    cached = artifact_cache.get("pedidos", info["cache_group"], name) if cacheable else None
+    if cached:
+        return FileResponse(cached, media_type="application/pdf", filename="pedido.pdf", headers=headers)
+
+    pdf_bytes = await render_pedido_or_error(info["empresa_nombre"], info["items"], info["buyer"])
+    if isinstance(pdf_bytes, Response):
+        return pdf_bytes
+    if cacheable:
+        await run_in_threadpool(store_pedido_pdf, info, name, pdf_bytes)
+    return pedido_pdf_response(pdf_bytes, headers=headers)
+
+
+@app.post("/pedido/pdf")
+async def generar_pdf(request: Request, db: Session = Depends(get_db)):
+    try:
+        data = await read_json_body_limited(request, PEDIDO_MAX_BODY_BYTES)
+        if not isinstance(data, dict):
+            raise PedidoInvalido("JSON inválido.")
+        items = normalize_pedido_items(data.get("items", []) or [])
+    except PedidoInvalido as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+
+    slug = clean_text(data.get("slug", ""), default="").lower()
+    if slug:
+        buyer = normalize_pedido_buyer(data.get("buyer"))
+        info = await run_in_threadpool(registrar_pedido_catalogo, request, db, slug, items, buyer)
+        if not info:
+            return JSONResponse({"error": "Empresa no encontrada", "slug": slug}, status_code=404)
+        return await pedido_catalogo_pdf_response(info)
+
+    # compatibilidad: clientes sin slug reciben el PDF con los datos enviados, sin persistir
+    empresa = clean_text(data.get("empresa", "Pedido"), default="Pedido")
+    buyer = data.get("buyer", {}) or {}
+    if not isinstance(buyer, dict):
+        buyer = {}
+    pdf_bytes = await render_pedido_or_error(empresa, items, buyer)
+    if isinstance(pdf_bytes, Response):
+        return pdf_bytes
+    return pedido_pdf_response(pdf_bytes)
+
+
+@app.get("/catalogo/{slug}/pedido/{access_token}.pdf")
+async def descargar_pedido_pdf(slug: str, access_token: str, db: Session = Depends(get_read_db)):
+    access_token = (access_token or "").strip().lower()
+    if not PEDIDO_TOKEN_PATTERN.match(access_token):
+        return JSONResponse({"error": "Pedido no encontrado"}, status_code=404)
+    info = await run_in_threadpool(cargar_pedido_catalogo, db, slug, access_token)
+    if not info:
+        return JSONResponse({"error": "Pedido no encontrado"}, status_code=404)
+    return await pedido_catalogo_pdf_response(info)
+
 
 # ---------------------------------------------------
-# PDF
+# CATÁLOGO COMPLETO EN PDF (en segundo plano)
 # ---------------------------------------------------
-@app.post("/pedido/pdf")
-async def generar_pdf(data: dict):
-
-    empresa = data.get("empresa", "Pedido")
-    items: List[dict] = data.get("items", [])
-    buyer: dict = data.get("buyer", {}) or {}
-
-    buyer_nombre = str(buyer.get("nombre", "")).strip()
-    buyer_comercio = str(buyer.get("comercio", "")).strip()
-    buyer_telefono = str(buyer.get("telefono", "")).strip()
-    buyer_direccion = str(buyer.get("direccion", "")).strip()
-    buyer_cuit = str(buyer.get("cuit", "")).strip()
-    buyer_email = str(buyer.get("email", "")).strip()
-    buyer_obs = str(buyer.get("observaciones", "")).strip()
-
-    buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-
-    y = A4[1] - 40
-    x = 40
-    bottom_limit = 55
-
-    def draw_line(text: str, font: str = "Helvetica", size: int = 11, indent: int = 0, line_gap: int = 17):
-        nonlocal y
-        if y <= bottom_limit:
-            c.showPage()
-            y = A4[1] - 40
-        c.setFont(font, size)
-        c.drawString(x + indent, y, text)
-        y -= line_gap
-
-    draw_line(empresa, font="Helvetica-Bold", size=18, line_gap=30)
-
-    draw_line("Datos del comprador", font="Helvetica-Bold", size=12, line_gap=18)
-    draw_line(f"Nombre y apellido: {buyer_nombre or '-'}")
-    draw_line(f"Comercio / empresa: {buyer_comercio or '-'}")
-    draw_line(f"Teléfono: {buyer_telefono or '-'}")
-    draw_line(f"Dirección: {buyer_direccion or '-'}")
-    if buyer_cuit:
-        draw_line(f"CUIT: {buyer_cuit}")
-    if buyer_email:
-        draw_line(f"Email: {buyer_email}")
-    if buyer_obs:
-        draw_line(f"Observaciones: {buyer_obs}")
-
-    y -= 5
-    draw_line("Detalle del pedido", font="Helvetica-Bold", size=12, line_gap=18)
-
-    total = 0.0
-    has_consult_price = False
-    for item in items:
-        cantidad = float(item.get("cantidad", 0))
-        precio = float(item.get("precio", 0))
-        precio_texto = clean_text(item.get("precio_texto", ""), default="")
-        precio_mostrable = bool(item.get("precio_mostrable", True))
-        subtotal = precio * cantidad
-        codigo = item.get("codigo", "")
-        descripcion = item.get("descripcion", "")
-        draw_line(f'{int(cantidad)}x {codigo} - {descripcion}')
-        if precio_mostrable:
-            draw_line(f'${precio:.2f} c/u · Subtotal: ${subtotal:.2f}', indent=15, line_gap=19)
-            total += subtotal
+# Un catálogo con miles de productos tarda demasiado para generarse dentro
+# de un request. La primera descarga de cada versión dispara la construcción
+# en un hilo del worker, que reparte tramos de páginas en catalog_pdf_pool y
+# une el resultado; mientras tanto el cliente recibe una página de espera.
+catalogo_pdf_builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalogo-pdf")
+catalogo_pdf_jobs: dict[tuple[int, int], Future] = {}
+catalogo_pdf_errors: dict[int, str] = {}
+catalogo_pdf_jobs_lock = threading.RLock()
+
+
+def catalogo_thumbnail_path(empresa_id: int, source: Path) -> Path:
+    # la miniatura se reutiliza entre versiones mientras la imagen original no cambie
+    return artifact_cache.path_for("thumbs", empresa_id, f"{source.stem}-{media_fingerprint(source)}.jpg")
+
+
+def build_catalogo_pdf_lines(db: Session, empresa: models.Empresa) -> list[dict]:
+    price_policy = normalize_price_policy(empresa.politica_precio_catalogo)
+    stock_policy = normalize_stock_policy(empresa.politica_stock_catalogo)
+    rows = stream_query(
+        db.query(
+            models.Producto.codigo,
+            models.Producto.descripcion,
+            models.Producto.precio,
+            models.Producto.categoria,
+            models.Producto.marca,
+            models.Producto.stock,
+            models.Producto.imagen_url,
+        )
+        .filter(
+            models.Producto.empresa_id == empresa.id,
+            models.Producto.activo == True
+        )
+        .order_by(
+            func.coalesce(models.Producto.categoria, "").asc(),
+            func.coalesce(models.Producto.marca, "").asc(),
+            models.Producto.codigo.asc(),
+        )
+    )
+
+    lines = []
+    current_categoria = None
+    current_marca = None
+    for row in rows:
+        categoria = clean_text(row.categoria) or "Sin categoría"
+        marca = clean_text(row.marca) or "Sin marca"
+        if categoria != current_categoria:
+            lines.append({"kind": "categoria", "texto": categoria})
+            current_categoria, current_marca = categoria, None
+        if marca != current_marca:
+            lines.append({"kind": "marca", "texto": marca})
+            current_marca = marca
+
+        source = media_url_to_path(resolve_producto_imagen_url(row, empresa.slug, migrate_legacy=False))
+        stock_display = resolve_stock_display(stock_policy, row.stock)
+        lines.append({
+            "kind": "producto",
+            "codigo": clean_text(row.codigo),
+            "descripcion": clean_text(row.descripcion),
+            "precio_texto": resolve_price_display(price_policy, row.precio)["texto"],
+            "stock_texto": stock_display["texto"] if stock_display["visible"] else "",
+            "source": str(source) if source else "",
+            "thumb": str(catalogo_thumbnail_path(empresa.id, source)) if source else "",
+        })
+    return lines
+
+
+def write_catalogo_pdf(title: str, lines: list[dict], path: Path):
+    pages = paginate_catalogo_lines(lines)
+    total_pages = len(pages)
+    started = time.perf_counter()
+    futures = []
+    try:
+        for start in range(0, total_pages, CATALOGO_PDF_PAGES_PER_CHUNK):
+            futures.append(catalog_pdf_pool.submit(
+                render_catalogo_pages,
+                title,
+                pages[start:start + CATALOGO_PDF_PAGES_PER_CHUNK],
+                start + 1,
+                total_pages,
+            ))
+        # CATALOG_PDF_TIMEOUT_SECONDS es el plazo de todo el catálogo, no de cada tramo
+        parts = [catalog_pdf_pool.wait(future, started) for future in futures]
+    except BaseException:
+        # PdfPoolBusy a mitad del submit o timeout: se cancelan los tramos que todavía no empezaron
+        for future in futures:
+            future.cancel()
+        raise
+    merge_pdf_parts(parts, str(path))
+
+
+def build_catalogo_pdf(empresa_id: int, version: int):
+    db = SessionLocal()
+    try:
+        empresa = db.get(models.Empresa, empresa_id)
+        if not empresa:
+            return
+        lines = build_catalogo_pdf_lines(db, empresa)
+        title = f"{empresa.nombre} - Catálogo"
+    finally:
+        db.close()
+
+    started = time.perf_counter()
+    artifact_cache.get_or_build(
+        "catalogo_pdf",
+        empresa_id,
+        f"v{version}.pdf",
+        lambda path: write_catalogo_pdf(title, lines, path),
+        prune_siblings=True,
+    )
+    print(
+        "[catalogo_pdf] empresa=", empresa_id,
+        " version=", version,
+        " productos=", sum(1 for line in lines if line["kind"] == "producto"),
+        " segundos=", round(time.perf_counter() - started, 2),
+    )
+
+
+def _catalogo_pdf_done(key: tuple[int, int], future: Future):
+    with catalogo_pdf_jobs_lock:
+        catalogo_pdf_jobs.pop(key, None)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error:
+            catalogo_pdf_errors[key[0]] = f"v{key[1]}: {type(error).__name__}: {error}"
+            print("[catalogo_pdf] error empresa=", key[0], " version=", key[1], " error=", repr(error))
         else:
-            has_consult_price = True
-            draw_line(f'Precio: {precio_texto or "Consultar"}', indent=15, line_gap=19)
+            catalogo_pdf_errors.pop(key[0], None)
 
-    y -= 5
-    if has_consult_price:
-        draw_line("TOTAL ESTIMADO: Consultar", font="Helvetica-Bold", size=14, line_gap=20)
-    else:
-        draw_line(f"TOTAL ESTIMADO: ${total:.2f}", font="Helvetica-Bold", size=14, line_gap=20)
 
-    c.save()
-    buffer.seek(0)
+def start_catalogo_pdf_build(empresa_id: int, version: int) -> Future:
+    key = (empresa_id, version)
+    with catalogo_pdf_jobs_lock:
+        future = catalogo_pdf_jobs.get(key)
+        if future is None:
+            future = catalogo_pdf_jobs[key] = catalogo_pdf_builder.submit(build_catalogo_pdf, empresa_id, version)
+            future.add_done_callback(lambda done: _catalogo_pdf_done(key, done))
+        return future
 
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
-        headers={"Content-Disposition": "attachment; filename=pedido.pdf"}
+
+@app.get("/catalogo/{slug}/catalogo.pdf")
+def descargar_catalogo_pdf(slug: str, db: Session = Depends(get_read_db)):
+    empresa = get_catalog_empresa(db, slug)
+    if not empresa:
+        return HTMLResponse("<h1>Empresa no encontrada</h1>", status_code=404)
+
+    version = empresa.catalogo_version or 1
+    cached = artifact_cache.get("catalogo_pdf", empresa.id, f"v{version}.pdf")
+    if cached:
+        return FileResponse(cached, media_type="application/pdf", filename=f"catalogo_{empresa.slug}.pdf")
+
+    with catalogo_pdf_jobs_lock:
+        failed = (empresa.id, version) not in catalogo_pdf_jobs and catalogo_pdf_errors.get(empresa.id, "").startswith(f"v{version}:")
+        if failed:
+            # se informa una vez; recargar la página reintenta la generación
+            catalogo_pdf_errors.pop(empresa.id, None)
+    if failed:
+        return HTMLResponse(
+            "<h1>No se pudo generar el catálogo en PDF</h1><p>Recargá la página para reintentar.</p>",
+            status_code=503,
+            headers={"Cache-Control": "no-store"},
+        )
+
+    start_catalogo_pdf_build(empresa.id, version)
+    retry_seconds = 5
+    return HTMLResponse(
+        f"""<!doctype html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<meta http-equiv="refresh" content="{retry_seconds}">
+<title>Generando catálogo</title>
+</head>
+<body style="font-family:sans-serif;text-align:center;padding:40px;">
+<h2>Estamos generando el catálogo en PDF</h2>
+<p>La descarga comienza sola en unos segundos. Podés dejar esta pestaña abierta.</p>
+</body>
+</html>""",
+        status_code=202,
+        headers={"Retry-After": str(retry_seconds), "Cache-Control": "no-store"},
     )
 
+
 # ---------------------------------------------------
 # DEBUG
 # ---------------------------------------------------
@@ -2806,6 +3856,203 @@ def listar_empresas(request: Request, db: Session = Depends(get_db)):
         for e in db.query(models.Empresa).all()
     ]
 
+@app.get("/debug/pdf")
+def debug_pdf_pool(request: Request, db: Session = Depends(get_db)):
+    auth = require_admin(request, db)
+    if isinstance(auth, RedirectResponse):
+        return auth
+    return {
+        **pdf_pool.snapshot(),
+        "catalogo": {
+            **catalog_pdf_pool.snapshot(),
+            "pages_per_chunk": CATALOGO_PDF_PAGES_PER_CHUNK,
+            "builds_en_curso": [
+                {"empresa_id": empresa_id, "version": version}
+                for empresa_id, version in sorted(catalogo_pdf_jobs)
+            ],
+            "ultimos_errores": catalogo_pdf_errors,
+        },
+    }
+
+
+@app.get("/debug/slow")
+def debug_slow_requests(request: Request, limit: int = 20, reset: bool = False, db: Session = Depends(get_db)):
+    auth = require_admin(request, db)
+    if isinstance(auth, RedirectResponse):
+        return auth
+    entries = slow_request_log.snapshot(max(limit, 1))
+    if reset:
+        slow_request_log.clear()
+    return {
+        "threshold_ms": SLOW_REQUEST_MS,
+        "repeat_threshold": SLOW_REQUEST_REPEAT_THRESHOLD,
+        "recorded": slow_request_log.recorded,
+        "entries": entries,
+    }
+
+
+@app.get("/debug/executors")
+def debug_executors(request: Request, db: Session = Depends(get_db)):
+    auth = require_admin(request, db)
+    if isinstance(auth, RedirectResponse):
+        return auth
+    return {name: executor.snapshot() for name, executor in executors.items()}
+
+
+@app.get("/debug/profile")
+def debug_profile(
+    request: Request,
+    seconds: float = 10,
+    interval_ms: float = 10,
+    idle: bool = False,
+    format: str = "collapsed",
+    db: Session = Depends(get_db),
+):
+    auth = require_admin(request, db)
+    if isinstance(auth, RedirectResponse):
+        return auth
+    # la sesión no se usa mientras se muestrea: que no retenga una conexión del pool
+    db.close()
+    try:
+        profile = sample_stacks(seconds, interval_ms, include_idle=idle)
+    except ProfilerBusy:
+        return JSONResponse({"error": "Ya hay un perfil en curso en este worker"}, status_code=409)
+
+    meta = {key: value for key, value in profile.items() if key != "stacks"}
+    print("[profile]", meta)
+    if format == "json":
+        return {**meta, "pid": os.getpid(), "top": top_functions(profile["stacks"])}
+    headers = {
+        "X-Profile-Samples": str(profile["samples"]),
+        "X-Profile-Overhead": str(profile["overhead"]),
+        "X-Profile-Pid": str(os.getpid()),
+        "Content-Disposition": f'attachment; filename="profile-{os.getpid()}-{int(time.time())}.collapsed"',
+    }
+    return Response(format_collapsed(profile["stacks"]), media_type="text/plain; charset=utf-8", headers=headers)
+
+
+MEMORY_GROUP_BY = {"lineno", "filename", "traceback"}
+
+
+@app.get("/debug/memory")
+def debug_memory(request: Request, limit: int = 25, group: str = "lineno", db: Session = Depends(get_db)):
+    auth = require_admin(request, db)
+    if isinstance(auth, RedirectResponse):
+        return auth
+    return {
+        **tracemalloc_control.status(),
+        "request_tracking": {"enabled": MEMORY_TRACK_REQUESTS, "routes": sorted(MEMORY_TRACK_ROUTES)},
+        "requests": request_memory_log.snapshot(),
+        "top": tracemalloc_control.top(max(limit, 1), group if group in MEMORY_GROUP_BY else "lineno"),
+    }
+
+
+@app.post("/debug/memory/start")
+def debug_memory_start(request: Request, frames: int = 15, db: Session = Depends(get_db)):
+    auth = require_admin(request, db)
+    if isinstance(auth, RedirectResponse):
+        return auth
+    status = tracemalloc_control.start(frames)
+    print("[memory] tracemalloc activo, frames=", status["frames"])
+    return status
+
+
+@app.post("/debug/memory/stop")
+def debug_memory_stop(request: Request, db: Session = Depends(get_db)):
+    auth = require_admin(request, db)
+    if isinstance(auth, RedirectResponse):
+        return auth
+    print("[memory] tracemalloc detenido")
+    return tracemalloc_control.stop()
+
+
+@app.get("/debug/memory/diff")
+def debug_memory_diff(
+    request: Request,
+    limit: int = 25,
+    group: str = "lineno",
+    rebase: bool = False,
+    db: Session = Depends(get_db),
+):
+    auth = require_admin(request, db)
+    if isinstance(auth, RedirectResponse):
+        return auth
+    diff = tracemalloc_control.diff(max(limit, 1), group if group in MEMORY_GROUP_BY else "lineno", rebase)
+    if diff is None:
+        return JSONResponse({"error": "tracemalloc no está activo: POST /debug/memory/start"}, status_code=409)
+    return {**tracemalloc_control.status(), "diff": diff}
+
+
+@app.get("/debug/compression")
+def debug_compression(request: Request, db: Session = Depends(get_db)):
+    auth = require_admin(request, db)
+    if isinstance(auth, RedirectResponse):
+        return auth
+    return compression_stats.snapshot()
+
+
+def collect_catalogo_metrics():
+    """Cachés, compresión y pools de PDF, leídos de sus propios contadores en cada scrape."""
+    cache_stats = {namespace: dict(stats) for namespace, stats in artifact_cache.stats.items()}
+    compression = compression_stats.snapshot()["routes"]
+    pools = {"pedido": pdf_pool.snapshot(), "catalogo": catalog_pdf_pool.snapshot()}
+    with catalogo_pdf_jobs_lock:
+        catalogo_builds = len(catalogo_pdf_jobs)
+    return [
+        ("catalogo_cache_hits", "counter", "Aciertos del caché de artefactos.", [
+            ({"namespace": namespace}, stats.get("hits", 0)) for namespace, stats in cache_stats.items()
+        ]),
+        ("catalogo_cache_misses", "counter", "Fallos (construcciones) del caché de artefactos.", [
+            ({"namespace": namespace}, stats.get("misses", 0)) for namespace, stats in cache_stats.items()
+        ]),
+        ("catalogo_cache_hit_ratio", "gauge", "hits / (hits + misses) desde el arranque.", [
+            ({"namespace": namespace}, round(stats.get("hits", 0) / total, 4))
+            for namespace, stats in cache_stats.items()
+            if (total := stats.get("hits", 0) + stats.get("misses", 0))
+        ]),
+        ("catalogo_compression_bytes_in", "counter", "Bytes antes de comprimir por ruta.", [
+            ({"route": route}, stats["bytes_in"]) for route, stats in compression.items()
+        ]),
+        ("catalogo_compression_bytes_out", "counter", "Bytes enviados por ruta.", [
+            ({"route": route}, stats["bytes_out"]) for route, stats in compression.items()
+        ]),
+        ("catalogo_pdf_in_flight", "gauge", "PDFs en render o en cola por pool.", [
+            ({"pool": name}, snapshot["in_flight"]) for name, snapshot in pools.items()
+        ]),
+        ("catalogo_pdf_queue_depth", "gauge", "PDFs esperando un worker libre por pool.", [
+            ({"pool": name}, snapshot["queue_depth"]) for name, snapshot in pools.items()
+        ]),
+        ("catalogo_pdf_renders", "counter", "PDFs terminados por pool y resultado.", [
+            ({"pool": name, "outcome": outcome}, snapshot[outcome])
+            for name, snapshot in pools.items()
+            for outcome in ("rendered", "rejected", "timeouts", "errors")
+        ]),
+        ("catalogo_pdf_catalog_builds_pending", "gauge", "Catálogos PDF completos en construcción.", [({}, catalogo_builds)]),
+    ]
+
+
+metrics.add_collector(collect_catalogo_metrics)
+
+
+def metrics_token_matches(request: Request) -> bool:
+    if not METRICS_TOKEN:
+        return False
+    authorization = request.headers.get("authorization", "")
+    token = authorization[7:].strip() if authorization.lower().startswith("bearer ") else ""
+    return hmac.compare_digest(token, METRICS_TOKEN)
+
+
+@app.get("/metrics")
+async def metrics_endpoint(request: Request, db: Session = Depends(get_db)):
+    # Prometheus entra con METRICS_TOKEN (Authorization: Bearer); un admin, con su sesión
+    if not metrics_token_matches(request):
+        auth = await run_in_threadpool(require_admin, request, db)
+        if isinstance(auth, RedirectResponse):
+            return auth
+    # async a propósito: el collector del threadpool lee el limiter desde el event loop
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.post("/empresa/borrar/{empresa_id}")
 def borrar_empresa(request: Request, empresa_id: int, db: Session = Depends(get_db)):
     auth = require_admin(request, db)
@@ -2827,6 +4074,7 @@ def borrar_empresa(request: Request, empresa_id: int, db: Session = Depends(get_
     # borrar DB (productos se borran por cascade)
     db.delete(empresa)
     db.commit()
+    artifact_cache.purge_group(empresa_id)
 
     return {"status": "ok"}
 
@@ -0,0 +1,232 @@
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows (entorno local)
+    resource = None
+
+from app.asgi import route_label
+from app.metrics import metrics, current_rss_bytes
+
+
+# ---------------------------------------------------
+# MEMORIA: TRACEMALLOC A DEMANDA Y PICO POR REQUEST
+# ---------------------------------------------------
+# tracemalloc cuesta CPU y memoria mientras está activo, así que se prende y
+# apaga desde /debug/memory. Al prenderlo se guarda un snapshot base y los
+# diffs posteriores muestran qué sitios de asignación crecieron desde ahí.
+#
+# Con MEMORY_TRACK_REQUESTS=1 las rutas pesadas (MEMORY_TRACK_ROUTES) miden
+# el crecimiento de RSS, del pico de RSS del proceso y, si tracemalloc está
+# activo, el pico de memoria trazada. El pico de tracemalloc es del proceso:
+# con requests concurrentes solo se mide cuando hay uno solo en curso.
+
+MEMORY_TRACK_REQUESTS = os.getenv("MEMORY_TRACK_REQUESTS", "").strip().lower() in {"1", "true", "yes"}
+MEMORY_TRACK_ROUTES = {
+    route.strip()
+    for route in os.getenv(
+        "MEMORY_TRACK_ROUTES",
+        "/upload_excel,/upload_zip,/admin/empresa/importar,/admin/empresa/exportar,"
+        "/catalogo/{slug},/catalogo/{slug}/lista_precios.xlsx,/catalogo/{slug}/lista_precios.json",
+    ).split(",")
+    if route.strip()
+}
+TRACEMALLOC_DEFAULT_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "15"))
+
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+request_rss_growth = metrics.histogram(
+    "catalogo_request_rss_growth_bytes", "Crecimiento de RSS durante el request (rutas pesadas).", ("route",), MEMORY_BUCKETS
+)
+request_peak_rss_growth = metrics.histogram(
+    "catalogo_request_peak_rss_growth_bytes", "Cuánto subió el pico de RSS del proceso durante el request.", ("route",), MEMORY_BUCKETS
+)
+request_traced_peak = metrics.histogram(
+    "catalogo_request_traced_peak_bytes", "Pico de memoria trazada (tracemalloc) sobre el inicio del request.", ("route",), MEMORY_BUCKETS
+)
+
+
+def peak_rss_bytes() -> int | None:
+    if resource is None:
+        return None
+    # ru_maxrss viene en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# ---------------------------------------------------
+# TRACEMALLOC
+# ---------------------------------------------------
+def _snapshot_filters():
+    return [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ]
+
+
+def _format_stat(stat, diff: bool) -> dict:
+    frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    item = {"site": frames[0] if frames else "?", "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+    if diff:
+        item["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        item["count_diff"] = stat.count_diff
+    if len(frames) > 1:
+        item["traceback"] = frames
+    return item
+
+
+class TracemallocControl:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.baseline = None
+        self.baseline_at = None
+        self.started_by_us = False
+
+    def start(self, frames: int = TRACEMALLOC_DEFAULT_FRAMES) -> dict:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(min(frames, 100), 1))
+                self.started_by_us = True
+            self.baseline = tracemalloc.take_snapshot().filter_traces(_snapshot_filters())
+            self.baseline_at = datetime.now(timezone.utc).isoformat()
+        return self.status()
+
+    def stop(self) -> dict:
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self.baseline = None
+            self.baseline_at = None
+            self.started_by_us = False
+        return self.status()
+
+    def top(self, limit: int = 25, key_type: str = "lineno") -> list[dict]:
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces(_snapshot_filters())
+        return [_format_stat(stat, diff=False) for stat in snapshot.statistics(key_type)[:limit]]
+
+    def diff(self, limit: int = 25, key_type: str = "lineno", rebase: bool = False) -> list[dict] | None:
+        """Sitios que más crecieron desde el snapshot base (None si tracemalloc está apagado)."""
+        with self._lock:
+            if not tracemalloc.is_tracing() or self.baseline is None:
+                return None
+            current = tracemalloc.take_snapshot().filter_traces(_snapshot_filters())
+            stats = current.compare_to(self.baseline, key_type)
+            if rebase:
+                self.baseline = current
+                self.baseline_at = datetime.now(timezone.utc).isoformat()
+        return [_format_stat(stat, diff=True) for stat in stats[:limit]]
+
+    def status(self) -> dict:
+        tracing = tracemalloc.is_tracing()
+        traced, traced_peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            "tracing": tracing,
+            "frames": tracemalloc.get_traceback_limit() if tracing else None,
+            "baseline_at": self.baseline_at,
+            "traced_mb": round(traced / 1024 / 1024, 2),
+            "traced_peak_mb": round(traced_peak / 1024 / 1024, 2),
+            "tracemalloc_overhead_mb": round(tracemalloc.get_tracemalloc_memory() / 1024 / 1024, 2) if tracing else 0,
+            "rss_mb": round((current_rss_bytes() or 0) / 1024 / 1024, 2),
+            "peak_rss_mb": round((peak_rss_bytes() or 0) / 1024 / 1024, 2),
+        }
+
+
+tracemalloc_control = TracemallocControl()
+
+
+# ---------------------------------------------------
+# PICO POR REQUEST
+# ---------------------------------------------------
+class RequestMemoryLog:
+    def __init__(self, maxlen: int = 50):
+        self._entries = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def enter(self) -> bool:
+        """True si es el único request medido en curso (el pico de tracemalloc es suyo)."""
+        with self._lock:
+            self._in_flight += 1
+            return self._in_flight == 1
+
+    def leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def record(self, entry: dict):
+        with self._lock:
+            self._entries.append(entry)
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        return entries
+
+
+request_memory_log = RequestMemoryLog()
+
+
+class MemoryTrackingMiddleware:
+    def __init__(self, app, routes: set[str] = MEMORY_TRACK_ROUTES):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not MEMORY_TRACK_REQUESTS:
+            await self.app(scope, receive, send)
+            return
+
+        # la ruta recién se conoce al final: la medición base es barata (un read de /proc)
+        rss_before = current_rss_bytes()
+        peak_before = peak_rss_bytes()
+        exclusive = request_memory_log.enter()
+        traced_before = None
+        if exclusive and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            traced_peak = None
+            if traced_before is not None and tracemalloc.is_tracing():
+                traced_peak = max(tracemalloc.get_traced_memory()[1] - traced_before, 0)
+            request_memory_log.leave()
+            route = route_label(scope)
+            if route in self.routes:
+                self._record(scope, route, rss_before, peak_before, traced_peak, time.perf_counter() - started)
+
+    def _record(self, scope, route: str, rss_before, peak_before, traced_peak, elapsed: float):
+        rss_after = current_rss_bytes()
+        peak_after = peak_rss_bytes()
+        rss_growth = max(rss_after - rss_before, 0) if rss_before is not None and rss_after is not None else None
+        peak_growth = max(peak_after - peak_before, 0) if peak_before is not None and peak_after is not None else None
+        if rss_growth is not None:
+            request_rss_growth.observe(rss_growth, route=route)
+        if peak_growth is not None:
+            request_peak_rss_growth.observe(peak_growth, route=route)
+        if traced_peak is not None:
+            request_traced_peak.observe(traced_peak, route=route)
+
+        def mb(value):
+            return round(value / 1024 / 1024, 2) if value is not None else None
+
+        request_memory_log.record({
+            "at": datetime.now(timezone.utc).isoformat(),
+            "method": scope.get("method", ""),
+            "route": route,
+            "path": scope.get("path", ""),
+            "duration_ms": round(elapsed * 1000, 2),
+            "rss_after_mb": mb(rss_after),
+            "rss_growth_mb": mb(rss_growth),
+            "peak_rss_growth_mb": mb(peak_growth),
+            "traced_peak_mb": mb(traced_peak),
+        })
@@ -0,0 +1,366 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from app.asgi import route_label
+
+
+# ---------------------------------------------------
+# MÉTRICAS EN FORMATO PROMETHEUS (sin dependencias)
+# ---------------------------------------------------
+# Contadores, gauges e histogramas en memoria del worker, expuestos como texto
+# (exposition format 0.0.4) en /metrics. Con gunicorn cada worker tiene los
+# suyos: el label pid de catalogo_worker_info permite distinguirlos.
+# Lo que ya se mide en otro lado (caché de artefactos, compresión, pools de
+# PDF, pool de la base) se lee en el momento del scrape con collectors.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels_for(self, key: tuple) -> dict:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(f"{self.name}_total", self._labels_for(key), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, self._labels_for(key), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # por serie: [conteos por bucket (no acumulados)..., +Inf], suma
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        result = []
+        for key, counts, total in items:
+            labels = self._labels_for(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                result.append((f"{self.name}_bucket", {**labels, "le": _format_value(float(bound))}, cumulative))
+            result.append((f"{self.name}_sum", labels, total))
+            result.append((f"{self.name}_count", labels, cumulative))
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """collector() -> lista de (nombre, tipo, ayuda, [(labels, valor), ...]) leída en cada scrape."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collector in collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print("[metrics] error en collector:", e)
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                sample_name = f"{name}_total" if kind == "counter" else name
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+http_requests = metrics.counter(
+    "catalogo_http_requests", "Requests HTTP atendidos.", ("method", "route", "status")
+)
+http_request_duration = metrics.histogram(
+    "catalogo_http_request_duration_seconds", "Latencia de los requests por plantilla de ruta.", ("method", "route")
+)
+http_in_flight = metrics.gauge("catalogo_http_requests_in_flight", "Requests en curso en este worker.")
+db_queries = metrics.counter("catalogo_db_queries", "Queries ejecutadas por tipo de statement.", ("kind",))
+db_query_duration = metrics.histogram(
+    "catalogo_db_query_duration_seconds", "Duración de las queries por tipo de statement.", ("kind",), DB_BUCKETS
+)
+db_pool_checkout_wait = metrics.histogram(
+    "catalogo_db_pool_checkout_seconds", "Tiempo hasta obtener una conexión del pool.", (), POOL_WAIT_BUCKETS
+)
+db_pool_checkout_errors = metrics.counter(
+    "catalogo_db_pool_checkout_errors", "Checkouts fallidos (timeout del pool o error de conexión)."
+)
+# los eventos se guardan dentro del mismo request (no hay cola de ingesta que medir)
+catalog_events = metrics.counter("catalogo_catalog_events", "Eventos de leads registrados.", ("event_type",))
+
+
+# ---------------------------------------------------
+# MIDDLEWARE HTTP
+# ---------------------------------------------------
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            # la ruta se resuelve adentro de la app: se lee después de atenderla
+            route = route_label(scope)
+            method = scope.get("method", "")
+            http_requests.inc(method=method, route=route, status=status[0])
+            http_request_duration.observe(time.perf_counter() - started, method=method, route=route)
+
+
+# ---------------------------------------------------
+# BASE DE DATOS
+# ---------------------------------------------------
+def _statement_kind(statement: str) -> str:
+    head = statement.lstrip().split(None, 1)
+    kind = head[0].lower() if head else ""
+    return kind if kind in {"select", "insert", "update", "delete"} else "other"
+
+
+def instrument_engine(engine, name: str = "primary"):
+    """Cuenta y cronometra queries y mide la espera por conexión del pool."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("metrics_query_started")
+        if not started:
+            return
+        kind = _statement_kind(statement)
+        db_queries.inc(kind=kind)
+        db_query_duration.observe(time.perf_counter() - started.pop(), kind=kind)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if context.connection is not None:
+            started = context.connection.info.get("metrics_query_started")
+            if started:
+                started.pop()
+
+    # el pool no tiene evento "antes del checkout": se envuelve raw_connection
+    # (Connection la llama al abrirse), que sobrevive a engine.dispose()
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection():
+        started = time.perf_counter()
+        try:
+            return raw_connection()
+        except Exception:
+            db_pool_checkout_errors.inc()
+            raise
+        finally:
+            db_pool_checkout_wait.observe(time.perf_counter() - started)
+
+    engine.raw_connection = timed_raw_connection
+
+    with _engines_lock:
+        first = not _instrumented_engines
+        _instrumented_engines[name] = engine
+    if first:
+        metrics.add_collector(collect_pools)
+
+
+_instrumented_engines: dict = {}
+_engines_lock = threading.Lock()
+
+
+def collect_pools():
+    """Pool de cada engine instrumentado (primario y, si hay, réplica)."""
+    with _engines_lock:
+        engines = list(_instrumented_engines.items())
+    checked_out, sizes, overflow = [], [], []
+    for name, engine in engines:
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue
+        labels = {"engine": name}
+        checked_out.append((labels, pool.checkedout()))
+        sizes.append((labels, pool.size() if hasattr(pool, "size") else None))
+        overflow.append((labels, max(pool.overflow(), 0) if hasattr(pool, "overflow") else None))
+    if not checked_out:
+        return []
+    return [
+        ("catalogo_db_pool_checked_out", "gauge", "Conexiones prestadas ahora.", checked_out),
+        ("catalogo_db_pool_size", "gauge", "Tamaño configurado del pool.", sizes),
+        ("catalogo_db_pool_overflow", "gauge", "Conexiones por encima del tamaño del pool.", overflow),
+    ]
+
+
+# ---------------------------------------------------
+# THREADPOOL DE ANYIO Y PROCESO
+# ---------------------------------------------------
+def collect_threadpool():
+    """Saturación del threadpool donde corren los endpoints sync (solo desde el event loop)."""
+    import anyio.to_thread
+
+    try:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+    except Exception:
+        return []
+    return [
+        ("catalogo_threadpool_busy", "gauge", "Hilos del threadpool ocupados.", [({}, limiter.borrowed_tokens)]),
+        ("catalogo_threadpool_size", "gauge", "Tope de hilos del threadpool.", [({}, limiter.total_tokens)]),
+        ("catalogo_threadpool_waiting", "gauge", "Tareas esperando un hilo libre.", [({}, limiter.statistics().tasks_waiting)]),
+    ]
+
+
+_started_at = time.time()
+
+
+def current_rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm", "rb") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def collect_process():
+    cpu = os.times()
+    return [
+        ("catalogo_worker_info", "gauge", "Worker que respondió el scrape.", [({"pid": os.getpid()}, 1)]),
+        ("catalogo_process_start_time_seconds", "gauge", "Arranque del worker (epoch).", [({}, round(_started_at, 3))]),
+        ("catalogo_process_cpu_seconds", "counter", "CPU usada por el worker.", [({}, round(cpu.user + cpu.system, 3))]),
+        ("catalogo_process_resident_memory_bytes", "gauge", "Memoria residente del worker.", [({}, current_rss_bytes())]),
+        ("catalogo_process_threads", "gauge", "Hilos vivos en el worker.", [({}, threading.active_count())]),
+    ]
+
+
+metrics.add_collector(collect_process)
+metrics.add_collector(collect_threadpool)
@@ -0,0 +1,284 @@
+import secrets
+from datetime import datetime, timezone
+from typing import Callable
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text, inspect, text,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+
+# ---------------------------------------------------
+# MIGRACIONES DE ESQUEMA VERSIONADAS
+# ---------------------------------------------------
+# Antes cada worker corría create_all + los ensure_* en cada arranque
+# (reflexión de tablas, UPDATE completos, CREATE INDEX). Ahora la versión
+# aplicada queda en schema_version: el arranque normal hace una sola
+# consulta y, si falta algo, un único worker aplica las migraciones
+# pendientes dentro de un lock advisory mientras los demás esperan.
+#
+# Para cambiar el esquema se agrega una función al final de MIGRATIONS con
+# el número siguiente; nunca se edita ni se reordena una ya publicada.
+
+SCHEMA_VERSION_TABLE = "schema_version"
+# clave fija para pg_advisory_xact_lock ("catalog" en hex)
+MIGRATION_LOCK_KEY = 0x636174616C6F67
+
+
+def _columns(conn: Connection, table: str) -> set[str]:
+    return {col["name"] for col in inspect(conn).get_columns(table)}
+
+
+def _tables(conn: Connection) -> set[str]:
+    return set(inspect(conn).get_table_names())
+
+
+# Copia congelada de app/models.py tal como estaba en la versión 1. La
+# migración 001 no usa los modelos vivos: si usara Base.metadata, una base
+# nueva ya tendría las columnas que después agrega otra migración y esa
+# migración fallaría con "column already exists".
+SCHEMA_V1 = MetaData()
+
+Table(
+    "empresas", SCHEMA_V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("nombre", String, nullable=False),
+    Column("slug", String, nullable=False, unique=True),
+    Column("whatsapp", String, nullable=True),
+    Column("logo_url", String, nullable=True),
+    Column("banner_url", String, nullable=True),
+    Column("politica_precio_catalogo", String, nullable=False),
+    Column("politica_stock_catalogo", String, nullable=False),
+    Column("catalogo_version", Integer, nullable=False),
+)
+
+Table(
+    "productos", SCHEMA_V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("empresa_id", Integer, ForeignKey("empresas.id", ondelete="CASCADE"), nullable=False),
+    Column("codigo", String, nullable=False),
+    Column("descripcion", String, nullable=False),
+    Column("categoria", String, nullable=True),
+    Column("marca", String, nullable=True),
+    Column("precio", Float, nullable=False),
+    Column("stock", Integer),
+    Column("activo", Boolean),
+    Column("imagen_url", String, nullable=True),
+)
+
+Table(
+    "usuarios", SCHEMA_V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String, nullable=False, unique=True, index=True),
+    Column("password_hash", String, nullable=False),
+    Column("rol", String, nullable=False),
+    Column("activo", Boolean, nullable=False),
+    Column("empresa_id", Integer, ForeignKey("empresas.id", ondelete="SET NULL"), nullable=True),
+)
+
+Table(
+    "catalog_leads", SCHEMA_V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("empresa_catalogo_id", Integer, ForeignKey("empresas.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("nombre", String, nullable=False),
+    Column("empresa", String, nullable=False),
+    Column("email", String, nullable=False, index=True),
+    Column("telefono", String, nullable=True),
+    Column("fecha_ingreso", DateTime(timezone=True), nullable=False),
+    Column("ultima_actividad", DateTime(timezone=True), nullable=False),
+    Column("session_token", String, nullable=True, index=True),
+    Column("estado", String, nullable=False, index=True),
+    Column("notas_internas", Text, nullable=True),
+    Column("archived_at", DateTime(timezone=True), nullable=True, index=True),
+    Column("deleted_at", DateTime(timezone=True), nullable=True, index=True),
+)
+
+Table(
+    "catalog_lead_events", SCHEMA_V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("lead_id", Integer, ForeignKey("catalog_leads.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("empresa_catalogo_id", Integer, ForeignKey("empresas.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("event_type", String, nullable=False, index=True),
+    Column("product_code", String, nullable=True),
+    Column("search_term", String, nullable=True),
+    Column("metadata_json", Text, nullable=True),
+    Column("created_at", DateTime(timezone=True), nullable=False, index=True),
+)
+
+Table(
+    "catalog_orders", SCHEMA_V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("empresa_catalogo_id", Integer, ForeignKey("empresas.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("lead_id", Integer, ForeignKey("catalog_leads.id", ondelete="SET NULL"), nullable=True, index=True),
+    Column("order_hash", String, nullable=False, index=True),
+    Column("catalogo_version", Integer, nullable=False),
+    Column("buyer_json", Text, nullable=False),
+    Column("items_json", Text, nullable=False),
+    Column("total", Float, nullable=True),
+    Column("has_consult_price", Boolean, nullable=False),
+    Column("download_count", Integer, nullable=False),
+    Column("created_at", DateTime(timezone=True), nullable=False, index=True),
+    Column("last_requested_at", DateTime(timezone=True), nullable=False),
+)
+
+
+def migration_001_esquema_base(conn: Connection):
+    """Esquema inicial + columnas que antes agregaban los ensure_* al arrancar."""
+    SCHEMA_V1.create_all(bind=conn)
+
+    columns = _columns(conn, "empresas")
+    if "logo_url" not in columns:
+        conn.execute(text("ALTER TABLE empresas ADD COLUMN logo_url VARCHAR"))
+    if "banner_url" not in columns:
+        conn.execute(text("ALTER TABLE empresas ADD COLUMN banner_url VARCHAR"))
+    if "politica_precio_catalogo" not in columns:
+        conn.execute(text("ALTER TABLE empresas ADD COLUMN politica_precio_catalogo VARCHAR DEFAULT 'automatico'"))
+    if "politica_stock_catalogo" not in columns:
+        conn.execute(text("ALTER TABLE empresas ADD COLUMN politica_stock_catalogo VARCHAR DEFAULT 'mostrar'"))
+    if "catalogo_version" not in columns:
+        conn.execute(text("ALTER TABLE empresas ADD COLUMN catalogo_version INTEGER DEFAULT 1"))
+    conn.execute(
+        text(
+            "UPDATE empresas "
+            "SET politica_precio_catalogo = 'automatico' "
+            "WHERE politica_precio_catalogo IS NULL "
+            "OR politica_precio_catalogo NOT IN ('mostrar','consultar','automatico')"
+        )
+    )
+    conn.execute(
+        text(
+            "UPDATE empresas "
+            "SET politica_stock_catalogo = 'mostrar' "
+            "WHERE politica_stock_catalogo IS NULL "
+            "OR politica_stock_catalogo NOT IN ('mostrar','ocultar','automatico')"
+        )
+    )
+    conn.execute(text("UPDATE empresas SET catalogo_version = 1 WHERE catalogo_version IS NULL"))
+
+    columns = _columns(conn, "usuarios")
+    if "rol" not in columns:
+        conn.execute(text("ALTER TABLE usuarios ADD COLUMN rol VARCHAR DEFAULT 'cliente'"))
+    if "activo" not in columns:
+        conn.execute(text("ALTER TABLE usuarios ADD COLUMN activo BOOLEAN DEFAULT TRUE"))
+    if "empresa_id" not in columns:
+        conn.execute(text("ALTER TABLE usuarios ADD COLUMN empresa_id INTEGER"))
+
+    columns = _columns(conn, "catalog_leads")
+    if "estado" not in columns:
+        conn.execute(text("ALTER TABLE catalog_leads ADD COLUMN estado VARCHAR DEFAULT 'nuevo'"))
+    if "notas_internas" not in columns:
+        conn.execute(text("ALTER TABLE catalog_leads ADD COLUMN notas_internas TEXT"))
+    if "archived_at" not in columns:
+        conn.execute(text("ALTER TABLE catalog_leads ADD COLUMN archived_at TIMESTAMP"))
+    if "deleted_at" not in columns:
+        conn.execute(text("ALTER TABLE catalog_leads ADD COLUMN deleted_at TIMESTAMP"))
+    conn.execute(
+        text(
+            "UPDATE catalog_leads "
+            "SET estado = 'nuevo' "
+            "WHERE estado IS NULL OR estado NOT IN ('nuevo','contactado','oportunidad','archivado')"
+        )
+    )
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_catalog_leads_estado ON catalog_leads(estado)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_catalog_leads_archived_at ON catalog_leads(archived_at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_catalog_leads_deleted_at ON catalog_leads(deleted_at)"))
+
+
+def migration_002_pedidos_unicos(conn: Connection):
+    """Un solo pedido por (empresa, hash): se fusionan los duplicados y se agrega el índice único."""
+    conn.execute(
+        text(
+            "UPDATE catalog_orders SET download_count = ("
+            "SELECT SUM(dup.download_count) FROM catalog_orders dup "
+            "WHERE dup.empresa_catalogo_id = catalog_orders.empresa_catalogo_id "
+            "AND dup.order_hash = catalog_orders.order_hash) "
+            "WHERE id IN (SELECT MIN(id) FROM catalog_orders "
+            "GROUP BY empresa_catalogo_id, order_hash HAVING COUNT(*) > 1)"
+        )
+    )
+    conn.execute(
+        text(
+            "DELETE FROM catalog_orders WHERE id NOT IN ("
+            "SELECT MIN(id) FROM catalog_orders GROUP BY empresa_catalogo_id, order_hash)"
+        )
+    )
+    conn.execute(
+        text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_catalog_orders_empresa_hash "
+            "ON catalog_orders(empresa_catalogo_id, order_hash)"
+        )
+    )
+
+
+def migration_003_token_pedidos(conn: Connection):
+    """Token aleatorio por pedido para la URL del PDF (antes era el hash del pedido)."""
+    if "access_token" not in _columns(conn, "catalog_orders"):
+        conn.execute(text("ALTER TABLE catalog_orders ADD COLUMN access_token VARCHAR"))
+    order_ids = conn.execute(text("SELECT id FROM catalog_orders WHERE access_token IS NULL")).scalars().all()
+    for order_id in order_ids:
+        conn.execute(
+            text("UPDATE catalog_orders SET access_token = :token WHERE id = :id"),
+            {"token": secrets.token_hex(32), "id": order_id},
+        )
+    conn.execute(
+        text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_catalog_orders_access_token "
+            "ON catalog_orders(access_token)"
+        )
+    )
+
+
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "esquema_base", migration_001_esquema_base),
+    (2, "pedidos_unicos", migration_002_pedidos_unicos),
+    (3, "token_pedidos", migration_003_token_pedidos),
+]
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn: Connection) -> int:
+    try:
+        return conn.execute(text(f"SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}")).scalar() or 0
+    except DBAPIError:
+        # base nueva: todavía no existe schema_version
+        conn.rollback()
+        return 0
+
+
+def _lock_migrations(conn: Connection):
+    if conn.dialect.name == "postgresql":
+        # se libera solo al terminar la transacción
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def run_migrations(engine: Engine) -> int:
+    with engine.connect() as conn:
+        current = get_schema_version(conn)
+    if current >= LATEST_SCHEMA_VERSION:
+        return current
+
+    with engine.begin() as conn:
+        _lock_migrations(conn)
+        if SCHEMA_VERSION_TABLE not in _tables(conn):
+            conn.execute(
+                text(
+                    f"CREATE TABLE {SCHEMA_VERSION_TABLE} ("
+                    "version INTEGER PRIMARY KEY, "
+                    "name VARCHAR NOT NULL, "
+                    "applied_at TIMESTAMP NOT NULL)"
+                )
+            )
+        # otro worker pudo terminar mientras esperábamos el lock
+        current = conn.execute(text(f"SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}")).scalar() or 0
+        for version, name, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            print("[migraciones] aplicando", version, name)
+            migrate(conn)
+            conn.execute(
+                text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                {"version": version, "name": name, "applied_at": datetime.now(timezone.utc).replace(tzinfo=None)},
+            )
+            current = version
+    return current
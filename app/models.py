@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
+import secrets
 from .database import Base
 
 
@@ -15,6 +16,8 @@ class Empresa(Base):
     banner_url = Column(String, nullable=True)
     politica_precio_catalogo = Column(String, nullable=False, default="automatico")
     politica_stock_catalogo = Column(String, nullable=False, default="mostrar")
+    # Se incrementa con cada cambio de productos/configuración; versiona los exports cacheados
+    catalogo_version = Column(Integer, nullable=False, default=1)
 
     productos = relationship(
         "Producto",
@@ -24,6 +27,7 @@ class Empresa(Base):
     usuarios = relationship("Usuario", back_populates="empresa")
     leads = relationship("CatalogLead", back_populates="empresa_rel", cascade="all, delete-orphan")
     lead_events = relationship("CatalogLeadEvent", back_populates="empresa", cascade="all, delete-orphan")
+    orders = relationship("CatalogOrder", back_populates="empresa", cascade="all, delete-orphan")
 
 
 class Producto(Base):
@@ -95,6 +99,7 @@ class CatalogLead(Base):
 
     empresa_rel = relationship("Empresa", back_populates="leads")
     eventos = relationship("CatalogLeadEvent", back_populates="lead", cascade="all, delete-orphan")
+    orders = relationship("CatalogOrder", back_populates="lead")
 
 
 class CatalogLeadEvent(Base):
@@ -121,3 +126,41 @@ class CatalogLeadEvent(Base):
 
     lead = relationship("CatalogLead", back_populates="eventos")
     empresa = relationship("Empresa", back_populates="lead_events")
+
+
+class CatalogOrder(Base):
+    __tablename__ = "catalog_orders"
+    # un pedido repetido suma download_count en la fila existente (ver registrar_pedido_catalogo)
+    __table_args__ = (
+        UniqueConstraint("empresa_catalogo_id", "order_hash", name="uq_catalog_orders_empresa_hash"),
+        UniqueConstraint("access_token", name="uq_catalog_orders_access_token"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    empresa_catalogo_id = Column(
+        Integer,
+        ForeignKey("empresas.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    lead_id = Column(
+        Integer,
+        ForeignKey("catalog_leads.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
+    )
+    # sha256 del pedido normalizado (ítems + comprador + versión de catálogo); clave del PDF cacheado
+    order_hash = Column(String, nullable=False, index=True)
+    # token aleatorio de la URL pública del PDF; el hash se puede adivinar, el token no
+    access_token = Column(String, nullable=False, default=lambda: secrets.token_hex(32))
+    catalogo_version = Column(Integer, nullable=False, default=1)
+    buyer_json = Column(Text, nullable=False)
+    items_json = Column(Text, nullable=False)
+    total = Column(Float, nullable=True)
+    has_consult_price = Column(Boolean, nullable=False, default=False)
+    download_count = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc), index=True)
+    last_requested_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    empresa = relationship("Empresa", back_populates="orders")
+    lead = relationship("CatalogLead", back_populates="orders")
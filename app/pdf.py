@@ -0,0 +1,401 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+
+# ---------------------------------------------------
+# POOL ACOTADO PARA GENERAR PDFs
+# ---------------------------------------------------
+# reportlab dibuja en Python puro: si corre dentro de un endpoint async
+# bloquea el event loop del worker. Los PDFs se renderizan en un pool
+# (procesos por defecto, hilos con PDF_EXECUTOR=thread) con un límite de
+# trabajos en espera y un timeout por render.
+
+PDF_EXECUTOR_KIND = os.getenv("PDF_EXECUTOR", "process").strip().lower()
+PDF_WORKERS = max(int(os.getenv("PDF_WORKERS", "2")), 1)
+PDF_MAX_QUEUE = max(int(os.getenv("PDF_MAX_QUEUE", "8")), 0)
+PDF_TIMEOUT_SECONDS = float(os.getenv("PDF_TIMEOUT_SECONDS", "30"))
+
+
+class PdfPoolBusy(Exception):
+    pass
+
+
+class PdfRenderTimeout(Exception):
+    pass
+
+
+class PdfRenderPool:
+    def __init__(self, kind: str, workers: int, max_queue: int, timeout: float):
+        self.kind = kind if kind in {"process", "thread"} else "process"
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rendered = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.latencies_ms = deque(maxlen=512)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "thread":
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pdf")
+                else:
+                    # spawn: no se hereda el estado (hilos, conexiones) del worker web
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+            return self._executor
+
+    def _acquire_slot(self):
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PdfPoolBusy()
+            self.in_flight += 1
+
+    def _release_slot(self, _future=None):
+        with self._lock:
+            self.in_flight -= 1
+
+    def submit(self, func, *args):
+        """Encola un render y devuelve un concurrent.futures.Future (uso desde hilos)."""
+        self._acquire_slot()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except BrokenProcessPool:
+            self._release_slot()
+            self._reset_executor()
+            raise
+        # el cupo se libera cuando el trabajo termina de verdad, aunque el cliente ya no espere
+        future.add_done_callback(self._release_slot)
+        return future
+
+    async def render(self, func, *args) -> bytes:
+        started = time.perf_counter()
+        future = self.submit(func, *args)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PdfRenderTimeout()
+        except BrokenProcessPool:
+            self.errors += 1
+            self._reset_executor()
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        self.rendered += 1
+        self.latencies_ms.append((time.perf_counter() - started) * 1000)
+        return result
+
+    def wait(self, future, started: float):
+        """
+        Espera un future de submit() desde un hilo, con las mismas métricas que
+        render(). El timeout corre desde `started`: varios wait() con el mismo
+        `started` comparten un único plazo.
+        """
+        remaining = max(self.timeout - (time.perf_counter() - started), 0)
+        try:
+            result = future.result(timeout=remaining)
+        except FuturesTimeoutError:
+            self.timeouts += 1
+            raise PdfRenderTimeout()
+        except BrokenProcessPool:
+            self.errors += 1
+            self._reset_executor()
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        self.rendered += 1
+        self.latencies_ms.append((time.perf_counter() - started) * 1000)
+        return result
+
+    def _reset_executor(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self._reset_executor()
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self.latencies_ms)
+
+        def percentile(p: float):
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)], 2)
+
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "timeout_seconds": self.timeout,
+            "in_flight": self.in_flight,
+            "queue_depth": max(self.in_flight - self.workers, 0),
+            "rendered": self.rendered,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "latency_ms": {
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1], 2) if latencies else None,
+                "samples": len(latencies),
+            },
+        }
+
+
+pdf_pool = PdfRenderPool(PDF_EXECUTOR_KIND, PDF_WORKERS, PDF_MAX_QUEUE, PDF_TIMEOUT_SECONDS)
+
+# El catálogo completo va en su propio pool: un catálogo grande no debe
+# dejar sin cupo a los PDFs de pedidos, que el comprador espera en línea.
+CATALOG_PDF_WORKERS = max(int(os.getenv("CATALOG_PDF_WORKERS", "2")), 1)
+CATALOG_PDF_TIMEOUT_SECONDS = float(os.getenv("CATALOG_PDF_TIMEOUT_SECONDS", "300"))
+catalog_pdf_pool = PdfRenderPool(PDF_EXECUTOR_KIND, CATALOG_PDF_WORKERS, 256, CATALOG_PDF_TIMEOUT_SECONDS)
+
+
+def iter_bytes_chunks(data: bytes, chunk_size: int = 64 * 1024):
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+
+# ---------------------------------------------------
+# PDF DEL PEDIDO
+# ---------------------------------------------------
+def _text(value) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    text = str(value).strip()
+    return "" if text.lower() == "nan" else text
+
+
+def render_pedido_pdf(empresa: str, items: list[dict], buyer: dict) -> bytes:
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+
+    buyer_nombre = _text(buyer.get("nombre"))
+    buyer_comercio = _text(buyer.get("comercio"))
+    buyer_telefono = _text(buyer.get("telefono"))
+    buyer_direccion = _text(buyer.get("direccion"))
+    buyer_cuit = _text(buyer.get("cuit"))
+    buyer_email = _text(buyer.get("email"))
+    buyer_obs = _text(buyer.get("observaciones"))
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+
+    y = A4[1] - 40
+    x = 40
+    bottom_limit = 55
+
+    def draw_line(text: str, font: str = "Helvetica", size: int = 11, indent: int = 0, line_gap: int = 17):
+        nonlocal y
+        if y <= bottom_limit:
+            c.showPage()
+            y = A4[1] - 40
+        c.setFont(font, size)
+        c.drawString(x + indent, y, text)
+        y -= line_gap
+
+    draw_line(empresa, font="Helvetica-Bold", size=18, line_gap=30)
+
+    draw_line("Datos del comprador", font="Helvetica-Bold", size=12, line_gap=18)
+    draw_line(f"Nombre y apellido: {buyer_nombre or '-'}")
+    draw_line(f"Comercio / empresa: {buyer_comercio or '-'}")
+    draw_line(f"Teléfono: {buyer_telefono or '-'}")
+    draw_line(f"Dirección: {buyer_direccion or '-'}")
+    if buyer_cuit:
+        draw_line(f"CUIT: {buyer_cuit}")
+    if buyer_email:
+        draw_line(f"Email: {buyer_email}")
+    if buyer_obs:
+        draw_line(f"Observaciones: {buyer_obs}")
+
+    y -= 5
+    draw_line("Detalle del pedido", font="Helvetica-Bold", size=12, line_gap=18)
+
+    total = 0.0
+    has_consult_price = False
+    for item in items:
+        cantidad = item["cantidad"]
+        precio = item["precio"]
+        subtotal = precio * cantidad
+        draw_line(f'{int(cantidad)}x {item["codigo"]} - {item["descripcion"]}')
+        if item["precio_mostrable"]:
+            draw_line(f'${precio:.2f} c/u · Subtotal: ${subtotal:.2f}', indent=15, line_gap=19)
+            total += subtotal
+        else:
+            has_consult_price = True
+            draw_line(f'Precio: {item["precio_texto"] or "Consultar"}', indent=15, line_gap=19)
+
+    y -= 5
+    if has_consult_price:
+        draw_line("TOTAL ESTIMADO: Consultar", font="Helvetica-Bold", size=14, line_gap=20)
+    else:
+        draw_line(f"TOTAL ESTIMADO: ${total:.2f}", font="Helvetica-Bold", size=14, line_gap=20)
+
+    c.save()
+    return buffer.getvalue()
+
+
+# ---------------------------------------------------
+# CATÁLOGO COMPLETO IMPRIMIBLE
+# ---------------------------------------------------
+# El padre arma la lista de líneas (encabezados de categoría/marca y
+# productos), la pagina con alturas fijas y reparte rangos de páginas entre
+# los procesos del pool. Cada proceso genera las miniaturas que le faltan y
+# devuelve su tramo en PDF; al final los tramos se concatenan con pypdf.
+
+CATALOGO_PAGE_HEIGHT = 841.89  # A4 en puntos, sin importar reportlab en el web worker
+CATALOGO_PAGE_MARGIN = 36
+CATALOGO_HEADER_HEIGHT = 46
+CATALOGO_FOOTER_HEIGHT = 24
+CATALOGO_LINE_HEIGHTS = {"categoria": 28, "marca": 20, "producto": 52}
+CATALOGO_THUMB_POINTS = 44
+CATALOGO_THUMB_PIXELS = 160
+
+
+def paginate_catalogo_lines(lines: list[dict], page_height: float = CATALOGO_PAGE_HEIGHT) -> list[list[dict]]:
+    available = page_height - 2 * CATALOGO_PAGE_MARGIN - CATALOGO_HEADER_HEIGHT - CATALOGO_FOOTER_HEIGHT
+    pages = []
+    current = []
+    used = 0
+    for line in lines:
+        height = CATALOGO_LINE_HEIGHTS[line["kind"]]
+        # un encabezado no queda huérfano al pie de la página
+        if line["kind"] != "producto" and current and used + height + CATALOGO_LINE_HEIGHTS["producto"] > available:
+            pages.append(current)
+            current, used = [], 0
+        if current and used + height > available:
+            pages.append(current)
+            current, used = [], 0
+        current.append(line)
+        used += height
+    if current:
+        pages.append(current)
+    return pages or [[]]
+
+
+def ensure_thumbnail(source: str, target: str, pixels: int = CATALOGO_THUMB_PIXELS) -> str | None:
+    if os.path.exists(target):
+        return target
+    try:
+        from PIL import Image
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_target = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with Image.open(source) as image:
+            image.thumbnail((pixels, pixels))
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.save(tmp_target, "JPEG", quality=80, optimize=True)
+        os.replace(tmp_target, target)
+        return target
+    except Exception:
+        return None
+
+
+def _fit_text(text: str, font: str, size: float, max_width: float) -> str:
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    if stringWidth(text, font, size) <= max_width:
+        return text
+    while text and stringWidth(text + "…", font, size) > max_width:
+        text = text[:-1]
+    return text + "…"
+
+
+def render_catalogo_pages(title: str, pages: list[list[dict]], first_page_number: int, total_pages: int) -> bytes:
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+
+    width, height = A4
+    margin = CATALOGO_PAGE_MARGIN
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+
+    for offset, page_lines in enumerate(pages):
+        page_number = first_page_number + offset
+        c.setFont("Helvetica-Bold", 15)
+        c.drawString(margin, height - margin - 16, _fit_text(title, "Helvetica-Bold", 15, width - 2 * margin))
+        c.setLineWidth(0.5)
+        c.line(margin, height - margin - CATALOGO_HEADER_HEIGHT + 14, width - margin, height - margin - CATALOGO_HEADER_HEIGHT + 14)
+
+        y = height - margin - CATALOGO_HEADER_HEIGHT
+        for line in page_lines:
+            line_height = CATALOGO_LINE_HEIGHTS[line["kind"]]
+            if line["kind"] == "categoria":
+                c.setFont("Helvetica-Bold", 13)
+                c.drawString(margin, y - 18, _fit_text(line["texto"], "Helvetica-Bold", 13, width - 2 * margin))
+            elif line["kind"] == "marca":
+                c.setFont("Helvetica-Bold", 10)
+                c.drawString(margin + 8, y - 13, _fit_text(line["texto"], "Helvetica-Bold", 10, width - 2 * margin - 8))
+            else:
+                thumb = None
+                if line.get("source") and line.get("thumb"):
+                    thumb = ensure_thumbnail(line["source"], line["thumb"])
+                if thumb:
+                    try:
+                        c.drawImage(
+                            thumb,
+                            margin + 8,
+                            y - line_height + 4,
+                            width=CATALOGO_THUMB_POINTS,
+                            height=CATALOGO_THUMB_POINTS,
+                            preserveAspectRatio=True,
+                            anchor="c",
+                        )
+                    except Exception:
+                        pass
+                text_x = margin + 16 + CATALOGO_THUMB_POINTS
+                price_width = 110
+                text_width = width - margin - price_width - text_x
+                c.setFont("Helvetica-Bold", 10)
+                c.drawString(text_x, y - 18, _fit_text(line["codigo"], "Helvetica-Bold", 10, text_width))
+                c.setFont("Helvetica", 9)
+                c.drawString(text_x, y - 32, _fit_text(line["descripcion"], "Helvetica", 9, text_width))
+                if line.get("stock_texto"):
+                    c.setFont("Helvetica-Oblique", 8)
+                    c.drawString(text_x, y - 44, line["stock_texto"])
+                c.setFont("Helvetica-Bold", 11)
+                c.drawRightString(width - margin, y - 24, line["precio_texto"])
+            y -= line_height
+
+        c.setFont("Helvetica", 8)
+        c.drawRightString(width - margin, margin - 10, f"Página {page_number} de {total_pages}")
+        c.showPage()
+
+    c.save()
+    return buffer.getvalue()
+
+
+def merge_pdf_parts(parts: list[bytes], target: str):
+    if len(parts) == 1:
+        with open(target, "wb") as f:
+            f.write(parts[0])
+        return
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(BytesIO(part))
+    with open(target, "wb") as f:
+        writer.write(f)
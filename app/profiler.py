@@ -0,0 +1,120 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+
+# ---------------------------------------------------
+# PERFILADOR DE CPU POR MUESTREO
+# ---------------------------------------------------
+# Cada `interval` segundos se leen los stacks de todos los hilos del worker
+# con sys._current_frames() y se cuentan como "collapsed stacks" (formato de
+# flamegraph.pl / speedscope: `hilo;raiz;...;hoja N`). No instrumenta el
+# código: el costo es proporcional a hilos x profundidad por muestra, y el
+# intervalo mínimo y la duración máxima lo acotan. Un solo perfil a la vez.
+
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+PROFILER_MIN_INTERVAL_MS = float(os.getenv("PROFILER_MIN_INTERVAL_MS", "5"))
+PROFILER_MAX_DEPTH = 128
+
+# hojas de hilos dormidos (esperando trabajo, I/O o un lock): ruido en el flamegraph
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("socket.py", "accept"),
+    ("socket.py", "readinto"),
+    ("ssl.py", "read"),
+}
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(code) -> str:
+    path = Path(code.co_filename)
+    # app/main.py, starlette/routing.py: el módulo se reconoce sin la ruta absoluta
+    short = "/".join(path.parts[-2:]) if len(path.parts) > 1 else path.name
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+def _collapse(frame, thread_name: str, include_idle: bool) -> str | None:
+    leaf = frame.f_code
+    if not include_idle and (Path(leaf.co_filename).name, leaf.co_name) in IDLE_LEAVES:
+        return None
+    labels = []
+    while frame is not None and len(labels) < PROFILER_MAX_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(f"hilo:{thread_name}")
+    labels.reverse()
+    # ";" separa frames en el formato collapsed
+    return ";".join(label.replace(";", ":") for label in labels)
+
+
+def sample_stacks(seconds: float, interval_ms: float = 10, include_idle: bool = False) -> dict:
+    """Muestrea los stacks del worker durante `seconds` y devuelve conteos por stack."""
+    seconds = min(max(seconds, 0.1), PROFILER_MAX_SECONDS)
+    interval = max(interval_ms, PROFILER_MIN_INTERVAL_MS) / 1000
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        own_thread = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        sampling_time = 0.0
+        started = time.perf_counter()
+        deadline = started + seconds
+        while True:
+            sample_started = time.perf_counter()
+            if sample_started >= deadline:
+                break
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stack = _collapse(frame, names.get(thread_id, str(thread_id)), include_idle)
+                if stack:
+                    stacks[stack] += 1
+            samples += 1
+            elapsed = time.perf_counter() - sample_started
+            sampling_time += elapsed
+            time.sleep(max(interval - elapsed, 0))
+        wall = time.perf_counter() - started
+        return {
+            "stacks": stacks,
+            "samples": samples,
+            "seconds": round(wall, 3),
+            "interval_ms": round(interval * 1000, 2),
+            # fracción de un núcleo usada por el propio muestreo
+            "overhead": round(sampling_time / wall, 4) if wall else 0.0,
+        }
+    finally:
+        _profile_lock.release()
+
+
+def format_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def top_functions(stacks: Counter, limit: int = 30) -> list[dict]:
+    """Tiempo propio (hoja del stack) e inclusivo por función, en muestras."""
+    own = Counter()
+    inclusive = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")[1:]
+        if not frames:
+            continue
+        own[frames[-1]] += count
+        for label in set(frames):
+            inclusive[label] += count
+    return [
+        {"function": label, "own": count, "inclusive": inclusive[label]}
+        for label, count in own.most_common(limit)
+    ]
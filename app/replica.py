@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+from app.cache_bus import tenant_cache
+from app.metrics import metrics
+
+
+# ---------------------------------------------------
+# TOLERANCIA AL LAG DE LA RÉPLICA
+# ---------------------------------------------------
+# La réplica puede ir unos segundos atrás del primario. Una sesión de lectura
+# pasa al primario si:
+#   - la empresa se modificó en este worker hace menos de REPLICA_STICKY_SECONDS
+#     (una importación o edición recién hecha se ve enseguida);
+#   - la catalogo_version leída en la réplica es menor que la última que
+#     anunció el cache bus para esa empresa (cambios hechos en otro worker).
+# Lo que no versiona catalogo_version (un lead recién creado) se reintenta en
+# el primario cuando la réplica no lo encuentra (ver get_active_catalog_lead).
+
+REPLICA_STICKY_SECONDS = max(float(os.getenv("REPLICA_STICKY_SECONDS", "30")), 0.0)
+
+replica_fallbacks = metrics.counter(
+    "catalogo_replica_fallbacks", "Sesiones de lectura que pasaron al primario, por motivo.", ("reason",)
+)
+
+_recent_writes: dict[int, float] = {}
+_recent_writes_lock = threading.Lock()
+
+
+def note_empresa_write(db, empresa_id: int):
+    """Marca la empresa como recién escrita cuando la sesión `db` haga commit."""
+    db.info.setdefault("replica_written", set()).add(empresa_id)
+
+
+def install_replica_tracking(session_factory):
+    @event.listens_for(session_factory, "after_commit")
+    def _after_commit(session):
+        written = session.info.pop("replica_written", None)
+        if not written:
+            return
+        deadline = time.monotonic() + REPLICA_STICKY_SECONDS
+        with _recent_writes_lock:
+            for empresa_id in written:
+                _recent_writes[empresa_id] = deadline
+
+    @event.listens_for(session_factory, "after_rollback")
+    def _after_rollback(session):
+        session.info.pop("replica_written", None)
+
+
+def recently_written(empresa_id: int) -> bool:
+    with _recent_writes_lock:
+        deadline = _recent_writes.get(empresa_id)
+        if deadline is None:
+            return False
+        if deadline < time.monotonic():
+            del _recent_writes[empresa_id]
+            return False
+        return True
+
+
+def fallback_to_primary(db, reason: str) -> bool:
+    """Pasa la sesión al primario si leía de la réplica; True si cambió."""
+    use_primary = getattr(db, "use_primary", None)
+    if use_primary is None or not use_primary():
+        return False
+    replica_fallbacks.inc(reason=reason)
+    return True
+
+
+def ensure_fresh_empresa(db, empresa):
+    """
+    Devuelve la empresa leída de un lugar suficientemente actualizado: si la
+    réplica está atrasada para esta empresa, la vuelve a leer del primario.
+    """
+    if empresa is None or not getattr(db, "reads_from_replica", False):
+        return empresa
+    if recently_written(empresa.id):
+        reason = "escritura_reciente"
+    elif (empresa.catalogo_version or 1) < tenant_cache.latest_version(empresa.id):
+        reason = "version_atrasada"
+    else:
+        return empresa
+    fallback_to_primary(db, reason)
+    db.expunge(empresa)
+    return db.get(type(empresa), empresa.id)
@@ -0,0 +1,174 @@
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from app.asgi import route_label
+
+
+# ---------------------------------------------------
+# REQUESTS LENTOS Y DETECTOR DE N+1
+# ---------------------------------------------------
+# Cada request junta sus statements SQL (texto con placeholders, nunca los
+# parámetros) y su duración. Se guarda en un ring buffer acotado si tardó más
+# de SLOW_REQUEST_MS o si repitió la misma huella de SQL al menos
+# SLOW_REQUEST_REPEAT_THRESHOLD veces (típico N+1: un SELECT por fila).
+
+SLOW_REQUEST_ENABLED = os.getenv("SLOW_REQUEST_ENABLED", "1").strip().lower() not in {"0", "false", "no"}
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+SLOW_REQUEST_REPEAT_THRESHOLD = max(int(os.getenv("SLOW_REQUEST_REPEAT_THRESHOLD", "20")), 2)
+SLOW_REQUEST_BUFFER = max(int(os.getenv("SLOW_REQUEST_BUFFER", "100")), 1)
+SLOW_REQUEST_MAX_STATEMENTS = max(int(os.getenv("SLOW_REQUEST_MAX_STATEMENTS", "200")), 0)
+SQL_TEXT_LIMIT = 1000
+
+_current_capture: contextvars.ContextVar[dict | None] = contextvars.ContextVar("slow_request_capture", default=None)
+
+_SQL_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER_RE = re.compile(r"\b\d+\b")
+_SQL_PLACEHOLDER_RE = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+")
+_SQL_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SQL_SPACES_RE = re.compile(r"\s+")
+
+
+def fingerprint_sql(statement: str) -> str:
+    """Huella del statement: literales, números, placeholders y listas IN (...) colapsados."""
+    statement = _SQL_LITERAL_RE.sub("?", statement)
+    statement = _SQL_PLACEHOLDER_RE.sub("?", statement)
+    statement = _SQL_NUMBER_RE.sub("?", statement)
+    statement = _SQL_IN_LIST_RE.sub("(?)", statement)
+    return _SQL_SPACES_RE.sub(" ", statement).strip()
+
+
+class SlowRequestLog:
+    def __init__(self, maxlen: int):
+        self._entries = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def record(self, entry: dict):
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+
+    def snapshot(self, limit: int | None = None) -> list[dict]:
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+slow_request_log = SlowRequestLog(SLOW_REQUEST_BUFFER)
+
+
+def install_sql_capture(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        capture = _current_capture.get()
+        if capture is not None:
+            conn.info.setdefault("slow_request_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        capture = _current_capture.get()
+        started = conn.info.get("slow_request_started")
+        if capture is None or not started:
+            return
+        elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+        capture["db_ms"] += elapsed_ms
+        capture["queries"] += 1
+        fingerprint = fingerprint_sql(statement)
+        stats = capture["fingerprints"].get(fingerprint)
+        if stats is None:
+            stats = capture["fingerprints"][fingerprint] = {"count": 0, "total_ms": 0.0}
+        stats["count"] += 1
+        stats["total_ms"] += elapsed_ms
+        if len(capture["statements"]) < SLOW_REQUEST_MAX_STATEMENTS:
+            capture["statements"].append(
+                {"sql": statement[:SQL_TEXT_LIMIT], "ms": round(elapsed_ms, 3), "executemany": bool(executemany)}
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if context.connection is not None:
+            started = context.connection.info.get("slow_request_started")
+            if started:
+                started.pop()
+
+
+def build_slow_entry(scope, status: int, duration_ms: float, capture: dict) -> dict | None:
+    repeated = sorted(
+        (
+            {"fingerprint": fingerprint[:SQL_TEXT_LIMIT], "count": stats["count"], "total_ms": round(stats["total_ms"], 2)}
+            for fingerprint, stats in capture["fingerprints"].items()
+            if stats["count"] > 1
+        ),
+        key=lambda item: item["count"],
+        reverse=True,
+    )
+    reasons = []
+    if duration_ms >= SLOW_REQUEST_MS:
+        reasons.append("lento")
+    if repeated and repeated[0]["count"] >= SLOW_REQUEST_REPEAT_THRESHOLD:
+        reasons.append("n+1")
+    if not reasons:
+        return None
+    return {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "reasons": reasons,
+        "method": scope.get("method", ""),
+        "route": route_label(scope),
+        "path": scope.get("path", ""),
+        "status": status,
+        "duration_ms": round(duration_ms, 2),
+        "db_ms": round(capture["db_ms"], 2),
+        "queries": capture["queries"],
+        "repeated": repeated[:20],
+        "statements": capture["statements"],
+        "statements_truncated": capture["queries"] > len(capture["statements"]),
+    }
+
+
+class SlowRequestMiddleware:
+    def __init__(self, app, log: SlowRequestLog = slow_request_log):
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SLOW_REQUEST_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        capture = {"queries": 0, "db_ms": 0.0, "fingerprints": {}, "statements": []}
+        token = _current_capture.set(capture)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_capture.reset(token)
+            entry = build_slow_entry(scope, status[0], (time.perf_counter() - started) * 1000, capture)
+            if entry:
+                self.log.record(entry)
+                print(
+                    "[slow]",
+                    ",".join(entry["reasons"]),
+                    entry["method"],
+                    entry["path"],
+                    f"{entry['duration_ms']}ms",
+                    f"queries={entry['queries']}",
+                )
@@ -0,0 +1,126 @@
+import contextvars
+import json
+import os
+import time
+import unicodedata
+from contextlib import contextmanager
+
+from app.asgi import route_label
+
+
+# ---------------------------------------------------
+# SERVER-TIMING POR REQUEST
+# ---------------------------------------------------
+# Los handlers marcan etapas con `with span("render"):` y el middleware las
+# devuelve en el header Server-Timing (visible en la pestaña Network de las
+# devtools), junto con el total y el tiempo acumulado en la base (db).
+# Las etapas pueden solaparse con db: una consulta cuenta en las dos.
+# SERVER_TIMING_LOG=1 además escribe una línea JSON por request.
+
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "1").strip().lower() not in {"0", "false", "no"}
+SERVER_TIMING_LOG = os.getenv("SERVER_TIMING_LOG", "").strip().lower() in {"1", "true", "yes"}
+
+_current_timings: contextvars.ContextVar[dict | None] = contextvars.ContextVar("server_timing", default=None)
+
+
+def add_timing(name: str, duration_ms: float, description: str | None = None):
+    timings = _current_timings.get()
+    if timings is None:
+        return
+    entry = timings["spans"].get(name)
+    if entry is None:
+        entry = timings["spans"][name] = {"dur": 0.0, "desc": description}
+    entry["dur"] += duration_ms
+
+
+@contextmanager
+def span(name: str, description: str | None = None):
+    """Mide una etapa del request; fuera de un request (o deshabilitado) no hace nada."""
+    if _current_timings.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, (time.perf_counter() - started) * 1000, description)
+
+
+def install_db_timing(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current_timings.get() is not None:
+            conn.info.setdefault("server_timing_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        timings = _current_timings.get()
+        started = conn.info.get("server_timing_started")
+        if timings is None or not started:
+            return
+        timings["db_ms"] += (time.perf_counter() - started.pop()) * 1000
+        timings["queries"] += 1
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if context.connection is not None:
+            started = context.connection.info.get("server_timing_started")
+            if started:
+                started.pop()
+
+
+def _quote_description(description: str) -> str:
+    # los headers HTTP son ASCII: "categorías" se manda como "categorias"
+    ascii_text = unicodedata.normalize("NFKD", description).encode("ascii", "ignore").decode("ascii")
+    return '"' + ascii_text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def format_server_timing(timings: dict, total_ms: float) -> str:
+    parts = [f"total;dur={total_ms:.1f}"]
+    if timings["queries"]:
+        queries = _quote_description(f"{timings['queries']} queries")
+        parts.append(f"db;desc={queries};dur={timings['db_ms']:.1f}")
+    for name, entry in timings["spans"].items():
+        description = f";desc={_quote_description(entry['desc'])}" if entry["desc"] else ""
+        parts.append(f"{name}{description};dur={entry['dur']:.1f}")
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SERVER_TIMING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = {"spans": {}, "db_ms": 0.0, "queries": 0}
+        token = _current_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - started) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", format_server_timing(timings, total_ms).encode("ascii", "replace")))
+                message = {**message, "headers": headers}
+                if SERVER_TIMING_LOG:
+                    print(json.dumps({
+                        "event": "server_timing",
+                        "method": scope.get("method", ""),
+                        "route": route_label(scope),
+                        "status": message["status"],
+                        "total_ms": round(total_ms, 2),
+                        "db_ms": round(timings["db_ms"], 2),
+                        "queries": timings["queries"],
+                        "spans": {name: round(entry["dur"], 2) for name, entry in timings["spans"].items()},
+                    }, ensure_ascii=False))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_timings.reset(token)
@@ -0,0 +1,91 @@
+import os
+import uuid
+from pathlib import Path
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+
+# ---------------------------------------------------
+# SUBIDA DE IMÁGENES POR STREAMING
+# ---------------------------------------------------
+# El archivo subido se copia de a UPLOAD_CHUNK_BYTES a un temporal en la misma
+# carpeta de destino (mismo filesystem, así os.replace es atómico), cortando
+# apenas supera UPLOAD_MAX_IMAGE_BYTES. Pillow confirma que es una imagen de un
+# formato permitido y recién ahí el temporal reemplaza al archivo final: quien
+# lee /media nunca ve una imagen a medio escribir. La extensión final sale del
+# formato detectado, no del nombre que mandó el navegador.
+
+UPLOAD_CHUNK_BYTES = max(int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024))), 64 * 1024)
+UPLOAD_MAX_IMAGE_BYTES = int(os.getenv("UPLOAD_MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+TEMP_SUFFIX = ".uploading"
+
+IMAGE_FORMAT_EXTENSIONS = {
+    "PNG": ".png",
+    "JPEG": ".jpg",
+    "WEBP": ".webp",
+    "GIF": ".gif",
+}
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+def is_temp_upload(path: Path) -> bool:
+    return path.name.startswith(".") and path.name.endswith(TEMP_SUFFIX)
+
+
+def detect_image_extension(path: Path) -> str:
+    """Extensión según el contenido; UploadRejected si Pillow no lo reconoce."""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            image.verify()
+    except Exception as exc:
+        raise UploadRejected("El archivo no es una imagen válida.") from exc
+    extension = IMAGE_FORMAT_EXTENSIONS.get(image_format or "")
+    if not extension:
+        raise UploadRejected(f"Formato de imagen no permitido ({image_format}).")
+    return extension
+
+
+async def save_image_upload(
+    upload: UploadFile,
+    target_dir: Path,
+    stem: str,
+    max_bytes: int = UPLOAD_MAX_IMAGE_BYTES,
+) -> Path:
+    """
+    Guarda `upload` como target_dir/<stem><ext> y devuelve la ruta final.
+    Si algo falla el temporal se borra y el archivo anterior queda intacto.
+    """
+    # todo el I/O de disco va al threadpool: un chunk escrito en el event loop
+    # frena a los demás requests del worker
+    await run_in_threadpool(target_dir.mkdir, parents=True, exist_ok=True)
+    tmp_path = target_dir / f".{stem}.{uuid.uuid4().hex}{TEMP_SUFFIX}"
+    try:
+        written = 0
+        tmp = await run_in_threadpool(open, tmp_path, "wb")
+        try:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadRejected(f"La imagen supera el máximo de {round(max_bytes / 1024 / 1024, 1):g} MB.")
+                await run_in_threadpool(tmp.write, chunk)
+        finally:
+            await run_in_threadpool(tmp.close)
+        if not written:
+            raise UploadRejected("El archivo está vacío.")
+        extension = await run_in_threadpool(detect_image_extension, tmp_path)
+        final_path = target_dir / f"{stem}{extension}"
+        await run_in_threadpool(os.replace, tmp_path, final_path)
+        return final_path
+    except BaseException:
+        await run_in_threadpool(tmp_path.unlink, missing_ok=True)
+        raise
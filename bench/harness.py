@@ -0,0 +1,328 @@
+"""
+Piezas comunes de los benchmarks: servidor uvicorn en un hilo del mismo
+proceso, cliente HTTP mínimo con cookies (stdlib, sin httpx) y contador de
+queries/filas por request enganchado a los eventos del engine.
+
+Importar este módulo NO importa la app: primero hay que fijar DATABASE_URL
+y STORAGE_DIR (configure_env) y recién después `load_app()`.
+"""
+import contextvars
+import http.client
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+QUERY_HEADER = "x-bench-queries"
+ROWS_HEADER = "x-bench-rows"
+
+_request_stats: contextvars.ContextVar[dict | None] = contextvars.ContextVar("bench_request_stats", default=None)
+
+
+def configure_env(database_url: str | None, storage_dir: str):
+    if database_url:
+        os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{Path(storage_dir).parent / 'bench.db'}")
+    os.environ["STORAGE_DIR"] = storage_dir
+    # los benchmarks no deben pelear por el pool de PDFs del sistema
+    os.environ.setdefault("PDF_WORKERS", "2")
+
+
+def cleanup_static_exports(slug_prefix: str):
+    # catalogo() publica lista_precios.* en app/static/empresas/<slug> del árbol real
+    import shutil
+
+    exports_dir = ROOT / "app" / "static" / "empresas"
+    if exports_dir.exists():
+        for path in exports_dir.glob(f"{slug_prefix}*"):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load_app():
+    os.chdir(ROOT)  # la app resuelve app/static y app/templates relativo al cwd
+    import app.main as main
+
+    return main
+
+
+# ---------------------------------------------------
+# CONTADOR DE QUERIES Y FILAS
+# ---------------------------------------------------
+def _count_row(stats: dict | None):
+    if stats is not None:
+        stats["rows"] += 1
+
+
+def _wrap_sqlite_rows(dbapi_connection):
+    def row_factory(cursor, row):
+        _count_row(_request_stats.get())
+        return row
+
+    dbapi_connection.row_factory = row_factory
+
+
+def _wrap_psycopg2_rows(dbapi_connection):
+    import psycopg2.extensions
+
+    class CountingCursor(psycopg2.extensions.cursor):
+        def fetchone(self):
+            row = super().fetchone()
+            if row is not None:
+                _count_row(_request_stats.get())
+            return row
+
+        def fetchmany(self, size=None):
+            rows = super().fetchmany(size) if size is not None else super().fetchmany()
+            stats = _request_stats.get()
+            if stats is not None:
+                stats["rows"] += len(rows)
+            return rows
+
+        def fetchall(self):
+            rows = super().fetchall()
+            stats = _request_stats.get()
+            if stats is not None:
+                stats["rows"] += len(rows)
+            return rows
+
+    dbapi_connection.cursor_factory = CountingCursor
+
+
+def install_query_counter(engine):
+    """Cuenta queries (before_cursor_execute) y filas leídas en el request actual."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        stats = _request_stats.get()
+        if stats is not None:
+            stats["queries"] += 1
+            if stats.get("statements") is not None:
+                stats["statements"].append(statement)
+
+    if engine.dialect.is_async:
+        # los adaptadores async de SQLAlchemy traen todas las filas al ejecutar
+        # (cursor._rows), en la tarea del request: se cuentan ahí
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            stats = _request_stats.get()
+            if stats is not None:
+                stats["rows"] += len(getattr(cursor, "_rows", None) or ())
+
+        return
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, _record):
+        if engine.dialect.name == "sqlite":
+            _wrap_sqlite_rows(dbapi_connection)
+        elif engine.dialect.driver == "psycopg2":
+            _wrap_psycopg2_rows(dbapi_connection)
+
+    # conexiones que ya estaban abiertas (p. ej. las del arranque)
+    engine.dispose()
+
+
+class CountingMiddleware:
+    """Envuelve la app ASGI y devuelve el conteo en headers de la respuesta."""
+
+    def __init__(self, app, capture_statements: bool = False):
+        self.app = app
+        self.capture_statements = capture_statements
+        self.last_statements: dict[str, list[str]] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = {"queries": 0, "rows": 0, "statements": [] if self.capture_statements else None}
+        token = _request_stats.set(stats)
+        request_id = uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((QUERY_HEADER.encode(), str(stats["queries"]).encode()))
+                headers.append((ROWS_HEADER.encode(), str(stats["rows"]).encode()))
+                headers.append((b"x-bench-request", request_id.encode()))
+                message = {**message, "headers": headers}
+                if self.capture_statements:
+                    self.last_statements[request_id] = stats["statements"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+
+
+# ---------------------------------------------------
+# SERVIDOR EN HILO
+# ---------------------------------------------------
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(asgi_app, threads: int = 40):
+    import anyio.to_thread
+    import uvicorn
+
+    port = _free_port()
+    config = uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+
+    async def serve():
+        # mismo tope de hilos que un worker real (40 por defecto en anyio)
+        anyio.to_thread.current_default_thread_limiter().total_tokens = threads
+        await server.serve()
+
+    thread = threading.Thread(target=lambda: anyio.run(serve), daemon=True)
+    thread.start()
+    deadline = time.time() + 60
+    while not server.started:
+        if not thread.is_alive() or time.time() > deadline:
+            raise RuntimeError("no arrancó el servidor de benchmark")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server, thread
+
+
+def stop_server(server, thread):
+    server.should_exit = True
+    thread.join(timeout=30)
+
+
+# ---------------------------------------------------
+# CLIENTE HTTP
+# ---------------------------------------------------
+class Response:
+    def __init__(self, status: int, headers: dict, body: bytes, elapsed: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.elapsed = elapsed
+
+    @property
+    def queries(self) -> int | None:
+        value = self.headers.get(QUERY_HEADER)
+        return int(value) if value is not None else None
+
+    @property
+    def rows(self) -> int | None:
+        value = self.headers.get(ROWS_HEADER)
+        return int(value) if value is not None else None
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class Client:
+    """Un cliente = una conexión keep-alive + su cookie de sesión."""
+
+    def __init__(self, base_url: str, timeout: float = 120):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.https = parts.scheme == "https"
+        self.timeout = timeout
+        self.cookies: dict[str, str] = {}
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            factory = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self._conn = factory(self.host, self.port, timeout=self.timeout)
+        return self._conn
+
+    def request(self, method: str, path: str, body: bytes | None = None, headers: dict | None = None) -> Response:
+        headers = dict(headers or {})
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{key}={value}" for key, value in self.cookies.items())
+        started = time.perf_counter()
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                raw = conn.getresponse()
+                payload = raw.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt:
+                    raise
+        elapsed = time.perf_counter() - started
+        for key, value in raw.getheaders():
+            if key.lower() == "set-cookie":
+                name, _, rest = value.partition("=")
+                self.cookies[name.strip()] = rest.split(";", 1)[0]
+        return Response(raw.status, {key.lower(): value for key, value in raw.getheaders()}, payload, elapsed)
+
+    def get(self, path: str, headers: dict | None = None) -> Response:
+        return self.request("GET", path, headers=headers)
+
+    def post_form(self, path: str, data: dict) -> Response:
+        from urllib.parse import urlencode
+
+        return self.request(
+            "POST",
+            path,
+            body=urlencode(data).encode(),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+
+    def post_json(self, path: str, payload) -> Response:
+        return self.request("POST", path, body=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+
+    def post_multipart(self, path: str, fields: dict, files: dict) -> Response:
+        boundary = uuid.uuid4().hex
+        chunks = []
+        for name, value in fields.items():
+            chunks.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            )
+        for name, (filename, content, content_type) in files.items():
+            chunks.append(
+                (
+                    f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                    f"Content-Type: {content_type}\r\n\r\n"
+                ).encode()
+                + content
+                + b"\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n".encode())
+        return self.request(
+            "POST",
+            path,
+            body=b"".join(chunks),
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        )
+
+    def login(self, username: str, password: str) -> Response:
+        return self.post_form("/login", {"username": username, "password": password})
+
+    def enter_catalog(self, slug: str, email: str) -> Response:
+        return self.post_form(
+            f"/catalogo/{slug}/acceso",
+            {"nombre": "Cliente Bench", "empresa_nombre": "Bench SA", "email": email},
+        )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def percentile(sorted_values: list[float], p: float):
+    if not sorted_values:
+        return None
+    index = min(int(round((len(sorted_values) - 1) * p)), len(sorted_values) - 1)
+    return sorted_values[index]
@@ -0,0 +1,239 @@
+"""
+Micro-benchmarks de los helpers puros que corren miles de veces por request
+(listado de leads, render del catálogo, carga de Excel).
+
+Estilo pyperf: calibra la cantidad de loops para que cada muestra dure al
+menos --min-time, descarta corridas de calentamiento y reporta media,
+desvío y mediana por llamada. Las entradas salen de distribuciones fijas
+(semilla) parecidas a las de una empresa grande.
+
+    python bench/micro.py                      # compara contra bench/baselines/micro.json
+    python bench/micro.py --save-baseline      # actualiza la línea base
+    python bench/micro.py --only clean_text,get_lead_priority --samples 30
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "micro.json"
+INPUT_SIZE = 1000
+# un cambio menor a esto (o dentro de 2 desvíos) se informa como "sin cambios"
+SIGNIFICANT_CHANGE = 0.05
+
+
+def load_helpers():
+    tmp = tempfile.mkdtemp(prefix="catalogo-micro-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/micro.db")
+    os.environ.setdefault("STORAGE_DIR", f"{tmp}/storage")
+    sys.path.insert(0, str(ROOT))
+    os.chdir(ROOT)
+    import app.main as main
+
+    return main
+
+
+# ---------------------------------------------------
+# ENTRADAS REALISTAS
+# ---------------------------------------------------
+def build_inputs(main, rng: random.Random) -> dict:
+    now = datetime.now(timezone.utc)
+
+    def cell():
+        # celdas de Excel: mayoría strings con espacios, algunos números y vacíos
+        kind = rng.random()
+        if kind < 0.55:
+            return f"  Repuesto {rng.randint(1, 99999)} {rng.choice(['Bosch', 'SKF', 'NGK'])} "
+        if kind < 0.75:
+            return rng.randint(1, 100000)
+        if kind < 0.85:
+            return round(rng.uniform(1, 50000), 2)
+        if kind < 0.95:
+            return float("nan")
+        return None
+
+    def price():
+        kind = rng.random()
+        if kind < 0.85:
+            return round(rng.lognormvariate(8, 1), 2)
+        if kind < 0.92:
+            return 0.0
+        if kind < 0.97:
+            return None
+        return "abc"
+
+    def activity():
+        if rng.random() < 0.05:
+            return None
+        return now - timedelta(seconds=rng.expovariate(1 / 86400 / 3))
+
+    counts = [
+        (
+            int(rng.expovariate(0.3)),
+            int(rng.expovariate(0.2)),
+            int(rng.expovariate(0.8)),
+            rng.random() < 0.15,
+            rng.random() < 0.1,
+        )
+        for _ in range(INPUT_SIZE)
+    ]
+    return {
+        "cells": [cell() for _ in range(INPUT_SIZE)],
+        "prices": [(rng.choice(["automatico", "automatico", "mostrar", "consultar"]), price()) for _ in range(INPUT_SIZE)],
+        "stocks": [(rng.choice(["mostrar", "mostrar", "automatico", "ocultar"]), rng.choice([0, 3, 20, 90, None, "7"])) for _ in range(INPUT_SIZE)],
+        "codigos": [
+            rng.choice(["FIL-", "FRE ", "amort/", "NGK.", "Ñ-"]) + str(rng.randint(1, 99999)) + rng.choice(["", "/A", " B", "#2"])
+            for _ in range(INPUT_SIZE)
+        ],
+        "dates": [activity() for _ in range(INPUT_SIZE)],
+        "lead_counts": counts,
+        "leads": [
+            {
+                "lead_status": rng.choices(["nuevo", "contactado", "oportunidad", "archivado"], [60, 20, 12, 8])[0],
+                "interest": main.compute_lead_interest(*counts[i]),
+                "last_activity_at": activity(),
+                "created_at": activity(),
+                "cart_add_count": counts[i][2],
+                "has_whatsapp_click": counts[i][3],
+                "has_pdf_download": counts[i][4],
+                "has_notes": rng.random() < 0.1,
+            }
+            for i in range(INPUT_SIZE)
+        ],
+    }
+
+
+def build_benchmarks(main, inputs: dict) -> dict:
+    cells = inputs["cells"]
+    prices = inputs["prices"]
+    stocks = inputs["stocks"]
+    codigos = inputs["codigos"]
+    dates = inputs["dates"]
+    lead_counts = inputs["lead_counts"]
+    leads = inputs["leads"]
+
+    # cada función recorre las INPUT_SIZE entradas: el tiempo se divide por ese número
+    return {
+        "clean_text": lambda: [main.clean_text(value) for value in cells],
+        "clean_price": lambda: [main.clean_price(value) for value in cells],
+        "clean_stock": lambda: [main.clean_stock(value) for value in cells],
+        "resolve_price_display": lambda: [main.resolve_price_display(policy, value) for policy, value in prices],
+        "resolve_stock_display": lambda: [main.resolve_stock_display(policy, value) for policy, value in stocks],
+        "sanitize_codigo_for_filename": lambda: [main.sanitize_codigo_for_filename(codigo) for codigo in codigos],
+        "format_human_time_ago": lambda: [main.format_human_time_ago(value) for value in dates],
+        "compute_lead_interest": lambda: [main.compute_lead_interest(*args) for args in lead_counts],
+        "get_lead_priority": lambda: [main.get_lead_priority(**kwargs) for kwargs in leads],
+    }
+
+
+# ---------------------------------------------------
+# MEDICIÓN
+# ---------------------------------------------------
+def calibrate(func, min_time: float) -> int:
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        if time.perf_counter() - started >= min_time:
+            return loops
+        loops *= 2
+
+
+def measure(func, samples: int, warmups: int, min_time: float) -> dict:
+    loops = calibrate(func, min_time)
+    values = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for index in range(warmups + samples):
+            started = time.perf_counter()
+            for _ in range(loops):
+                func()
+            elapsed = time.perf_counter() - started
+            if index >= warmups:
+                values.append(elapsed / (loops * INPUT_SIZE) * 1e9)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        "ns_per_call": {
+            "mean": round(statistics.fmean(values), 2),
+            "stdev": round(statistics.stdev(values), 2) if len(values) > 1 else 0.0,
+            "median": round(statistics.median(values), 2),
+            "min": round(min(values), 2),
+        },
+        "loops": loops,
+        "samples": samples,
+    }
+
+
+def compare(name: str, current: dict, baseline: dict | None) -> str:
+    if not baseline:
+        return f"{name:<30} {current['ns_per_call']['mean']:>10.1f} ns   (sin línea base)"
+    before = baseline["ns_per_call"]
+    after = current["ns_per_call"]
+    change = (after["mean"] - before["mean"]) / before["mean"] if before["mean"] else 0.0
+    noise = 2 * max(before["stdev"], after["stdev"])
+    if abs(change) < SIGNIFICANT_CHANGE or abs(after["mean"] - before["mean"]) <= noise:
+        verdict = "sin cambios"
+    else:
+        verdict = "más rápido" if change < 0 else "MÁS LENTO"
+    return f"{name:<30} {before['mean']:>10.1f} -> {after['mean']:>10.1f} ns  {change:+7.1%}  {verdict}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--warmups", type=int, default=3)
+    parser.add_argument("--min-time", type=float, default=0.05, help="segundos mínimos por muestra")
+    parser.add_argument("--only", help="helpers separados por coma")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--json", action="store_true", help="imprime el resultado completo en JSON")
+    args = parser.parse_args()
+
+    main_module = load_helpers()
+    benchmarks = build_benchmarks(main_module, build_inputs(main_module, random.Random(args.seed)))
+    if args.only:
+        wanted = {name.strip() for name in args.only.split(",")}
+        benchmarks = {name: func for name, func in benchmarks.items() if name in wanted}
+
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+    results = {}
+    for name, func in benchmarks.items():
+        results[name] = measure(func, args.samples, args.warmups, args.min_time)
+        print(compare(name, results[name], baseline.get("benchmarks", {}).get(name)), file=sys.stderr)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "seed": args.seed,
+            "input_size": INPUT_SIZE,
+        },
+        "benchmarks": results,
+    }
+    if args.save_baseline:
+        merged = {**baseline.get("benchmarks", {}), **results}
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps({**report, "benchmarks": merged}, indent=2) + "\n", encoding="utf-8")
+        print(f"línea base guardada en {baseline_path}", file=sys.stderr)
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
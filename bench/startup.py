@@ -0,0 +1,101 @@
+"""
+Benchmark de arranque de un worker: tiempo de `import app.main`, tiempo de
+precompilar las plantillas y RSS máximo del proceso.
+
+Cada corrida es un proceso nuevo (como un worker de gunicorn recién creado).
+Uso:
+    python bench/startup.py                         # 5 corridas, imprime JSON
+    python bench/startup.py --runs 10 --save antes.json
+    python bench/startup.py --baseline antes.json   # agrega la diferencia
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = r"""
+import json, resource, sys, time
+t0 = time.perf_counter()
+import app.main as main
+t1 = time.perf_counter()
+compiled = main.precompile_templates() if hasattr(main, "precompile_templates") else 0
+t2 = time.perf_counter()
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+heavy = [name for name in ("pandas", "numpy", "reportlab", "openpyxl", "PIL", "pypdf") if name in sys.modules]
+print(json.dumps({
+    "import_s": t1 - t0,
+    "templates_s": t2 - t1,
+    "templates": compiled,
+    "rss_mb": rss_kb / 1024 if sys.platform != "darwin" else rss_kb / 1024 / 1024,
+    "heavy_modules": heavy,
+}))
+"""
+
+
+def run_once(env: dict) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples: list[dict]) -> dict:
+    def stats(key: str) -> dict:
+        values = sorted(sample[key] for sample in samples)
+        return {
+            "min": round(values[0], 4),
+            "median": round(statistics.median(values), 4),
+            "max": round(values[-1], 4),
+        }
+
+    return {
+        "runs": len(samples),
+        "import_s": stats("import_s"),
+        "templates_s": stats("templates_s"),
+        "rss_mb": stats("rss_mb"),
+        "templates": samples[-1]["templates"],
+        "heavy_modules": samples[-1]["heavy_modules"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--save", help="guarda el resultado como línea base")
+    parser.add_argument("--baseline", help="compara contra un resultado guardado con --save")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        # el import no abre conexiones: alcanza con una URL válida
+        env.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        env.setdefault("STORAGE_DIR", f"{tmp}/storage")
+        # la primera corrida llena el caché de bytecode de Jinja, como el primer worker
+        run_once(env)
+        samples = [run_once(env) for _ in range(args.runs)]
+
+    report = summarize(samples)
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        report["vs_baseline"] = {
+            key: round(report[key]["median"] - baseline[key]["median"], 4)
+            for key in ("import_s", "templates_s", "rss_mb")
+        }
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()